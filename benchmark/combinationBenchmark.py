@@ -0,0 +1,613 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Timings of the combination rules and their alternative backends.
+# Run with: python -m benchmark.combinationBenchmark [case ...]
+
+import argparse
+import random
+import time
+from itertools import combinations
+
+
+def random_masses(rng, frame, number_of_focal_elements):
+    # Random mass function over random non-empty subsets of the frame, always including the full frame
+    focal_elements = {tuple(frame)}
+    while len(focal_elements) < number_of_focal_elements:
+        subset = tuple(sorted(x for x in frame if rng.random() < 0.5))
+        if subset:
+            focal_elements.add(subset)
+    masses = [rng.random() for _ in focal_elements]
+    total = sum(masses)
+    return {focal: mass / total for focal, mass in zip(sorted(focal_elements), masses)}
+
+
+def random_evidence(seed, number_of_evidences, frame_size, number_of_focal_elements):
+    rng = random.Random(seed)
+    frame = ["h{}".format(counter) for counter in range(0, frame_size)]
+    evidence = {}
+    for counter in range(0, number_of_evidences):
+        evidence[counter] = random_masses(rng, frame, number_of_focal_elements)
+    return evidence
+
+
+def time_call(function, repeat=3):
+    best = None
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def zhang_window():
+    # Times the credibility weighted average only - the self-combination that follows is the same for both
+    from functools import reduce
+    from combinationRules import zhangCombination
+    from combinationRules.utilities import import_numpy, the_keys
+    numpy = import_numpy()
+    results = []
+    for window in (100, 500, 2000):
+        all_data = zhangCombination.multi_combination(random_evidence(window, window, 6, 8), lazy=True)
+        thetas = list(reduce(lambda a, b: a | set(the_keys(b.keys())), all_data["evidence"].values(), set()))
+        powerset = [tuple(sorted([x for j, x in enumerate(thetas) if (i >> j) & 1]))
+                    for i in range(1, 2 ** len(thetas))]
+        vectors = zhangCombination.pignistic_vectors(all_data["evidence"], thetas, powerset)
+        multiplicity = dict.fromkeys(all_data["evidence"].keys(), 1.0)
+        elapsed = time_call(lambda: zhangCombination.weighted_average(all_data, vectors, multiplicity, powerset))
+        results.append(("zhang credibility window {}".format(window), "python", elapsed))
+        if numpy is not None:
+            elapsed = time_call(lambda: zhangCombination.numpy_weighted_average(numpy, all_data, vectors,
+                                                                                multiplicity, powerset))
+            results.append(("zhang credibility window {}".format(window), "numpy", elapsed))
+    return results
+
+
+def pcr6_sources():
+    # Exact enumeration is exponential in the number of sources, the quadrature form is polynomial
+    from combinationRules.pcr6Combination import pcr6
+    results = []
+    for number_of_sources in (2, 4, 6, 8, 12, 20):
+        sources = list(random_evidence(number_of_sources, number_of_sources, 5, 6).values())
+        results.append(("pcr6 {} sources".format(number_of_sources), "quadrature",
+                        time_call(lambda: pcr6(sources, exact_enumeration_limit=0))))
+        if number_of_sources <= 8:
+            results.append(("pcr6 {} sources".format(number_of_sources), "enumeration",
+                            time_call(lambda: pcr6(sources, exact_enumeration_limit=None), repeat=1)))
+    return results
+
+
+def engine_selection():
+    # Predicted and measured time of each Dempster-Shafer engine, and the engine the cost model picks
+    from combinationRules import dsCombination, engineSelection
+    results = []
+    for sources, frame_size, focal, closed in ((2, 4, 4, False), (8, 6, 12, False), (32, 10, 40, False),
+                                               (6, 5, 0, True), (6, 8, 0, True)):
+        evidence = engineSelection.calibration_inputs(sources, sources, frame_size, focal, closed)
+        inputs = dsCombination.combination_inputs(evidence)
+        chosen, reason, predicted = engineSelection.select_engine(inputs)
+        name = "ds {} sources frame {} {}".format(sources, frame_size, "closed" if closed else "{} focal".format(focal))
+        for engine in ("pairwise", "bitmask", "transform"):
+            if engine == "transform" and not engineSelection.transform_eligibility(inputs, frame_size)[0]:
+                continue
+            label = engine + (" *" if engine == chosen else "")
+            results.append((name, label + " predicted", predicted[engine]))
+            results.append((name, label, time_call(lambda: engineSelection.multi_combination(evidence,
+                                                                                              engine=engine))))
+    return results
+
+
+def invertible_window():
+    # Per-update cost of a sliding window: re-fusing the window against dividing out the evicted evidence
+    from combinationRules.dsCombination import bitmask_multi_combination
+    from combinationRules.invertibleWindow import windowed_combination, combined_masses
+    results = []
+    for window in (10, 50, 200):
+        evidence = random_evidence(window, 2 * window, 6, 8)
+
+        def refuse():
+            for counter in range(window, 2 * window):
+                bitmask_multi_combination({key: evidence[key] for key in range(counter - window + 1, counter + 1)})
+
+        def invertible():
+            all_data = windowed_combination("DEMPSTER_SHAFER", {key: evidence[key] for key in range(0, window)},
+                                            window)
+            for counter in range(window, 2 * window):
+                windowed_combination("DEMPSTER_SHAFER", {counter: evidence[counter]}, window, all_data)
+                combined_masses(all_data)
+
+        results.append(("ds window {} per update".format(window), "re-fuse", time_call(refuse, 1) / window))
+        results.append(("ds window {} per update".format(window), "invertible", time_call(invertible, 1) / window))
+    return results
+
+
+def repeated_evidence():
+    # Static sensors: runs of identical reports, stored one by one or coalesced into runs
+    from combinationRules import murphyCombination, zhangCombination
+    results = []
+    distinct = list(random_evidence(1, 10, 5, 6).values())
+    for run_length in (1, 10, 100):
+        reports = [distinct[(counter // run_length) % len(distinct)] for counter in range(0, 1000)]
+
+        def zhang(all_data):
+            for counter, masses in enumerate(reports):
+                all_data = zhangCombination.windowed_multi_combination({counter: masses}, 500, all_data, lazy=True)
+            zhangCombination.final_probabilities(all_data)
+
+        name = "zhang 1000 reports runs of {}".format(run_length)
+        results.append((name, "stored", time_call(lambda: zhang(None), 1)))
+        results.append((name, "coalesced", time_call(lambda: zhang(zhangCombination.coalesced_data()), 1)))
+    # Murphy only squares its self-combination when the focal elements are closed under intersection
+    from combinationRules.engineSelection import calibration_inputs
+    for closed in (False, True):
+        distinct = list(calibration_inputs(2, 10, 6, 8, closed).values())
+        reports = [distinct[(counter // 100) % len(distinct)] for counter in range(0, 1000)]
+        results.append(("murphy 1000 reports runs of 100", "closed keys" if closed else "open keys",
+                        time_call(lambda: murphyCombination.multi_combination(dict(enumerate(reports))))))
+    return results
+
+
+def jit_kernels():
+    # The Python loops against the compiled kernels, after a first call that compiles them
+    from combinationRules import dsCombination, jitKernels, yagerCombination, zhangCombination
+    from combinationRules.utilities import import_numba
+    if import_numba() is None:
+        return []
+    results = []
+    for number_of_focal_elements in (16, 64, 128):
+        first, second = dsCombination.combination_inputs(random_evidence(number_of_focal_elements, 2, 10,
+                                                                         number_of_focal_elements))
+        for rule, module in (("dempster-shafer", dsCombination), ("yager", yagerCombination)):
+            name = "{} {} x {} focal elements".format(rule, number_of_focal_elements, number_of_focal_elements)
+            for variant, use_jit in (("python", False), ("jit", True)):
+                jitKernels.USE_JIT = use_jit
+                module.combination(first, second)
+                results.append((name, variant, time_call(lambda: module.combination(first, second))))
+    # Against the pure Python average: numpy would otherwise be used from NUMPY_MIN_EVIDENCES
+    zhangCombination.USE_NUMPY = False
+    for window in (20, 100, 500):
+        evidence = random_evidence(window, window, 6, 8)
+        name = "zhang credibility window {}".format(window)
+        for variant, use_jit in (("python", False), ("jit", True)):
+            jitKernels.USE_JIT = use_jit
+            zhangCombination.multi_combination(evidence)
+            results.append((name, variant, time_call(lambda: zhangCombination.multi_combination(evidence))))
+    jitKernels.USE_JIT = False
+    zhangCombination.USE_NUMPY = None
+    return results
+
+
+def frame_coarsening():
+    # Evidence on unions of classes, combined on the fine frame or on the frame of classes and refined back
+    from combinationRules import import_and_windowed_combine, import_and_calculate_probabilities
+    from combinationRules.frames import coarsen_evidence, coarsening_from_classes, refine
+    results = []
+    for method, number_of_classes, class_size in (("YAGER", 10, 20), ("MURPHY", 10, 20),
+                                                  ("ZHANG", 4, 3)):
+        classes = {}
+        for counter in range(0, number_of_classes):
+            classes["h{}".format(counter)] = ["h{}_{}".format(counter, element) for element in range(0, class_size)]
+        coarsening = coarsening_from_classes(classes)
+        evidence = {}
+        for evidence_key, masses in random_evidence(number_of_classes, 6, number_of_classes, 8).items():
+            evidence[evidence_key] = refine(masses, coarsening)
+
+        def fine():
+            import_and_calculate_probabilities(method, import_and_windowed_combine(method, evidence))
+
+        def coarse():
+            all_data = import_and_windowed_combine(method, coarsen_evidence(evidence, coarsening))
+            refine(import_and_calculate_probabilities(method, all_data), coarsening)
+
+        # A first call, so that the timings leave out the lazy imports
+        coarse()
+        name = "{} frame {} to {} classes".format(method.lower(), number_of_classes * class_size, number_of_classes)
+        results.append((name, "fine", time_call(fine, 1)))
+        results.append((name, "coarse", time_call(coarse)))
+    return results
+
+
+def product_frames():
+    # Marginal evidence on each attribute, combined per attribute or on the flattened joint frame (bitmask Dempster)
+    from itertools import product
+    from combinationRules import productFrames
+    from combinationRules.utilities import to_bitmask
+    results = []
+    for number_of_attributes in (2, 3, 4):
+        attributes = ["a{}".format(counter) for counter in range(0, number_of_attributes)]
+        frame = ["h{}".format(counter) for counter in range(0, 5)]
+        evidence = {}
+        for counter in range(0, 4 * number_of_attributes):
+            masses = random_evidence(counter, 1, 5, 4)[0]
+            evidence[counter] = {attributes[counter % number_of_attributes]: masses}
+        joint_frame = list(product(*([frame] * number_of_attributes)))
+        joint_index = dict((hypothesis, position) for position, hypothesis in enumerate(joint_frame))
+        flattened = []
+        for source in evidence.values():
+            attribute, masses = list(source.items())[0]
+            components = [tuple(frame)] * number_of_attributes
+            joint_masses = {}
+            for key, mass in masses.items():
+                components[attributes.index(attribute)] = key
+                joint_masses[productFrames.flatten(tuple(components))] = mass
+            flattened.append(to_bitmask(joint_masses, joint_index))
+
+        def flat():
+            combined = flattened[0]
+            for masses in flattened[1:]:
+                combined = productFrames.dempster(combined, masses)
+
+        name = "{} attributes of 5 values".format(number_of_attributes)
+        results.append((name, "flattened", time_call(flat, 1)))
+        results.append((name, "factorized", time_call(
+            lambda: productFrames.final_probabilities(productFrames.multi_combination(evidence,
+                                                                                      attributes=attributes)))))
+    return results
+
+
+def top_k_decision():
+    # Most likely hypotheses of a large frame: every score, or the top k with pruning
+    from combinationRules import import_and_calculate_probabilities
+    from combinationRules.decision import hypothesis_scores, top_k
+    rng = random.Random(0)
+    results = []
+    for frame_size in (50, 200):
+        frame = ["h{}".format(counter) for counter in range(0, frame_size)]
+        masses = {}
+        for _ in range(0, 3000):
+            size = rng.choice([1, 2, 3, 10, frame_size // 4, frame_size])
+            key = tuple(sorted(rng.sample(frame, size)))
+            masses[key] = masses.get(key, 0.0) + rng.random() ** 3
+        total = sum(masses.values())
+        masses = {key: mass / total for key, mass in masses.items()}
+        name = "pignistic frame of {}".format(frame_size)
+
+        def full():
+            hypothesis_scores(import_and_calculate_probabilities("DEMPSTER_SHAFER", dict(masses)))
+
+        results.append((name, "all scores", time_call(full)))
+        for k in (1, 3):
+            results.append((name, "top {}".format(k), time_call(lambda: top_k(masses, k))))
+    return results
+
+
+def update_buffer():
+    # Bursts of reports on one track, combined per report or queued and combined once per burst
+    from combinationRules import import_and_windowed_combine
+    from combinationRules.updateBuffer import UpdateBuffer
+    results = []
+    for method in ("MURPHY", "ZHANG"):
+        for burst in (10, 50):
+            reports = list(random_evidence(burst, burst * 10, 5, 8).values())
+
+            def per_report():
+                all_data = None
+                for masses in reports:
+                    all_data = import_and_windowed_combine(method, {0: masses}, 200, all_data)
+
+            def buffered():
+                # Read once per burst
+                buffer = UpdateBuffer(method, 200, max_pending=burst, max_delay=None)
+                for counter, masses in enumerate(reports):
+                    buffer.add("track", {0: masses})
+                    if (counter + 1) % burst == 0:
+                        buffer.probabilities("track")
+
+            # A first call, so that the timings leave out the lazy imports
+            buffered()
+            name = "{} {} reports bursts of {}".format(method.lower(), len(reports), burst)
+            results.append((name, "per report", time_call(per_report, 1)))
+            results.append((name, "buffered", time_call(buffered, 1)))
+    return results
+
+
+def disjunctive_rules():
+    # Disjunctive combination of many sources with more focal elements than frame elements: pairwise unions or the
+    #  product of implicabilities
+    from combinationRules import disjunctiveCombination, duboisPradeCombination
+    results = []
+    for number_of_evidences, frame_size, number_of_focal_elements in ((10, 8, 60), (10, 10, 100)):
+        evidence = random_evidence(1, number_of_evidences, frame_size, number_of_focal_elements)
+        name = "{} sources {} focal elements frame {}".format(number_of_evidences, number_of_focal_elements,
+                                                              frame_size)
+        for variant, max_frame in (("pairwise", 0), ("transform", disjunctiveCombination.TRANSFORM_MAX_FRAME)):
+            disjunctiveCombination.TRANSFORM_MAX_FRAME = max_frame
+            results.append((name, "disjunctive " + variant,
+                            time_call(lambda: disjunctiveCombination.multi_combination(evidence))))
+            disjunctiveCombination.TRANSFORM_MAX_FRAME = 16
+        results.append((name, "dubois-prade", time_call(lambda: duboisPradeCombination.multi_combination(evidence))))
+    return results
+
+
+def tick_scheduler():
+    # One period of reports on many tracks: combined per report as they arrive, or fused once per track by a tick
+    from combinationRules import import_and_windowed_combine
+    from combinationRules.tickScheduler import TickScheduler
+    results = []
+    for method in ("MURPHY", "ZHANG"):
+        for number_of_tracks, reports_per_track in ((200, 5), (1000, 5)):
+            reports = list(random_evidence(number_of_tracks, number_of_tracks * reports_per_track, 5, 6).values())
+
+            def per_report():
+                states = {}
+                for counter, masses in enumerate(reports):
+                    track_id = counter % number_of_tracks
+                    states[track_id] = import_and_windowed_combine(method, {0: masses}, 20, states.get(track_id))
+
+            def per_tick():
+                scheduler = TickScheduler(method, 20, deadline=60.0)
+                for counter, masses in enumerate(reports):
+                    scheduler.add(counter % number_of_tracks, {0: masses})
+                scheduler.tick()
+                for track_id in range(0, number_of_tracks):
+                    scheduler.probabilities(track_id)
+
+            # A first call, so that the timings leave out the lazy imports
+            per_tick()
+            name = "{} {} tracks {} reports per period".format(method.lower(), number_of_tracks, reports_per_track)
+            results.append((name, "per report", time_call(per_report, 1)))
+            results.append((name, "tick", time_call(per_tick, 1)))
+    return results
+
+
+def change_notifications():
+    # Consumers sent the probabilities of every track on every update, or the deltas of tracks that moved.  Each track
+    #  gets noisy reports around its own masses.
+    import json
+    from combinationRules.changeNotifier import ChangeNotifier
+    from combinationRules.fusionStore import FusionStore
+    rng = random.Random(2)
+    number_of_tracks = 100
+    bases = random_evidence(2, number_of_tracks, 5, 4)
+    reports = []
+    for counter in range(0, 5000):
+        masses = dict((key, mass * rng.uniform(0.8, 1.2)) for key, mass in bases[counter % number_of_tracks].items())
+        total = sum(masses.values())
+        reports.append(dict((key, mass / total) for key, mass in masses.items()))
+    results = []
+    for distance, threshold in (("max_abs", 0.01), ("jousselme", 0.01)):
+        sent = []
+
+        def every_update():
+            store = FusionStore("MURPHY", 10)
+            for counter, masses in enumerate(reports):
+                probabilities = store.update(counter % number_of_tracks, {0: masses})
+                sent.append(json.dumps([counter % number_of_tracks,
+                                        [[list(key), value] for key, value in probabilities.items()]]))
+
+        def on_change():
+            notifier = ChangeNotifier(threshold, distance)
+            notifier.subscribe(lambda track_id, delta, change: sent.append(
+                json.dumps([track_id, [[list(key), value] for key, value in delta.items()]])))
+            store = FusionStore("MURPHY", 10, notifier=notifier)
+            for counter, masses in enumerate(reports):
+                store.update(counter % number_of_tracks, {0: masses})
+
+        name = "murphy {} tracks {} updates {} {}".format(number_of_tracks, len(reports), distance, threshold)
+        every_seconds = time_call(every_update, 1)
+        every_bytes = sum(len(message) for message in sent)
+        del sent[:]
+        change_seconds = time_call(on_change, 1)
+        results.append((name, "every update", every_seconds))
+        results.append((name, "on change {:.0%} of bytes".format(sum(len(message) for message in sent) /
+                                                                 float(every_bytes)), change_seconds))
+    return results
+
+
+def leave_one_out():
+    # Every source left out in turn: recombining the others each time, or leave_one_out
+    from combinationRules import import_and_windowed_combine, import_and_calculate_probabilities
+    from combinationRules import sensitivity
+    results = []
+    for method in ("DEMPSTER_SHAFER", "MURPHY", "ZHANG", "DISJUNCTIVE"):
+        for number_of_evidences in (20, 60):
+            evidence = random_evidence(number_of_evidences, number_of_evidences, 4, 6)
+            if method == "DEMPSTER_SHAFER":
+                # The same focal elements in every source, every subset of the frame
+                frame = ["h{}".format(counter) for counter in range(0, 4)]
+                for masses in evidence.values():
+                    for size in range(1, len(frame) + 1):
+                        for key in combinations(frame, size):
+                            masses.setdefault(key, 0.0)
+
+            def recombined():
+                for evidence_key in evidence.keys():
+                    remaining = dict((key, masses) for key, masses in evidence.items() if key != evidence_key)
+                    import_and_calculate_probabilities(method, import_and_windowed_combine(method, remaining))
+
+            # A first call, so that the timings leave out the lazy imports
+            import_and_windowed_combine(method, evidence)
+            name = "{} {} sources".format(method.lower(), number_of_evidences)
+            results.append((name, "recombined", time_call(recombined, 1)))
+            results.append((name, "leave_one_out", time_call(lambda: sensitivity.leave_one_out(method, evidence))))
+    return results
+
+
+def float32_precision():
+    # Batched multi-track state stored as float64 or float32: memory in the variant, time to ingest and read
+    from combinationRules import import_and_calculate_probabilities
+    from combinationRules.columnar import ingest_matrix
+    from combinationRules.sharedState import SharedProbabilityArena
+    from combinationRules.utilities import state_nbytes
+    results = []
+    number_of_tracks = 1000
+    frame = ["h{}".format(counter) for counter in range(0, 6)]
+    focal_elements = [key for size in range(1, 7) for key in combinations(frame, size)]
+    rng = random.Random(4)
+    rows = []
+    for _ in range(0, number_of_tracks * 10):
+        row = [rng.random() for _ in focal_elements]
+        rows.append([mass / sum(row) for mass in row])
+    track_ids = [counter % number_of_tracks for counter in range(0, len(rows))]
+    # A first call, so that the timings leave out the lazy imports
+    import_and_calculate_probabilities("ZHANG", ingest_matrix("ZHANG", [0] * 20, rows[:20], focal_elements)[0])
+    for typecode in ("d", "f"):
+        states = {}
+
+        def ingest():
+            states.update(ingest_matrix("ZHANG", track_ids, rows, focal_elements, max_number_of_evidences=20,
+                                        lazy=True, typecode=typecode))
+            for all_data in states.values():
+                import_and_calculate_probabilities("ZHANG", all_data)
+
+        elapsed = time_call(ingest, 1)
+        nbytes = sum(state_nbytes(all_data) for all_data in states.values())
+        evidence_nbytes = sum(state_nbytes(all_data["evidence"]) for all_data in states.values())
+        results.append(("zhang {} tracks 10 reports of {} masses".format(number_of_tracks, len(focal_elements)),
+                        "{} state {:.1f} MB evidence {:.1f} MB".format(typecode, nbytes / 1e6,
+                                                                       evidence_nbytes / 1e6), elapsed))
+    probabilities = import_and_calculate_probabilities("ZHANG", states[0])
+    for typecode in ("d", "f"):
+        with SharedProbabilityArena(list(probabilities.keys()), capacity=number_of_tracks * 5,
+                                    typecode=typecode) as arena:
+
+            def publish():
+                for track_id in range(0, number_of_tracks * 5):
+                    arena.write(track_id, probabilities)
+                for track_id in range(0, number_of_tracks * 5):
+                    arena.read_row(track_id)
+
+            results.append(("shared arena {} tracks write and read".format(number_of_tracks * 5),
+                            "{} {:.1f} MB".format(typecode, arena.nbytes / 1e6), time_call(publish)))
+    return results
+
+
+def track_manager():
+    # A long mission of short-lived Zhang tracks: unbounded dict against idle compaction and eviction, and a budget
+    from combinationRules import import_and_windowed_combine
+    from combinationRules.trackManager import TrackManager
+    from combinationRules.utilities import state_nbytes
+    results = []
+    number_of_tracks = 1000
+    reports_per_track = 20
+    live_tracks = 20
+    rng = random.Random(5)
+    stream = []
+    for track_id in range(0, number_of_tracks):
+        for _ in range(0, reports_per_track):
+            first = rng.random()
+            second = rng.random() * (1.0 - first)
+            # Tracks live for a while: each report goes to one of the live_tracks newest tracks at that point
+            stream.append((max(track_id - rng.randrange(0, live_tracks), 0),
+                           {("a",): first, ("b",): second, ("a", "b"): 1.0 - first - second}))
+    stream.sort(key=lambda report: report[0])
+    clock = [0.0]
+    states = {}
+    # A first call, so that the timings leave out the lazy imports
+    import_and_windowed_combine("ZHANG", dict(enumerate(masses for _, masses in stream[:40])))
+
+    def unbounded():
+        for track_id, masses in stream:
+            states[track_id] = import_and_windowed_combine("ZHANG", {0: masses}, None, states.get(track_id))
+
+    elapsed = time_call(unbounded, 1)
+    nbytes = sum(state_nbytes(all_data) for all_data in states.values())
+    results.append(("zhang {} tracks x {} reports".format(number_of_tracks, reports_per_track),
+                    "dict {} tracks {:.1f} MB".format(len(states), nbytes / 1e6), elapsed))
+    for name, options in (("accounting only", {}),
+                          ("compact after idle", {"compact_after": 40.0}),
+                          ("compact + ttl", {"compact_after": 40.0, "ttl": 400.0}),
+                          ("budget 1 MB", {"memory_budget": 1000000})):
+        manager = TrackManager("ZHANG", clock=lambda: clock[0], **options)
+
+        def managed():
+            for position, (track_id, masses) in enumerate(stream):
+                # One report per simulated second
+                clock[0] = float(position)
+                manager.update(track_id, {0: masses})
+
+        elapsed = time_call(managed, 1)
+        stats = manager.stats()
+        results.append(("zhang {} tracks x {} reports".format(number_of_tracks, reports_per_track),
+                        "{}: {} tracks {:.1f} MB peak {:.1f} MB, {} compactions {} evictions".format(
+                            name, stats["tracks"], stats["resident_bytes"] / 1e6, stats["peak_resident_bytes"] / 1e6,
+                            stats["compactions"], stats["evictions"]), elapsed))
+    return results
+
+
+def sparse_evidence():
+    # Zhang evidence of 1000 reports with a few focal elements each, out of a large frame: dict against compact storage
+    from combinationRules.zhangCombination import multi_combination, compact_data
+    from combinationRules.utilities import state_nbytes
+    results = []
+    frame = ["h{}".format(counter) for counter in range(0, 20)]
+    vocabularies = (("frame 20 pairs", [key for size in (1, 2) for key in combinations(frame, size)]),
+                    ("frame 10 subsets", None))
+    for name, vocabulary in vocabularies:
+        rng = random.Random(5)
+        evidence = {}
+        for counter in range(0, 1000):
+            if vocabulary is None:
+                evidence[counter] = random_masses(rng, frame[:10], 3)
+            else:
+                focal_elements = rng.sample(vocabulary, 3)
+                masses = [rng.random() for _ in focal_elements]
+                evidence[counter] = {focal: mass / sum(masses) for focal, mass in zip(focal_elements, masses)}
+        for storage in ("dict", "compact"):
+            states = []
+
+            def combine():
+                states.append(multi_combination(evidence, compact_data() if storage == "compact" else None,
+                                                lazy=True))
+
+            elapsed = time_call(combine, 1)
+            results.append(("zhang sparse " + name, "{} {:.0f} kB".format(
+                storage, state_nbytes(states[-1]["evidence"]) / 1e3), elapsed))
+    return results
+
+
+CASES = {
+    "change_notifications": change_notifications,
+    "disjunctive_rules": disjunctive_rules,
+    "engine_selection": engine_selection,
+    "float32_precision": float32_precision,
+    "frame_coarsening": frame_coarsening,
+    "invertible_window": invertible_window,
+    "jit_kernels": jit_kernels,
+    "leave_one_out": leave_one_out,
+    "pcr6_sources": pcr6_sources,
+    "product_frames": product_frames,
+    "repeated_evidence": repeated_evidence,
+    "sparse_evidence": sparse_evidence,
+    "tick_scheduler": tick_scheduler,
+    "top_k_decision": top_k_decision,
+    "track_manager": track_manager,
+    "update_buffer": update_buffer,
+    "zhang_window": zhang_window,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Combination rule benchmarks")
+    parser.add_argument("cases", nargs="*", help="any of " + ", ".join(sorted(CASES)))
+    args = parser.parse_args(argv)
+    for case in args.cases:
+        if case not in CASES:
+            parser.error("unknown case " + case)
+    if not args.cases:
+        args.cases = sorted(CASES)
+    print("{:<40} {:<16} {:>12}".format("case", "variant", "seconds"))
+    for case in args.cases:
+        for name, variant, elapsed in CASES[case]():
+            print("{:<40} {:<16} {:>12.6f}".format(name, variant, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Compares multi-threaded ingestion through one global lock against the striped FusionStore.
+# Run with: python -m benchmark.contentionBenchmark
+
+import argparse
+import random
+import sys
+import time
+from threading import Lock, Thread
+
+from combinationRules import COMBINATION_METHODS, import_and_windowed_combine, import_and_calculate_probabilities
+from combinationRules.fusionStore import FusionStore
+
+
+def random_evidence(rng):
+    masses = [rng.random() for _ in range(0, 4)]
+    total = sum(masses)
+    return {
+        "a": masses[0] / total,
+        "b": masses[1] / total,
+        "c": masses[2] / total,
+        ("a", "b", "c"): masses[3] / total
+    }
+
+
+class GlobalLockStore(object):
+    # The pattern FusionStore replaces: every call wrapped in a single lock
+    def __init__(self, method, max_number_of_evidences=None):
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.lock = Lock()
+        self.tracks = {}
+
+    def update(self, track_id, evidence, input_weight=0.0):
+        with self.lock:
+            all_data = import_and_windowed_combine(self.method, evidence, self.max_number_of_evidences,
+                                                   self.tracks.get(track_id), input_weight)
+            self.tracks[track_id] = all_data
+            return dict(import_and_calculate_probabilities(self.method, all_data))
+
+
+def run_threads(store, number_of_threads, number_of_tracks, updates_per_thread):
+    def worker(seed):
+        rng = random.Random(seed)
+        for counter in range(0, updates_per_thread):
+            store.update(rng.randrange(number_of_tracks), {counter: random_evidence(rng)})
+
+    threads = [Thread(target=worker, args=(seed,)) for seed in range(0, number_of_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-threaded ingestion contention benchmark")
+    parser.add_argument("--method", default=COMBINATION_METHODS["MURPHY"], choices=sorted(COMBINATION_METHODS))
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--tracks", type=int, default=1000)
+    parser.add_argument("--updates", type=int, default=2000, help="updates per thread")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args(argv)
+
+    gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print("Method {}, window {}, {} tracks, GIL {}".format(args.method, args.window, args.tracks,
+                                                          "enabled" if gil_enabled else "disabled"))
+    print("{:>8} {:>16} {:>16}".format("threads", "global lock/s", "FusionStore/s"))
+    for number_of_threads in args.threads:
+        total_updates = number_of_threads * args.updates
+        global_time = run_threads(GlobalLockStore(args.method, args.window), number_of_threads, args.tracks,
+                                  args.updates)
+        striped_time = run_threads(FusionStore(args.method, args.window), number_of_threads, args.tracks,
+                                   args.updates)
+        print("{:>8} {:>16.0f} {:>16.0f}".format(number_of_threads, total_updates / global_time,
+                                                  total_updates / striped_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -30,16 +30,21 @@ COMBINATION_METHODS = {
     "MURPHY": "MURPHY",
     "YAGER": "YAGER",
     "ZHANG": "ZHANG",
+    "PCR6": "PCR6",
+    "DISJUNCTIVE": "DISJUNCTIVE",
+    "DUBOIS_PRADE": "DUBOIS_PRADE",
     "OVERWRITE": "OVERWRITE"  # No combination, just overwrite the data
 }
 
 
-def import_and_calculate_probabilities(method, all_data):
+def import_and_calculate_probabilities(method, all_data, clamp=True):
     """
     Imports the correct method and returns the probabilities (may be the same or different than all_data
     depending on the method)
     :param method: str: the method in COMBINATION_METHODS
     :param all_data: dict: the internal data of the method
+    :param clamp: boolean whether to clamp the probabilities to [0, 1] in place.  Without clamping, the result may
+     be the internal dictionary of the method and must not be changed.
     :return: the probabilities for that data
     """
     if method == COMBINATION_METHODS["DEMPSTER_SHAFER"]:
@@ -54,6 +59,15 @@ def import_and_calculate_probabilities(method, all_data):
     elif method == COMBINATION_METHODS["ZHANG"]:
         from combinationRules.zhangCombination import final_probabilities
         probabilities = final_probabilities(all_data)
+    elif method == COMBINATION_METHODS["PCR6"]:
+        from combinationRules.pcr6Combination import final_probabilities
+        probabilities = final_probabilities(all_data)
+    elif method == COMBINATION_METHODS["DISJUNCTIVE"]:
+        from combinationRules.disjunctiveCombination import final_probabilities
+        probabilities = final_probabilities(all_data)
+    elif method == COMBINATION_METHODS["DUBOIS_PRADE"]:
+        from combinationRules.duboisPradeCombination import final_probabilities
+        probabilities = final_probabilities(all_data)
     elif method == COMBINATION_METHODS["OVERWRITE"]:
         from combinationRules.overwrite import final_probabilities
         probabilities = final_probabilities(all_data)
@@ -62,7 +76,7 @@ def import_and_calculate_probabilities(method, all_data):
     else:
         raise ValueError("import_and_combine: unknown method type " + method)
 
-    if probabilities is not None:
+    if clamp and (probabilities is not None):
         for marginal_key, marginal_value in probabilities.items():
             # Rounding can cause issues
             probabilities[marginal_key] = min(max(marginal_value, 0.0), 1.0)
@@ -92,6 +106,15 @@ def import_and_combine_datasets(method, all_data_1, all_data_2, max_number_of_ev
     elif method == COMBINATION_METHODS["ZHANG"]:
         from combinationRules.zhangCombination import dataset_combination
         return dataset_combination(deepcopy(all_data_1), deepcopy(all_data_2), max_number_of_evidences)
+    elif method == COMBINATION_METHODS["PCR6"]:
+        from combinationRules.pcr6Combination import dataset_combination
+        return dataset_combination(deepcopy(all_data_1), deepcopy(all_data_2), max_number_of_evidences)
+    elif method == COMBINATION_METHODS["DISJUNCTIVE"]:
+        from combinationRules.disjunctiveCombination import dataset_combination
+        return dataset_combination(deepcopy(all_data_1), deepcopy(all_data_2), max_number_of_evidences)
+    elif method == COMBINATION_METHODS["DUBOIS_PRADE"]:
+        from combinationRules.duboisPradeCombination import dataset_combination
+        return dataset_combination(deepcopy(all_data_1), deepcopy(all_data_2), max_number_of_evidences)
     elif method == COMBINATION_METHODS["OVERWRITE"]:
         from combinationRules.overwrite import dataset_combination
         return dataset_combination(deepcopy(all_data_1), deepcopy(all_data_2), max_number_of_evidences)
@@ -101,7 +124,8 @@ def import_and_combine_datasets(method, all_data_1, all_data_2, max_number_of_ev
         raise ValueError("import_and_combine: unknown method type " + method)
 
 
-def import_and_combine(method, evidence, all_data=None, input_weight=0.0, use_all_data_weight=True):
+def import_and_combine(method, evidence, all_data=None, input_weight=0.0, use_all_data_weight=True, lazy=False,
+                       engine="auto", seed=None):
     """
     Imports the correct method, combines the data, and returns the result
     :param method: dict: The method in COMBINATION_METHODS
@@ -109,6 +133,12 @@ def import_and_combine(method, evidence, all_data=None, input_weight=0.0, use_al
     :param all_data: dict: previous data
     :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
     :param use_all_data_weight: boolean whether to use the stored all_data weight or consider that to be 1.0
+    :param lazy: boolean whether methods that keep evidence should defer combining until the probabilities are
+     calculated
+    :param engine: str: how DEMPSTER_SHAFER is computed, one of engineSelection.ENGINES or "auto" to choose an exact
+     engine from the cost model (the choice is logged at DEBUG level by combinationRules.engineSelection); the
+     "approximate" engine is only used when asked for
+    :param seed: the random seed of the approximate engine, None for a different estimate on each call
     :return: dict: the resulting data
     """
     weights = None
@@ -119,16 +149,25 @@ def import_and_combine(method, evidence, all_data=None, input_weight=0.0, use_al
     # Individual methods determine how to handle weights
 
     if method == COMBINATION_METHODS["DEMPSTER_SHAFER"]:
-        from combinationRules.dsCombination import multi_combination
-        return multi_combination(evidence, all_data, weights=weights)
+        from combinationRules.engineSelection import multi_combination
+        return multi_combination(evidence, all_data, weights=weights, engine=engine, seed=seed)
     elif method == COMBINATION_METHODS["MURPHY"]:
         from combinationRules.murphyCombination import multi_combination
-        return multi_combination(evidence, all_data, weights=weights)
+        return multi_combination(evidence, all_data, weights=weights, lazy=lazy)
     elif method == COMBINATION_METHODS["YAGER"]:
         from combinationRules.yagerCombination import multi_combination
         return multi_combination(evidence, all_data, weights=weights)
     elif method == COMBINATION_METHODS["ZHANG"]:
         from combinationRules.zhangCombination import multi_combination
+        return multi_combination(evidence, all_data, weights=weights, lazy=lazy)
+    elif method == COMBINATION_METHODS["PCR6"]:
+        from combinationRules.pcr6Combination import multi_combination
+        return multi_combination(evidence, all_data, weights=weights)
+    elif method == COMBINATION_METHODS["DISJUNCTIVE"]:
+        from combinationRules.disjunctiveCombination import multi_combination
+        return multi_combination(evidence, all_data, weights=weights)
+    elif method == COMBINATION_METHODS["DUBOIS_PRADE"]:
+        from combinationRules.duboisPradeCombination import multi_combination
         return multi_combination(evidence, all_data, weights=weights)
     elif method == COMBINATION_METHODS["OVERWRITE"]:
         from combinationRules.overwrite import multi_combination
@@ -140,7 +179,7 @@ def import_and_combine(method, evidence, all_data=None, input_weight=0.0, use_al
 
 
 def import_and_windowed_combine(method, evidence, max_number_of_evidences=None, all_data=None, input_weight=0.0,
-                                use_all_data_weight=True):
+                                use_all_data_weight=True, lazy=False, weights=None, invertible=False):
     """
     Imports the correct method, combines the data, and returns the result.  Windows the data based on the max
      number of evidences
@@ -150,10 +189,14 @@ def import_and_windowed_combine(method, evidence, max_number_of_evidences=None,
     :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
     :param use_all_data_weight: boolean whether to use the stored all_data weight or consider that to be 1.0
     :param max_number_of_evidences: the max number of evidences to window
+    :param lazy: boolean whether methods that keep evidence should defer combining until the probabilities are
+     calculated
+    :param weights: dict of weights per evidence key, used instead of input_weight when given
+    :param invertible: boolean whether DEMPSTER_SHAFER and YAGER keep the window in an invertible form so the oldest
+     evidence is removed (see invertibleWindow)
     :return: dict: the resulting data
     """
-    weights = None
-    if input_weight > ZERO_WEIGHT_DELTA:
+    if (weights is None) and (input_weight > ZERO_WEIGHT_DELTA):
         weights = {}
         for evidence_key in evidence.keys():
             weights[evidence_key] = input_weight
@@ -161,15 +204,26 @@ def import_and_windowed_combine(method, evidence, max_number_of_evidences=None,
 
     if method == COMBINATION_METHODS["DEMPSTER_SHAFER"]:
         from combinationRules.dsCombination import windowed_multi_combination
-        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights)
+        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights,
+                                          invertible=invertible)
     elif method == COMBINATION_METHODS["MURPHY"]:
         from combinationRules.murphyCombination import windowed_multi_combination
-        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights)
+        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights, lazy=lazy)
     elif method == COMBINATION_METHODS["YAGER"]:
         from combinationRules.yagerCombination import windowed_multi_combination
-        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights)
+        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights,
+                                          invertible=invertible)
     elif method == COMBINATION_METHODS["ZHANG"]:
         from combinationRules.zhangCombination import windowed_multi_combination
+        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights, lazy=lazy)
+    elif method == COMBINATION_METHODS["PCR6"]:
+        from combinationRules.pcr6Combination import windowed_multi_combination
+        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights)
+    elif method == COMBINATION_METHODS["DISJUNCTIVE"]:
+        from combinationRules.disjunctiveCombination import windowed_multi_combination
+        return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights)
+    elif method == COMBINATION_METHODS["DUBOIS_PRADE"]:
+        from combinationRules.duboisPradeCombination import windowed_multi_combination
         return windowed_multi_combination(evidence, max_number_of_evidences, all_data, weights=weights)
     elif method == COMBINATION_METHODS["OVERWRITE"]:
         from combinationRules.overwrite import windowed_multi_combination
@@ -178,3 +232,63 @@ def import_and_windowed_combine(method, evidence, max_number_of_evidences=None,
         raise ValueError("import_and_combine: None type method - cannot combine")
     else:
         raise ValueError("import_and_combine: unknown method type " + method)
+
+
+def import_and_decayed_combine(method, evidence, decay_rate, all_data=None, input_weight=0.0, timestamp=None,
+                               lazy=False):
+    """
+    Imports the correct method, combines the data with exponential forgetting of old evidence, and returns the result.
+     Only methods that retain evidence support decay.
+    :param method: dict: The method in COMBINATION_METHODS
+    :param evidence: dict: the new evidence
+    :param decay_rate: float in (0, 1]: factor applied to old evidence per new evidence, or per unit of time
+    :param all_data: dict: previous data
+    :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+    :param timestamp: None for count-based decay, else the time of the new evidence for time-based decay
+    :param lazy: boolean whether to defer combining until the probabilities are calculated
+    :return: dict: the resulting data
+    """
+    weights = None
+    if input_weight > ZERO_WEIGHT_DELTA:
+        weights = {}
+        for evidence_key in evidence.keys():
+            weights[evidence_key] = input_weight
+    # Individual methods determine how to handle weights
+
+    if method == COMBINATION_METHODS["MURPHY"]:
+        from combinationRules.murphyCombination import decayed_multi_combination
+        return decayed_multi_combination(evidence, decay_rate, all_data, weights=weights, timestamp=timestamp,
+                                         lazy=lazy)
+    elif method == COMBINATION_METHODS["ZHANG"]:
+        from combinationRules.zhangCombination import decayed_multi_combination
+        return decayed_multi_combination(evidence, decay_rate, all_data, weights=weights, timestamp=timestamp,
+                                         lazy=lazy)
+    elif method is None:
+        raise ValueError("import_and_decayed_combine: None type method - cannot combine")
+    elif method in COMBINATION_METHODS:
+        raise ValueError("import_and_decayed_combine: method " + method + " does not support decay")
+    else:
+        raise ValueError("import_and_decayed_combine: unknown method type " + method)
+
+
+def import_and_summarize(method, all_data):
+    """
+    Imports the correct method and collapses the history kept in the data into a summary with the same probabilities.
+     Only Murphy and Zhang have a summary; the data of the pairwise methods already is the combined result, and PCR6
+     needs every source to combine the next one, so their data is returned as is.
+    :param method: str: the method in COMBINATION_METHODS
+    :param all_data: dict: the internal data of the method
+    :return: dict: the summarized data, which may be all_data changed in place
+    """
+    if method == COMBINATION_METHODS["MURPHY"]:
+        from combinationRules.murphyCombination import summary_data
+        return summary_data(all_data)
+    elif method == COMBINATION_METHODS["ZHANG"]:
+        from combinationRules.zhangCombination import summary_data
+        return summary_data(all_data)
+    elif method is None:
+        raise ValueError("import_and_summarize: None type method - cannot summarize")
+    elif method in COMBINATION_METHODS:
+        return all_data
+    else:
+        raise ValueError("import_and_summarize: unknown method type " + method)
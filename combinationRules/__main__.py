@@ -0,0 +1,320 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Bulk fusion of recorded evidence logs:
+#  python -m combinationRules evidence.jsonl --method MURPHY --window 10 --output fused.jsonl
+# JSONL input has one report per line, e.g. {"track": 7, "evidence": {"a": 0.6, "a|b": 0.4}, "weight": 1.0}
+# CSV input has one report per row, with a track column, an optional weight column and one column per focal
+#  element (named like "a" or "a|b"); empty cells are skipped.
+# Output is one JSON line per track with its final probabilities, using the same focal element names.  It is written
+#  once the whole input has been read, since any later report can change the probabilities of a track.
+# With --processes, a worker that fails sends its traceback to the main process, which stops the other workers and
+#  exits with status 1.
+
+import argparse
+import csv
+import json
+import queue
+import sys
+import time
+import traceback
+import zlib
+from multiprocessing import Process, Queue
+
+from combinationRules import COMBINATION_METHODS, import_and_calculate_probabilities
+from combinationRules.updateBuffer import combine_reports
+
+DEFAULT_CHUNK_SIZE = 10000
+# Seconds between checks of the workers while waiting on their queues
+POLL_INTERVAL = 0.1
+
+
+class WorkerFailed(Exception):
+    """
+    A worker process raised an exception or died
+    """
+    pass
+
+
+def parse_focal_element(name, separator):
+    """
+    :param name: str: focal element name from the input, e.g. "a" or "a|b"
+    :param separator: str: separator between the elements of a composite focal element
+    :return: the key used by the combination methods
+    """
+    if separator in name:
+        return tuple(sorted(name.split(separator)))
+    return name
+
+
+def format_focal_element(key, separator):
+    if isinstance(key, tuple):
+        return separator.join(str(element) for element in key)
+    return str(key)
+
+
+def read_jsonl(stream, track_field, evidence_field, weight_field, separator):
+    """
+    :return: generator of (track id, masses, weight or None) per report
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        masses = {}
+        for name, mass in record[evidence_field].items():
+            masses[parse_focal_element(name, separator)] = float(mass)
+        yield record[track_field], masses, record.get(weight_field)
+
+
+def read_csv(stream, track_field, weight_field, separator):
+    """
+    :return: generator of (track id, masses, weight or None) per report
+    """
+    reader = csv.reader(stream)
+    header = next(reader)
+    track_column = header.index(track_field)
+    weight_column = header.index(weight_field) if weight_field in header else None
+    focal_columns = []
+    for column, name in enumerate(header):
+        if (column != track_column) and (column != weight_column):
+            focal_columns.append((column, parse_focal_element(name, separator)))
+    for row in reader:
+        if not row:
+            continue
+        masses = {}
+        for column, focal_element in focal_columns:
+            if row[column] != "":
+                masses[focal_element] = float(row[column])
+        weight = None
+        if (weight_column is not None) and (row[weight_column] != ""):
+            weight = float(row[weight_column])
+        yield row[track_column], masses, weight
+
+
+def read_chunks(records, chunk_size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class TrackFuser(object):
+    """
+    Holds the internal data of every track and fuses chunks of reports into it.  The reports of a track within a
+     chunk go through updateBuffer.combine_reports, which only batches them for the methods where that matches one
+     call per report, so the results do not depend on the window or the chunk size.
+    """
+    def __init__(self, method, max_number_of_evidences=None):
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.tracks = {}
+
+    def fuse_chunk(self, chunk):
+        grouped = {}
+        for track_id, masses, weight in chunk:
+            # No weight is no weighting
+            grouped.setdefault(track_id, []).append((masses, 0.0 if weight is None else weight))
+        for track_id, reports in grouped.items():
+            self.tracks[track_id] = combine_reports(self.method, reports, self.tracks.get(track_id),
+                                                    self.max_number_of_evidences)
+
+    def results(self):
+        """
+        :return: generator of (track id, probabilities) per track
+        """
+        for track_id, all_data in self.tracks.items():
+            yield track_id, import_and_calculate_probabilities(self.method, all_data)
+
+
+def output_line(track_id, probabilities, separator):
+    formatted = {}
+    if probabilities is not None:
+        for key, value in probabilities.items():
+            formatted[format_focal_element(key, separator)] = value
+    return json.dumps({"track": track_id, "probabilities": formatted}) + "\n"
+
+
+def worker(method, max_number_of_evidences, separator, input_queue, output_queue):
+    # Each worker owns the tracks hashed to it, so no state is shared between processes.  It sends lists of output
+    #  lines, then None once done, or the traceback str of an exception before exiting with status 1.
+    try:
+        fuser = TrackFuser(method, max_number_of_evidences)
+        chunk = input_queue.get()
+        while chunk is not None:
+            fuser.fuse_chunk(chunk)
+            chunk = input_queue.get()
+        lines = []
+        for track_id, probabilities in fuser.results():
+            lines.append(output_line(track_id, probabilities, separator))
+            if len(lines) >= DEFAULT_CHUNK_SIZE:
+                output_queue.put(lines)
+                lines = []
+        output_queue.put(lines)
+        output_queue.put(None)
+    except Exception:
+        output_queue.put(traceback.format_exc())
+        sys.exit(1)
+
+
+def check_workers(workers, output_queue):
+    """
+    Raises WorkerFailed if a worker exited with an error, with the traceback it sent if there is one
+    """
+    exit_codes = [process.exitcode for process in workers if process.exitcode]
+    if not exit_codes:
+        return
+    message = "worker exited with status {}\n".format(exit_codes[0])
+    try:
+        while True:
+            item = output_queue.get(timeout=POLL_INTERVAL)
+            if isinstance(item, str):
+                message = item
+                break
+    except queue.Empty:
+        pass
+    raise WorkerFailed(message)
+
+
+def put_chunk(input_queue, chunk, workers, output_queue):
+    # A worker that failed stops taking chunks, so never wait on a full queue without checking the workers
+    while True:
+        try:
+            input_queue.put(chunk, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            check_workers(workers, output_queue)
+
+
+def fuse_in_workers(records, args, output_stream):
+    """
+    Fuses the records in args.processes worker processes, each owning a partition of the tracks
+    :return: int: the number of records read
+    """
+    number_of_records = 0
+    input_queues = [Queue(maxsize=4) for _ in range(0, args.processes)]
+    output_queue = Queue()
+    workers = [Process(target=worker, args=(args.method, args.window, args.separator, input_queue, output_queue))
+               for input_queue in input_queues]
+    for process in workers:
+        process.start()
+    try:
+        for chunk in read_chunks(records, args.chunk_size):
+            partitions = [[] for _ in range(0, args.processes)]
+            for record in chunk:
+                partitions[track_partition(record[0], args.processes)].append(record)
+            for input_queue, partition in zip(input_queues, partitions):
+                if partition:
+                    put_chunk(input_queue, partition, workers, output_queue)
+            number_of_records += len(chunk)
+        for input_queue in input_queues:
+            put_chunk(input_queue, None, workers, output_queue)
+        finished = 0
+        while finished < len(workers):
+            try:
+                lines = output_queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                check_workers(workers, output_queue)
+                continue
+            if lines is None:
+                finished += 1
+            elif isinstance(lines, str):
+                raise WorkerFailed(lines)
+            else:
+                output_stream.writelines(lines)
+    except BaseException:
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for input_queue in input_queues:
+            # Chunks for stopped workers must not keep this process from exiting
+            input_queue.cancel_join_thread()
+        raise
+    finally:
+        for process in workers:
+            process.join()
+    return number_of_records
+
+
+def track_partition(track_id, number_of_partitions):
+    # Stable across processes, unlike hash() of strings
+    return zlib.crc32(repr(track_id).encode("utf-8")) % number_of_partitions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m combinationRules",
+                                     description="Fuse JSONL or CSV evidence logs per track")
+    parser.add_argument("input", help="evidence file, or - for stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None,
+                        help="input format, by default from the file extension")
+    parser.add_argument("--output", "-o", default="-", help="output JSONL file, or - for stdout")
+    parser.add_argument("--method", default=COMBINATION_METHODS["DEMPSTER_SHAFER"], choices=sorted(COMBINATION_METHODS))
+    parser.add_argument("--window", type=int, default=None, help="max number of evidences per track")
+    parser.add_argument("--processes", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--track-field", default="track")
+    parser.add_argument("--evidence-field", default="evidence", help="JSONL field holding the masses")
+    parser.add_argument("--weight-field", default="weight")
+    parser.add_argument("--separator", default="|", help="separator of composite focal element names")
+    args = parser.parse_args(argv)
+
+    input_format = args.format
+    if input_format is None:
+        input_format = "csv" if args.input.lower().endswith(".csv") else "jsonl"
+    input_stream = sys.stdin if args.input == "-" else open(args.input, newline="")
+    output_stream = sys.stdout if args.output == "-" else open(args.output, "w")
+    if input_format == "csv":
+        records = read_csv(input_stream, args.track_field, args.weight_field, args.separator)
+    else:
+        records = read_jsonl(input_stream, args.track_field, args.evidence_field, args.weight_field, args.separator)
+
+    start = time.perf_counter()
+    number_of_records = 0
+    try:
+        if args.processes <= 1:
+            fuser = TrackFuser(args.method, args.window)
+            for chunk in read_chunks(records, args.chunk_size):
+                fuser.fuse_chunk(chunk)
+                number_of_records += len(chunk)
+            for track_id, probabilities in fuser.results():
+                output_stream.write(output_line(track_id, probabilities, args.separator))
+        else:
+            number_of_records = fuse_in_workers(records, args, output_stream)
+    except WorkerFailed as error:
+        sys.stderr.write("Fusion failed in a worker process:\n" + str(error))
+        return 1
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if output_stream is not sys.stdout:
+            output_stream.close()
+
+    elapsed = time.perf_counter() - start
+    sys.stderr.write("Fused {} records in {:.3f} s ({:.0f} records/s)\n".format(
+        number_of_records, elapsed, number_of_records / elapsed if elapsed > 0.0 else 0.0))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
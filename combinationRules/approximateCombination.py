@@ -0,0 +1,161 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+from combinationRules.utilities import focal_key, frame_of, to_bitmask, from_bitmask
+from math import sqrt
+from random import Random
+from statistics import NormalDist
+
+# Monte Carlo approximation of Dempster's rule by random-set sampling.
+# Each sample draws one focal element from every source according to its masses and intersects them.  Samples with
+#  an empty intersection are rejected (the conflict), and the accepted intersections are distributed as the
+#  combined masses.  The cost is the sample budget times the number of sources, whatever the size of the frame or the
+#  number of composite focal elements, so the latency is bounded.  Under heavy conflict few samples are accepted,
+#  which shows up as wide intervals and a low number_accepted.
+
+DEFAULT_NUMBER_OF_SAMPLES = 10000
+DEFAULT_CONFIDENCE = 0.95
+
+
+def sample_intersections(sources, number_of_samples=DEFAULT_NUMBER_OF_SAMPLES, seed=None):
+    """
+    :param sources: list of mass dicts, one per source
+    :param number_of_samples: int: the sample budget
+    :param seed: None, or the seed of the random generator for reproducible results
+    :return: tuple of (dict of intersection bitmask -> number of accepted samples, frame list of singletons)
+    """
+    frame = frame_of(sources)
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    rng = Random(seed)
+
+    intersections = [-1] * number_of_samples
+    for source in sources:
+        masses = to_bitmask(source, frame_index)
+        if not masses:
+            continue
+        # One vectorized draw per source, then intersect sample by sample
+        draws = rng.choices(list(masses.keys()), weights=list(masses.values()), k=number_of_samples)
+        intersections = [intersection & draw for intersection, draw in zip(intersections, draws)]
+
+    counts = {}
+    for intersection in intersections:
+        if intersection != 0:
+            counts[intersection] = counts.get(intersection, 0) + 1
+    return counts, frame
+
+
+def proportion_interval(successes, trials, confidence=DEFAULT_CONFIDENCE):
+    """
+    Wilson score interval of a proportion
+    :return: tuple of (low, high)
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2.0)
+    proportion = successes / trials
+    denominator = 1.0 + z * z / trials
+    center = (proportion + z * z / (2.0 * trials)) / denominator
+    half_width = z * sqrt(proportion * (1.0 - proportion) / trials + z * z / (4.0 * trials * trials)) / denominator
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+
+def approximate_combination(sources, number_of_samples=DEFAULT_NUMBER_OF_SAMPLES, seed=None,
+                            confidence=DEFAULT_CONFIDENCE):
+    """
+    Estimates the masses combined by Dempster's rule
+    :param sources: list of mass dicts, one per source
+    :param number_of_samples: int: the sample budget
+    :param seed: None, or the seed of the random generator for reproducible results
+    :param confidence: float: the confidence level of the intervals
+    :return: dict with the estimated "masses", their confidence "intervals" (low, high), the estimated "conflict"
+     with its "conflict_interval", and the "number_of_samples" and "number_accepted"
+    """
+    counts, frame = sample_intersections(sources, number_of_samples, seed)
+    number_accepted = sum(counts.values())
+    masses = {}
+    intervals = {}
+    # Every input focal element is reported, with zero mass if it was never sampled
+    for source in sources:
+        for key in source.keys():
+            masses[focal_key(key)] = 0.0
+            intervals[focal_key(key)] = proportion_interval(0, number_accepted, confidence)
+    for mask, count in counts.items():
+        key = from_bitmask(mask, frame)
+        masses[key] = count / number_accepted
+        intervals[key] = proportion_interval(count, number_accepted, confidence)
+    return {
+        "masses": masses,
+        "intervals": intervals,
+        "conflict": 1.0 - number_accepted / number_of_samples if number_of_samples > 0 else 0.0,
+        "conflict_interval": proportion_interval(number_of_samples - number_accepted, number_of_samples, confidence),
+        "number_of_samples": number_of_samples,
+        "number_accepted": number_accepted
+    }
+
+
+def approximate_belief(sources, hypotheses, number_of_samples=DEFAULT_NUMBER_OF_SAMPLES, seed=None,
+                       confidence=DEFAULT_CONFIDENCE):
+    """
+    Estimates the combined belief and plausibility of the queried hypotheses without estimating every mass
+    :param sources: list of mass dicts, one per source
+    :param hypotheses: list of hypotheses, as single elements or tuples of elements
+    :param number_of_samples: int: the sample budget
+    :param seed: None, or the seed of the random generator for reproducible results
+    :param confidence: float: the confidence level of the intervals
+    :return: dict of hypothesis -> dict with "belief", "belief_interval", "plausibility" and "plausibility_interval"
+    """
+    counts, frame = sample_intersections(sources, number_of_samples, seed)
+    number_accepted = sum(counts.values())
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    results = {}
+    for hypothesis in hypotheses:
+        mask = 0
+        for element in focal_key(hypothesis):
+            if element in frame_index:
+                mask |= 1 << frame_index[element]
+        # Belief counts intersections inside the hypothesis, plausibility those touching it
+        believing = 0
+        plausible = 0
+        for intersection, count in counts.items():
+            if (intersection & mask) == intersection:
+                believing += count
+            if (intersection & mask) != 0:
+                plausible += count
+        results[hypothesis] = {
+            "belief": believing / number_accepted if number_accepted > 0 else 0.0,
+            "belief_interval": proportion_interval(believing, number_accepted, confidence),
+            "plausibility": plausible / number_accepted if number_accepted > 0 else 0.0,
+            "plausibility_interval": proportion_interval(plausible, number_accepted, confidence)
+        }
+    return results
+
+
+def multi_combination(evidence, all_data=None, weights=None, number_of_samples=DEFAULT_NUMBER_OF_SAMPLES, seed=None):
+    """
+    Same interface and data as dsCombination.multi_combination, with estimated masses
+    Weights do not affect Dempster's Rule.  All inputs assumed to be of equal weight.
+    """
+    sources = [evidence[evidence_key] for evidence_key in evidence.keys()]
+    if (all_data is not None) and all_data:
+        sources.append(all_data)
+    return approximate_combination(sources, number_of_samples, seed)["masses"]
@@ -0,0 +1,201 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Notifications of the tracks whose probabilities moved.  The notifier keeps, per track, the probabilities last sent
+#  to the subscribers (the baseline).  Each update is compared with the baseline rather than with the previous update,
+#  so slow drift is reported once it adds up.  When the distance is above the threshold the subscribers receive a
+#  delta: only the focal elements whose value changed, with 0.0 for those that disappeared.  The delta then becomes
+#  part of the baseline.
+# Distances:
+#  "max_abs"   - the largest change of any focal element
+#  "jousselme" - sqrt(1/2 (m1 - m2)' D (m1 - m2)) with D(A, B) = |A & B| / |A | B|, which also counts changes
+#                moving mass between overlapping focal elements as smaller than between disjoint ones
+# Both only depend on the difference, so they are computed over the changed focal elements: O(changes) for max_abs
+#  and O(changes^2) bitmask operations for Jousselme, not over the whole frame.
+
+from math import sqrt
+from threading import Lock
+
+from combinationRules.utilities import focal_key, frame_of, to_bitmask
+
+DISTANCES = ("max_abs", "jousselme")
+
+
+def probability_delta(before, after, precision=0.0):
+    """
+    :param before: dict of focal element -> value, or None
+    :param after: dict of focal element -> value
+    :param precision: float: changes at most this large are left out
+    :return: dict: focal element -> the new value, for the values that changed, 0.0 for focal elements not in after
+    """
+    before = before if before is not None else {}
+    delta = {}
+    for key, value in after.items():
+        if abs(value - before.get(key, 0.0)) > precision:
+            delta[key] = value
+    for key, value in before.items():
+        if (key not in after) and (abs(value) > precision):
+            delta[key] = 0.0
+    return delta
+
+
+def max_abs_distance(before, delta):
+    """
+    :param before: dict: the baseline
+    :param delta: dict: the changed values, from probability_delta
+    :return: float: the largest change
+    """
+    largest = 0.0
+    for key, value in delta.items():
+        largest = max(largest, abs(value - before.get(key, 0.0)))
+    return largest
+
+
+def jousselme_distance(before, delta):
+    """
+    :param before: dict: the baseline
+    :param delta: dict: the changed values, from probability_delta
+    :return: float: the Jousselme distance between the baseline and the baseline with the delta applied
+    """
+    differences = {}
+    for key, value in delta.items():
+        difference = value - before.get(key, 0.0)
+        key = focal_key(key)
+        differences[key] = differences.get(key, 0.0) + difference
+    frame = frame_of([differences])
+    masks = list(to_bitmask(differences, dict((element, position) for position, element in enumerate(frame)),
+                            skip_zero=False).items())
+    total = 0.0
+    for position, (mask_1, difference_1) in enumerate(masks):
+        # The empty set only overlaps itself
+        total += difference_1 * difference_1
+        for mask_2, difference_2 in masks[position + 1:]:
+            union = mask_1 | mask_2
+            if union:
+                total += 2.0 * difference_1 * difference_2 * bin(mask_1 & mask_2).count("1") / bin(union).count("1")
+    return sqrt(max(total / 2.0, 0.0))
+
+
+class ChangeNotifier(object):
+    """
+    Subscriptions to the tracks whose probabilities moved by more than a threshold
+    """
+    def __init__(self, threshold, distance="max_abs", precision=0.0):
+        """
+        :param threshold: float: distance from the baseline above which the subscribers are notified
+        :param distance: str: one of DISTANCES
+        :param precision: float: changes at most this large are left out of the deltas
+        """
+        if distance not in DISTANCES:
+            raise ValueError("ChangeNotifier: unknown distance " + str(distance))
+        if threshold < 0.0:
+            raise ValueError("ChangeNotifier: threshold can't be negative")
+        self.threshold = threshold
+        self.distance = distance
+        self.precision = precision
+        self._lock = Lock()
+        self._baselines = {}
+        self._subscriptions = {}
+        self._next_subscription = 0
+        self.notifications = 0
+        self.suppressed = 0
+
+    def subscribe(self, callback, track_ids=None):
+        """
+        :param callback: function of (track id, delta, distance), called outside the locks of the caller
+        :param track_ids: iterable of the track ids to follow, None for every track
+        :return: int: the subscription id
+        """
+        with self._lock:
+            subscription = self._next_subscription
+            self._next_subscription += 1
+            self._subscriptions[subscription] = (callback, None if track_ids is None else frozenset(track_ids))
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.pop(subscription, None)
+
+    def observe(self, track_id, probabilities):
+        """
+        Compares new probabilities of a track with its baseline, moving the baseline if the change is notified
+        :param track_id: hashable id of the track
+        :param probabilities: dict: the current probabilities of the track
+        :return: tuple of (delta, distance) to publish, or None if the change is below the threshold
+        """
+        with self._lock:
+            before = self._baselines.get(track_id)
+            delta = probability_delta(before, probabilities, self.precision)
+            if not delta:
+                self.suppressed += 1
+                return None
+            before = before if before is not None else {}
+            if self.distance == "max_abs":
+                distance = max_abs_distance(before, delta)
+            else:
+                distance = jousselme_distance(before, delta)
+            # The first probabilities of a track are always sent
+            if (distance <= self.threshold) and (track_id in self._baselines):
+                self.suppressed += 1
+                return None
+            baseline = dict(before)
+            for key, value in delta.items():
+                if value == 0.0 and key not in probabilities:
+                    baseline.pop(key, None)
+                else:
+                    baseline[key] = value
+            self._baselines[track_id] = baseline
+            self.notifications += 1
+            return delta, distance
+
+    def publish(self, track_id, delta, distance):
+        """
+        Calls the subscribers following the track
+        """
+        with self._lock:
+            callbacks = [callback for callback, track_ids in self._subscriptions.values()
+                         if (track_ids is None) or (track_id in track_ids)]
+        for callback in callbacks:
+            callback(track_id, delta, distance)
+
+    def notify(self, track_id, probabilities):
+        """
+        observe() then publish()
+        :return: dict: the delta sent, or None if the change is below the threshold
+        """
+        change = self.observe(track_id, probabilities)
+        if change is None:
+            return None
+        self.publish(track_id, change[0], change[1])
+        return change[0]
+
+    def baseline(self, track_id):
+        """
+        :return: dict: a copy of the probabilities last sent for the track, or None
+        """
+        with self._lock:
+            baseline = self._baselines.get(track_id)
+            return dict(baseline) if baseline is not None else None
+
+    def forget(self, track_id):
+        """
+        Drops the baseline of a removed track, so its next probabilities are sent in full
+        """
+        with self._lock:
+            self._baselines.pop(track_id, None)
@@ -0,0 +1,144 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Bulk ingestion of evidence given as columns (e.g. the fields of a NumPy structured array) or as a 2-D mass
+#  matrix over a fixed vocabulary of focal elements.  Murphy folds the rows straight into its weighted average and
+#  Zhang stores them as rows of a CompactEvidenceStore, so neither builds a dict per evidence.  The other methods
+#  combine dicts anyway, so their rows are converted to dicts over the focal vocabulary and combined through
+#  updateBuffer.combine_reports, which only batches the methods where that matches one call per report.
+
+from combinationRules import COMBINATION_METHODS
+from combinationRules.updateBuffer import combine_reports
+
+
+def as_list(values):
+    # NumPy arrays convert to Python scalars in one call, much faster than iterating them
+    if hasattr(values, "tolist"):
+        return values.tolist()
+    return list(values)
+
+
+def ingest_columns(method, track_ids, timestamps, focal_indices, masses, focal_elements, states=None,
+                   max_number_of_evidences=None, weights=None, lazy=False, typecode="d"):
+    """
+    Ingests evidence given as parallel columns, one entry per (report, focal element).  Entries sharing a track id and
+     timestamp form one report, and the reports of a track are added in timestamp order.
+    :param method: str: the method in COMBINATION_METHODS
+    :param track_ids: sequence of the track id of each entry
+    :param timestamps: sequence of the timestamp of each entry
+    :param focal_indices: sequence of the index into focal_elements of each entry
+    :param masses: sequence of the mass of each entry
+    :param focal_elements: list of the focal element keys of the frame
+    :param states: dict of track id -> internal data to update, or None to start empty
+    :param max_number_of_evidences: None if no window, > 1 if a window is defined
+    :param weights: None, or sequence of the weight of each entry (the weight of a report is taken from its first entry)
+    :param lazy: boolean whether methods that keep evidence should defer combining until the probabilities are
+     calculated
+    :param typecode: str: "d" to store the rows of new Zhang tracks as float64, "f" for float32
+    :return: dict: the updated states, track id -> internal data
+    """
+    width = len(focal_elements)
+    weight_column = None if weights is None else as_list(weights)
+    reports = {}
+    columns = zip(as_list(track_ids), as_list(timestamps), as_list(focal_indices), as_list(masses))
+    for entry, (track_id, timestamp, focal_index, mass) in enumerate(columns):
+        track_reports = reports.setdefault(track_id, {})
+        report = track_reports.get(timestamp)
+        if report is None:
+            report = ([0.0] * width, 1.0 if weight_column is None else weight_column[entry])
+            track_reports[timestamp] = report
+        report[0][focal_index] += mass
+
+    rows_by_track = {}
+    for track_id, track_reports in reports.items():
+        rows_by_track[track_id] = [track_reports[timestamp] for timestamp in sorted(track_reports.keys())]
+    return ingest_rows(method, rows_by_track, focal_elements, states, max_number_of_evidences, lazy, typecode)
+
+
+def ingest_structured(method, records, focal_elements, states=None, max_number_of_evidences=None, lazy=False,
+                      track_field="track", time_field="time", focal_field="focal", mass_field="mass",
+                      weight_field=None, typecode="d"):
+    """
+    Ingests a NumPy structured array (or a dict of columns) with one record per (report, focal element)
+    :param records: the structured array, indexed by field name
+    :param weight_field: None, or the name of the field holding the report weights
+    :return: dict: the updated states, track id -> internal data
+    """
+    weights = None if weight_field is None else records[weight_field]
+    return ingest_columns(method, records[track_field], records[time_field], records[focal_field],
+                          records[mass_field], focal_elements, states, max_number_of_evidences, weights, lazy,
+                          typecode)
+
+
+def ingest_matrix(method, track_ids, mass_matrix, focal_elements, states=None, max_number_of_evidences=None,
+                  weights=None, lazy=False, typecode="d"):
+    """
+    Ingests evidence given as a 2-D mass matrix, one row per report in arrival order
+    :param method: str: the method in COMBINATION_METHODS
+    :param track_ids: sequence of the track id of each row
+    :param mass_matrix: 2-D array or list of rows, one column per focal element
+    :param focal_elements: list of the focal element keys, one per column
+    :param states: dict of track id -> internal data to update, or None to start empty
+    :param max_number_of_evidences: None if no window, > 1 if a window is defined
+    :param weights: None, or sequence of the weight of each row
+    :param lazy: boolean whether methods that keep evidence should defer combining until the probabilities are
+     calculated
+    :param typecode: str: "d" to store the rows of new Zhang tracks as float64, "f" for float32
+    :return: dict: the updated states, track id -> internal data
+    """
+    weight_column = None if weights is None else as_list(weights)
+    rows_by_track = {}
+    for row_number, (track_id, row) in enumerate(zip(as_list(track_ids), as_list(mass_matrix))):
+        weight = 1.0 if weight_column is None else weight_column[row_number]
+        rows_by_track.setdefault(track_id, []).append((row, weight))
+    return ingest_rows(method, rows_by_track, focal_elements, states, max_number_of_evidences, lazy, typecode)
+
+
+def ingest_rows(method, rows_by_track, focal_elements, states=None, max_number_of_evidences=None, lazy=False,
+                typecode="d"):
+    """
+    :param rows_by_track: dict of track id -> list of (row of masses, weight) in arrival order
+    :param typecode: str: "d" to store the rows of new Zhang tracks as float64, "f" for float32
+    :return: dict: the updated states, track id -> internal data
+    """
+    if states is None:
+        states = {}
+    for track_id, reports in rows_by_track.items():
+        rows = [report[0] for report in reports]
+        row_weights = [report[1] for report in reports]
+        if method == COMBINATION_METHODS["MURPHY"]:
+            from combinationRules.murphyCombination import initialize_data, add_evidence_rows, update_combined
+            all_data = initialize_data(states.get(track_id))
+            add_evidence_rows(all_data, focal_elements, rows, row_weights, max_number_of_evidences)
+            update_combined(all_data, lazy)
+        elif method == COMBINATION_METHODS["ZHANG"]:
+            from combinationRules.zhangCombination import compact_data, initialize_data, add_evidence_rows,\
+                update_combined
+            if track_id in states:
+                all_data = initialize_data(states[track_id])
+            else:
+                all_data = compact_data(typecode=typecode)
+            add_evidence_rows(all_data, focal_elements, rows, row_weights, max_number_of_evidences)
+            update_combined(all_data, lazy)
+        else:
+            all_data = combine_reports(method, [(dict(zip(focal_elements, row)), row_weight)
+                                                for row, row_weight in zip(rows, row_weights)],
+                                       states.get(track_id), max_number_of_evidences, lazy)
+        states[track_id] = all_data
+    return states
@@ -0,0 +1,193 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+from array import array
+from collections.abc import MutableMapping
+
+from combinationRules.utilities import MASS_TYPECODES
+
+
+# Index of a column in the sparse rows
+COLUMN_TYPECODE = "I"
+
+
+class CompactEvidenceStore(MutableMapping):
+    """
+    Drop-in replacement for the dict of stored evidence (evidence key -> {focal element: mass}).
+    Focal elements are numbered once in a shared index.  An evidence that mentions every column from the first to its
+     last is a dense array row over that index, 8 bytes per focal element (4 for typecode "f"); any other evidence is
+     sparse, a single bytes object of its masses followed by their columns (4 bytes each), so reports over a few of
+     many focal elements do not pay for the whole index.  Either way there is no dict with its own tuple keys per
+     evidence, and each evidence reads back with the focal elements it was stored with, as from a dict.  Each column counts the rows that mention
+     it, and trim() drops the columns no row mentions any more, so windowing out the reports that introduced a focal
+     element also removes it from the index.
+    """
+    def __init__(self, typecode="d"):
+        """
+        :param typecode: str: the array typecode of the stored masses, "d" (float64) or "f" (float32)
+        """
+        if typecode not in MASS_TYPECODES:
+            raise ValueError("CompactEvidenceStore: typecode must be 'd' or 'f'")
+        self.typecode = typecode
+        self.focal_elements = []
+        self.focal_index = {}
+        # evidence key -> array of masses by column for dense rows, bytes of the masses then the columns for sparse rows
+        self.rows = {}
+        self._itemsize = array(typecode).itemsize
+        # column -> number of rows mentioning it
+        self.column_counts = []
+
+    def column(self, focal_element):
+        """
+        :param focal_element: the focal element key
+        :return: int: the column of the focal element, added to the shared index if new
+        """
+        if focal_element not in self.focal_index:
+            self.focal_index[focal_element] = len(self.focal_elements)
+            self.focal_elements.append(focal_element)
+            self.column_counts.append(0)
+        return self.focal_index[focal_element]
+
+    def set_row(self, key, row, columns=None):
+        """
+        Stores a row directly, without going through a dict
+        :param key: the evidence key
+        :param row: sequence of masses
+        :param columns: list of the column of each mass, None if the row is over the columns from the first one
+        """
+        if columns is not None:
+            order = sorted(range(0, len(columns)), key=lambda index: columns[index])
+            columns = [columns[index] for index in order]
+            row = [row[index] for index in order]
+        self._store(key, array(self.typecode, row), columns)
+
+    def _store(self, key, row, columns=None):
+        # Stores an array of masses with the sorted list of their columns, or None for the columns from the first one
+        if key in self.rows:
+            self._release(key)
+        if (columns is not None) and (len(columns) > 0) and (columns[-1] == len(columns) - 1):
+            # Sorted and distinct, so these are all the columns from the first one: dense
+            columns = None
+        if columns is None:
+            self.rows[key] = row
+            columns = range(0, len(row))
+        else:
+            self.rows[key] = row.tobytes() + array(COLUMN_TYPECODE, columns).tobytes()
+        for column in columns:
+            self.column_counts[column] += 1
+
+    def _release(self, key):
+        # Removes a row and its mentions
+        for column in self._columns(self.rows.pop(key)):
+            self.column_counts[column] -= 1
+
+    def _split(self, row):
+        # Views of the masses and the columns of a sparse row
+        view = memoryview(row)
+        end = len(row) // (self._itemsize + 4) * self._itemsize
+        return view[:end].cast(self.typecode), view[end:].cast(COLUMN_TYPECODE)
+
+    def _columns(self, row):
+        if isinstance(row, bytes):
+            return self._split(row)[1]
+        return range(0, len(row))
+
+    def move(self, source, destination):
+        """
+        Renumbers an evidence without converting its row
+        """
+        if destination in self.rows:
+            self._release(destination)
+        self.rows[destination] = self.rows.pop(source)
+
+    def trim(self):
+        """
+        Drops the columns that no row mentions, renumbering the others
+        :return: int: the number of columns dropped
+        """
+        kept = [column for column, count in enumerate(self.column_counts) if count > 0]
+        if len(kept) == len(self.column_counts):
+            return 0
+        dropped = len(self.column_counts) - len(kept)
+        renumbered = {}
+        for new_column, column in enumerate(kept):
+            renumbered[column] = new_column
+        # A dense row mentions every column up to its end, so those columns are kept and keep their numbers: only the
+        #  columns of the sparse rows change
+        for key, row in self.rows.items():
+            if isinstance(row, bytes):
+                masses, columns = self._split(row)
+                self.rows[key] = masses.tobytes() + array(COLUMN_TYPECODE,
+                                                          [renumbered[column] for column in columns]).tobytes()
+        self.focal_elements = [self.focal_elements[column] for column in kept]
+        self.column_counts = [self.column_counts[column] for column in kept]
+        self.focal_index = {}
+        for column, focal_element in enumerate(self.focal_elements):
+            self.focal_index[focal_element] = column
+        return dropped
+
+    def stored_masses(self, masses):
+        """
+        :param masses: dict of focal element -> mass
+        :return: dict: the masses as they would read back once stored, rounded to the precision of the store
+        """
+        if self.typecode == "d":
+            return masses
+        keys = list(masses.keys())
+        return dict(zip(keys, array(self.typecode, [masses[key] for key in keys])))
+
+    def as_matrix(self, numpy, keys):
+        """
+        :param numpy: the numpy module
+        :param keys: list of the evidence keys, in row order
+        :return: 2-D float64 array of the masses, one row per key and one column per focal element
+        """
+        matrix = numpy.zeros((len(keys), len(self.focal_elements)), dtype=numpy.float64)
+        for row_number, key in enumerate(keys):
+            row = self.rows[key]
+            if isinstance(row, bytes):
+                masses, columns = self._split(row)
+                matrix[row_number, numpy.asarray(columns)] = numpy.asarray(masses)
+            else:
+                matrix[row_number, :len(row)] = numpy.frombuffer(row, dtype=self.typecode)
+        return matrix
+
+    def __getitem__(self, key):
+        row = self.rows[key]
+        if not isinstance(row, bytes):
+            return dict(zip(self.focal_elements, row))
+        masses, columns = self._split(row)
+        focal_elements = self.focal_elements
+        return dict((focal_elements[column], mass) for column, mass in zip(columns, masses))
+
+    def __setitem__(self, key, masses):
+        stored = sorted((self.column(focal_element), mass) for focal_element, mass in masses.items())
+        self._store(key, array(self.typecode, [mass for _, mass in stored]), [column for column, _ in stored])
+
+    def __delitem__(self, key):
+        self._release(key)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
@@ -0,0 +1,133 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Decisions on single hypotheses from the combined masses.  The measures are sums over the focal elements A
+#  containing a hypothesis x of a per-element share of m(A):
+#  "pignistic"    - BetP(x), the share is m(A) / |A|, normalized by 1 - m(empty set)
+#  "plausibility" - Pl(x), the share is m(A)
+#  "belief"       - Bel({x}) = m({x}), only singletons have a share
+# top_k adds the shares in decreasing order.  At any point a hypothesis can gain at most the sum of the shares not
+#  added yet, so once the k-th best partial score is above the (k+1)-th plus that sum the k best are known, and the
+#  remaining focal elements are only tested for those k (a membership test instead of a loop over their elements).
+#  Large, low-mass focal elements such as the whole frame come last and are mostly skipped this way.
+
+from operator import itemgetter
+
+from combinationRules import import_and_calculate_probabilities
+
+MEASURES = ("pignistic", "plausibility", "belief")
+
+
+def masses_of(state, method=None):
+    """
+    :param state: the internal data of method, or a mass dict if method is None
+    :param method: str: the method in COMBINATION_METHODS, or None
+    :return: dict: the masses, unclamped and not copied
+    """
+    if method is None:
+        return state
+    return import_and_calculate_probabilities(method, state, clamp=False)
+
+
+def focal_shares(masses, measure):
+    """
+    :return: tuple of (list of (share, focal element tuple) in decreasing order of share, mass of the empty set)
+    """
+    if measure not in MEASURES:
+        raise ValueError("decision: unknown measure " + str(measure))
+    shares = []
+    empty_mass = 0.0
+    for key, mass in masses.items():
+        if isinstance(key, tuple) is False:
+            key = (key,)
+        if len(key) == 0:
+            empty_mass += mass
+        elif mass > 0.0:
+            if measure == "pignistic":
+                shares.append((mass / len(key), key))
+            elif (measure == "plausibility") or (len(key) == 1):
+                shares.append((mass, key))
+    shares.sort(key=itemgetter(0), reverse=True)
+    return shares, empty_mass
+
+
+def finish_scores(scores, empty_mass, measure):
+    # Normalized and clamped as import_and_calculate_probabilities would
+    normalization = 1.0
+    if (measure == "pignistic") and (0.0 < empty_mass < 1.0):
+        normalization = 1.0 - empty_mass
+    for hypothesis, score in scores.items():
+        scores[hypothesis] = min(max(score / normalization, 0.0), 1.0)
+    return scores
+
+
+def hypothesis_scores(state, measure="pignistic", method=None):
+    """
+    Full evaluation of the measure on every hypothesis
+    :param state: the internal data of method, or a mass dict if method is None
+    :param measure: str: one of MEASURES
+    :param method: str: the method in COMBINATION_METHODS, or None
+    :return: dict: hypothesis -> score
+    """
+    shares, empty_mass = focal_shares(masses_of(state, method), measure)
+    scores = {}
+    for share, key in shares:
+        for hypothesis in key:
+            scores[hypothesis] = scores.get(hypothesis, 0.0) + share
+    return finish_scores(scores, empty_mass, measure)
+
+
+def top_k(state, k=1, measure="pignistic", method=None):
+    """
+    The k most likely hypotheses, pruning the others with bounds on their partial scores
+    :param state: the internal data of method, or a mass dict if method is None
+    :param k: int: number of hypotheses to return
+    :param measure: str: one of MEASURES
+    :param method: str: the method in COMBINATION_METHODS, or None
+    :return: list of (hypothesis, score) tuples, best first, the same scores as hypothesis_scores.  Fewer than k if
+     fewer hypotheses have a positive score.
+    """
+    if k < 1:
+        raise ValueError("top_k: k must be at least 1")
+    shares, empty_mass = focal_shares(masses_of(state, method), measure)
+    scores = {}
+    remaining = sum(share for share, _ in shares)
+    next_check = remaining / 2.0
+    position = 0
+    while position < len(shares):
+        share, key = shares[position]
+        position += 1
+        for hypothesis in key:
+            scores[hypothesis] = scores.get(hypothesis, 0.0) + share
+        remaining -= share
+        # Checking costs a pass over the scores, so only each time the bound has halved
+        if (remaining <= next_check) and (len(scores) >= k):
+            next_check = remaining / 2.0
+            ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)
+            runner_up = ranked[k][1] if len(ranked) > k else 0.0
+            if runner_up + remaining < ranked[k - 1][1]:
+                scores = dict(ranked[:k])
+                break
+    # Exact scores of the k best from the shares not added yet
+    for share, key in shares[position:]:
+        for hypothesis in scores.keys():
+            if hypothesis in key:
+                scores[hypothesis] += share
+    ranked = sorted(scores.items(), key=itemgetter(1), reverse=True)[:k]
+    return list(finish_scores(dict(ranked), empty_mass, measure).items())
@@ -0,0 +1,141 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# The disjunctive rule: m(C) is the sum of m1(A) m2(B) over the A, B with A | B = C.  Used when at least one source is
+#  reliable but not which one.  There is no conflict to normalize, and the rule is associative and commutative.
+# Focal elements are bitmasks over the frame of all the inputs.  The pairwise union costs the product of the numbers
+#  of focal elements, and the unions can multiply with every input.  Once that is predicted to cost more, the
+#  remaining inputs are combined through the implicabilities b(A) = sum of m(B) over B contained in A instead: the
+#  implicability of the combination is the product of the implicabilities of the inputs, in O(inputs x n x 2^n) for
+#  a frame of n elements.
+
+from combinationRules.utilities import frame_of, to_bitmask, from_bitmask, subset_zeta, subset_moebius
+
+# Above this frame size the dense transform needs too much memory whatever the number of focal elements
+TRANSFORM_MAX_FRAME = 16
+
+
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+    """
+    Windows the evidence.  Only allows the maximum amount (the latest evidences)
+    Note: has no effect on this function since the evidence is not retained
+    :param evidence: dict of new evidence to add
+    :param max_number_of_evidences: the max number of evidences to window
+    :param all_data: the data to combine with
+    :param weights: dict of weights associated with the new evidence
+    """
+    return multi_combination(evidence, all_data, weights)
+
+
+def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
+    # Only has the combined data since prior evidence isn't kept, so simply combine the two datasets as evidence.
+    evidence = {
+        "evidence_1": all_data_1,
+        "evidence_2": all_data_2
+    }
+    return windowed_multi_combination(evidence, max_number_of_evidences)
+
+
+def multi_combination(evidence, all_data=None, weights=None):
+    # Weights do not affect the disjunctive rule.  All inputs assumed to be of equal weight.
+    inputs = []
+    for evidence_key in evidence.keys():
+        if evidence[evidence_key]:
+            inputs.append(evidence[evidence_key])
+    if (all_data is not None) and all_data:
+        inputs.append(all_data)
+    if not inputs:
+        return {}
+
+    frame = frame_of(inputs)
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    bitmask_inputs = [to_bitmask(source, frame_index) for source in inputs]
+    combined = bitmask_inputs[0]
+    for position in range(1, len(bitmask_inputs)):
+        if use_transform(combined, bitmask_inputs[position:], len(frame)):
+            combined = transform_combination([combined] + bitmask_inputs[position:], len(frame))
+            break
+        combined = bitmask_combination(combined, bitmask_inputs[position])
+
+    result = {}
+    for mask, mass in combined.items():
+        result[from_bitmask(mask, frame)] = mass
+    return result
+
+
+def use_transform(combined, remaining_inputs, frame_size):
+    """
+    :param combined: dict: the bitmask masses combined so far
+    :param remaining_inputs: list of the bitmask mass dicts still to combine
+    :return: boolean whether the transform is predicted to take fewer steps than the remaining pairwise unions, at
+     least as many as the focal elements so far times those of the remaining inputs
+    """
+    if frame_size > TRANSFORM_MAX_FRAME:
+        return False
+    products = len(combined) * sum(len(source) for source in remaining_inputs)
+    return (len(remaining_inputs) + 1) * frame_size * (1 << frame_size) < products
+
+
+def bitmask_combination(masses_1, masses_2):
+    """
+    :return: dict: the disjunctive combination of two bitmask mass dicts
+    """
+    result = {}
+    for mask_1, mass_1 in masses_1.items():
+        for mask_2, mass_2 in masses_2.items():
+            union = mask_1 | mask_2
+            result[union] = result.get(union, 0.0) + mass_1 * mass_2
+    return result
+
+
+def transform_combination(bitmask_inputs, frame_size):
+    """
+    :return: dict: the disjunctive combination of the bitmask mass dicts, through the product of implicabilities
+    """
+    size = 1 << frame_size
+    implicability = [1.0] * size
+    for source in bitmask_inputs:
+        values = [0.0] * size
+        for mask, mass in source.items():
+            values[mask] += mass
+        subset_zeta(values, frame_size)
+        for mask in range(0, size):
+            implicability[mask] *= values[mask]
+    subset_moebius(implicability, frame_size)
+    result = {}
+    for mask in range(0, size):
+        if implicability[mask] != 0.0:
+            result[mask] = implicability[mask]
+    return result
+
+
+# Implements the disjunctive combination rule for two inputs
+def combination(dic1, dic2):
+    return multi_combination({"evidence_1": dic1, "evidence_2": dic2})
+
+
+def final_probabilities(all_data):
+    """
+    For a consistent interface with ECR
+    :param all_data: The data of all information based on this combination method
+    :return: The dictionary of probabilities for all options.  Should be the same as all_data for this method
+    """
+    return all_data
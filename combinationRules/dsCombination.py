@@ -17,6 +17,8 @@
 # along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
 # --------------------------------------------------------------------------
 
+from combinationRules.utilities import frame_of, to_bitmask, from_bitmask, superset_zeta, superset_moebius
+from combinationRules import jitKernels
 from copy import deepcopy
 
 # Combine multiple inputs via Dempster's combination rule
@@ -24,15 +26,22 @@ from copy import deepcopy
 #  interface with ECR
 
 
-def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None,
+                               invertible=False):
     """
     Windows the evidence.  Only allows the maximum amount (the latest evidences)
-    Note: has no effect on this function since the evidence is not retained
+    Note: has no effect on this function since the evidence is not retained, unless invertible
     :param evidence: dict of new evidence to add
     :param max_number_of_evidences: the max number of evidences to window
     :param all_data: the data to combine with
     :param weights: dict of weights associated with the new evidence
+    :param invertible: boolean whether to keep the evidence of the window in the invertible form of
+     invertibleWindow, so the oldest evidence is removed when the window is full.  The internal data is then no longer
+     the combined masses: use final_probabilities.
     """
+    if invertible or ((all_data is not None) and ("invertible" in all_data)):
+        from combinationRules.invertibleWindow import windowed_combination
+        return windowed_combination("DEMPSTER_SHAFER", evidence, max_number_of_evidences, all_data)
     if (all_data is not None) and ("number_of_evidences" in all_data) and (max_number_of_evidences is not None) and\
             (max_number_of_evidences > 1):
         all_data["number_of_evidences"] = min(all_data["number_of_evidences"], max_number_of_evidences - len(evidence))
@@ -50,6 +59,9 @@ def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
 
 def multi_combination(evidence, all_data=None, weights=None):
     # Weights do not affect Dempster's Rule.  All inputs assumed to be of equal weight.
+    if (all_data is not None) and ("invertible" in all_data):
+        from combinationRules.invertibleWindow import windowed_combination
+        return windowed_combination("DEMPSTER_SHAFER", evidence, None, all_data)
     # Create the return
     result = {}
     # Loop and combine
@@ -83,18 +95,117 @@ def multi_combination(evidence, all_data=None, weights=None):
     return result
 
 
+def combination_inputs(evidence, all_data=None):
+    """
+    The inputs of multi_combination in combination order, with keys converted to sorted tuples
+    :return: list of mass dicts
+    """
+    inputs = []
+    sources = [evidence[evidence_key] for evidence_key in evidence.keys()]
+    if (all_data is not None) and all_data:
+        sources.append(all_data)
+    for source in sources:
+        converted = {}
+        for input_key, mass in source.items():
+            if isinstance(input_key, tuple) is True:
+                store_key = tuple(sorted(input_key))
+            else:
+                store_key = (input_key,)
+            converted[store_key] = mass
+        # As in multi_combination, empty inputs after the first are skipped
+        if converted or not inputs:
+            inputs.append(converted)
+    return inputs
+
+
+def bitmask_multi_combination(evidence, all_data=None, weights=None):
+    """
+    Same results as multi_combination, with focal elements as integer bitmasks so that intersections are a single
+     AND instead of building sets and sorting tuples.  Like combination, mass is only kept on intersections that are
+     already keys of the inputs combined so far.
+    """
+    inputs = combination_inputs(evidence, all_data)
+    frame = frame_of(inputs)
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    if not inputs:
+        return {}
+
+    result = to_bitmask(inputs[0], frame_index, skip_zero=False)
+    for second_input in inputs[1:]:
+        second = to_bitmask(second_input, frame_index, skip_zero=False)
+        combined = dict.fromkeys(result.keys(), 0)
+        for mask in second.keys():
+            combined[mask] = 0
+        for mask_1, mass_1 in result.items():
+            for mask_2, mass_2 in second.items():
+                intersection = mask_1 & mask_2
+                if intersection in combined:
+                    combined[intersection] += mass_1 * mass_2
+        # Normalize the results
+        f = sum(combined.values())
+        for mask in combined.keys():
+            if combined[mask] != 0.0:
+                combined[mask] /= f
+        result = combined
+
+    return {from_bitmask(mask, frame): mass for mask, mass in result.items()}
+
+
+def transform_multi_combination(evidence, all_data=None, weights=None):
+    """
+    Dempster's rule through the commonality transform: the commonality of the combination is the product of the
+     commonalities of the inputs.  Costs O(inputs x n x 2^n) for a frame of n elements whatever the number of focal
+     elements.  Equal to multi_combination when the keys of every input are the same set, closed under intersection
+     (otherwise combination drops the mass of intersections that are not keys).
+    """
+    inputs = combination_inputs(evidence, all_data)
+    frame = frame_of(inputs)
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    size = 1 << len(frame)
+
+    commonality = [1.0] * size
+    for source in inputs:
+        values = [0.0] * size
+        for mask, mass in to_bitmask(source, frame_index).items():
+            values[mask] += mass
+        superset_zeta(values, len(frame))
+        for mask in range(0, size):
+            commonality[mask] *= values[mask]
+    superset_moebius(commonality, len(frame))
+
+    # Drop the conflict on the empty set and normalize
+    f = sum(commonality[1:])
+    result = {}
+    for source in inputs:
+        for key in source.keys():
+            result[key] = 0.0
+    if f == 0.0:
+        return result
+    for mask in range(1, size):
+        if commonality[mask] != 0.0:
+            result[from_bitmask(mask, frame)] = commonality[mask] / f
+    return result
+
+
 # Implement Dempster's combination rule
 def combination(dic1, dic2):
     # Extract the sets
     sets = set(dic1.keys()).union(set(dic2.keys()))
-    result = dict.fromkeys(sets, 0)
+    # The compiled loop when numba is installed and the loop is large enough
+    result = jitKernels.ds_products(dic1, dic2, sets)
+    if result is None:
+        result = dict.fromkeys(sets, 0)
 
-    # Combination process
-    for i in dic1.keys():
-        for j in dic2.keys():
-            tuple_intersection = tuple(sorted(set(i).intersection(set(j))))
-            if tuple_intersection in sets:
-                result[tuple_intersection] += dic1[i] * dic2[j]
+        # Combination process
+        for i in dic1.keys():
+            for j in dic2.keys():
+                tuple_intersection = tuple(sorted(set(i).intersection(set(j))))
+                if tuple_intersection in sets:
+                    result[tuple_intersection] += dic1[i] * dic2[j]
 
     # Normalize the results
     f = sum(list(result.values()))
@@ -105,10 +216,61 @@ def combination(dic1, dic2):
     return result
 
 
+def repeated_combination(first, second, times):
+    """
+    Same result as combining second into first times times with combination.  When both have the same keys, closed
+     under intersection, combination is Dempster's rule on those keys and is associative, so the powers of second are
+     built by squaring: O(log times) combinations instead of times.
+    :param first: dict: the masses to start from
+    :param second: dict: the masses combined in repeatedly
+    :param times: int: the number of combinations
+    :return: dict: the combined masses
+    """
+    if (times > 1) and (set(first.keys()) == set(second.keys())) and intersection_closed(second.keys()):
+        result = first
+        power = second
+        while times > 0:
+            if times & 1:
+                result = combination(result, power)
+            times >>= 1
+            if times > 0:
+                power = combination(power, power)
+        return result
+    for _ in range(0, times):
+        first = combination(first, second)
+    return first
+
+
+def intersection_closed(keys):
+    """
+    :param keys: iterable of sorted tuple keys
+    :return: boolean whether the intersection of any two keys is empty or a key
+    """
+    frame = frame_of([dict.fromkeys(keys)])
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    masks = list(to_bitmask(dict.fromkeys(keys, 1.0), frame_index).keys())
+    if len(masks) >= (1 << len(frame)) - 1:
+        # Every non-empty subset of the frame is a key
+        return True
+    mask_set = set(masks)
+    for position, mask_1 in enumerate(masks):
+        for mask_2 in masks[position + 1:]:
+            intersection = mask_1 & mask_2
+            if (intersection != 0) and (intersection not in mask_set):
+                return False
+    return True
+
+
 def final_probabilities(all_data):
     """
     For a consistent interface with ECR
     :param all_data: The data of all information based on this combination method
-    :return: The dictionary of probabilities for all options.  Should be the same as all_data for this method
+    :return: The dictionary of probabilities for all options.  Should be the same as all_data for this method, except
+     for the invertible window
     """
+    if (all_data is not None) and ("invertible" in all_data):
+        from combinationRules.invertibleWindow import combined_masses
+        return deepcopy(combined_masses(all_data))
     return deepcopy(all_data)
@@ -0,0 +1,103 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Dubois and Prade's rule: m1(A) m2(B) goes to A & B when they intersect, and to A | B when they conflict, so the
+#  conflict stays on the hypotheses of the conflicting sources instead of being normalized away (Dempster) or given to
+#  the whole frame (Yager).  Nothing is lost, so there is nothing to normalize.
+# The rule is not associative, so the inputs are combined pairwise in order, like Yager's.  Focal elements are
+#  bitmasks over the frame of all the inputs, so each product is an AND (and an OR on conflict) rather than building
+#  sets and sorted tuples.  Unlike the pairwise Dempster and Yager combinations, mass is kept on every intersection,
+#  whether or not it is an input key.
+
+from combinationRules.utilities import frame_of, to_bitmask, from_bitmask
+
+
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+    """
+    Windows the evidence.  Only allows the maximum amount (the latest evidences)
+    Note: has no effect on this function since the evidence is not retained
+    :param evidence: dict of new evidence to add
+    :param max_number_of_evidences: the max number of evidences to window
+    :param all_data: the data to combine with
+    :param weights: dict of weights associated with the new evidence
+    """
+    return multi_combination(evidence, all_data, weights)
+
+
+def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
+    # Only has the combined data since prior evidence isn't kept, so simply combine the two datasets as evidence.
+    evidence = {
+        "evidence_1": all_data_1,
+        "evidence_2": all_data_2
+    }
+    return windowed_multi_combination(evidence, max_number_of_evidences)
+
+
+def multi_combination(evidence, all_data=None, weights=None):
+    # Weights do not affect Dubois-Prade.  All inputs assumed to be of equal weight.
+    # Combine in the same order as Yager: the evidence, then all_data
+    inputs = []
+    for evidence_key in evidence.keys():
+        if evidence[evidence_key]:
+            inputs.append(evidence[evidence_key])
+    if (all_data is not None) and all_data:
+        inputs.append(all_data)
+    if not inputs:
+        return {}
+
+    frame = frame_of(inputs)
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    combined = to_bitmask(inputs[0], frame_index)
+    for second_input in inputs[1:]:
+        combined = bitmask_combination(combined, to_bitmask(second_input, frame_index))
+
+    result = {}
+    for mask, mass in combined.items():
+        result[from_bitmask(mask, frame)] = mass
+    return result
+
+
+def bitmask_combination(masses_1, masses_2):
+    """
+    :return: dict: the Dubois-Prade combination of two bitmask mass dicts
+    """
+    result = {}
+    for mask_1, mass_1 in masses_1.items():
+        for mask_2, mass_2 in masses_2.items():
+            target = mask_1 & mask_2
+            if target == 0:
+                target = mask_1 | mask_2
+            result[target] = result.get(target, 0.0) + mass_1 * mass_2
+    return result
+
+
+# Implements Dubois and Prade's combination rule for two inputs
+def combination(dic1, dic2):
+    return multi_combination({"evidence_1": dic1, "evidence_2": dic2})
+
+
+def final_probabilities(all_data):
+    """
+    For a consistent interface with ECR
+    :param all_data: The data of all information based on this combination method
+    :return: The dictionary of probabilities for all options.  Should be the same as all_data for this method
+    """
+    return all_data
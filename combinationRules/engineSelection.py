@@ -0,0 +1,235 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Chooses how Dempster's rule is computed for each call.  The engines are:
+#  "pairwise"    - dsCombination.multi_combination, tuples and sets
+#  "bitmask"     - the same combinations with focal elements as integer bitmasks, identical results
+#  "transform"   - product of commonalities over the 2^n subsets of the frame, only eligible when it gives the same
+#                  results as the pairwise combination (see transform_eligibility)
+#  "approximate" - Monte Carlo estimate from approximateCombination.  It keeps the mass of every intersection, so it
+#                  estimates a different rule from the pairwise combination and is never chosen by "auto": callers
+#                  opt in with engine="approximate" (and a seed for repeatable results)
+# Each engine's cost is predicted from two terms of work for the inputs: its main loop (products of focal elements,
+#  transform entries or samples) and the number of input keys it converts, each times a cost in seconds from
+#  ENGINE_COSTS.  The defaults come from calibrate() on a reference machine; run "python -m benchmark.combinationBenchmark
+#  engine_selection" to compare the predictions with the timings, and set_engine_costs(calibrate()) to recalibrate.
+# Only the unwindowed path goes through the selection: import_and_combine (its engine parameter) and
+#  multi_combination here.  import_and_windowed_combine, and so the stores, the update buffer and the command line,
+#  always use the pairwise dsCombination.windowed_multi_combination (or invertibleWindow).
+
+import logging
+import random
+import time
+
+from combinationRules.dsCombination import intersection_closed
+from combinationRules.utilities import frame_of
+
+logger = logging.getLogger(__name__)
+
+ENGINES = ("pairwise", "bitmask", "transform", "approximate")
+# engine -> (seconds per unit of the main loop, seconds per input key)
+ENGINE_COSTS = {
+    "pairwise": (1.9e-6, 0.0),
+    "bitmask": (2.1e-7, 1.0e-6),
+    "transform": (9.0e-8, 4.0e-6),
+    "approximate": (2.6e-7, 8.5e-6)
+}
+# Above this frame size the dense transform needs too much memory whatever its predicted time
+TRANSFORM_MAX_FRAME = 20
+DEFAULT_NUMBER_OF_SAMPLES = 10000
+
+
+def set_engine_costs(costs):
+    """
+    :param costs: dict of engine -> (seconds per unit of the main loop, seconds per input key), e.g. from calibrate()
+    """
+    for engine in costs.keys():
+        if engine not in ENGINE_COSTS:
+            raise ValueError("set_engine_costs: unknown engine " + str(engine))
+    ENGINE_COSTS.update(costs)
+
+
+def work_units(inputs, frame_size, number_of_samples=DEFAULT_NUMBER_OF_SAMPLES):
+    """
+    :param inputs: list of mass dicts with sorted tuple keys, in combination order
+    :param frame_size: int: number of singletons in the frame
+    :return: dict of engine -> (units of the main loop, number of input keys)
+    """
+    # The pairwise result holds every key seen so far, and is crossed with each new input
+    seen = set()
+    products = 0
+    for source in inputs:
+        if seen:
+            products += len(seen) * len(source)
+        seen.update(source.keys())
+    number_of_keys = sum(len(source) for source in inputs)
+    return {
+        "pairwise": (products, number_of_keys),
+        "bitmask": (products, number_of_keys),
+        "transform": (len(inputs) * (frame_size + 1) * (1 << frame_size), number_of_keys),
+        "approximate": (len(inputs) * number_of_samples, number_of_keys)
+    }
+
+
+def transform_eligibility(inputs, frame_size):
+    """
+    The pairwise combination only keeps mass on intersections that are already keys, so the transform (true Dempster)
+     matches it when every input has the same keys, closed under intersection, and the empty set is not a key.
+    :return: tuple of (boolean, reason)
+    """
+    if frame_size > TRANSFORM_MAX_FRAME:
+        return False, "frame of {} elements is above TRANSFORM_MAX_FRAME".format(frame_size)
+    keys = set(inputs[0].keys())
+    for source in inputs[1:]:
+        if set(source.keys()) != keys:
+            return False, "inputs have different focal elements"
+    if () in keys:
+        return False, "the empty set is a focal element"
+    if not intersection_closed(keys):
+        return False, "focal elements are not closed under intersection"
+    return True, "same focal elements in every input, closed under intersection"
+
+
+def select_engine(inputs, number_of_samples=DEFAULT_NUMBER_OF_SAMPLES):
+    """
+    Chooses among the exact engines only; the approximate engine's predicted time is returned for comparison
+    :param inputs: list of mass dicts with sorted tuple keys, in combination order
+    :param number_of_samples: int: the sample budget of the approximate engine
+    :return: tuple of (engine, reason str, dict of engine -> predicted seconds)
+    """
+    frame_size = len(frame_of(inputs))
+    units = work_units(inputs, frame_size, number_of_samples)
+    predicted = {}
+    for engine in ENGINES:
+        predicted[engine] = ENGINE_COSTS[engine][0] * units[engine][0] + ENGINE_COSTS[engine][1] * units[engine][1]
+
+    exact_engines = ["pairwise", "bitmask"]
+    transform_reason = None
+    if len(inputs) > 1 and predicted["transform"] < predicted["bitmask"]:
+        # Only worth checking when it could win
+        eligible, transform_reason = transform_eligibility(inputs, frame_size)
+        if eligible:
+            exact_engines.append("transform")
+    engine = min(exact_engines, key=lambda name: predicted[name])
+    reason = "{} predicted fastest exact engine ({:.3g} s)".format(engine, predicted[engine])
+    if transform_reason is not None and "transform" not in exact_engines:
+        reason += ", transform not eligible: " + transform_reason
+    return engine, reason, predicted
+
+
+def multi_combination(evidence, all_data=None, weights=None, engine="auto",
+                      number_of_samples=DEFAULT_NUMBER_OF_SAMPLES, seed=None):
+    """
+    Same interface and data as dsCombination.multi_combination, computed by the chosen engine
+    :param engine: str: one of ENGINES, or "auto" (or None) to choose among the exact engines with the cost model
+    :param number_of_samples: int: the sample budget of the approximate engine
+    :param seed: the random seed of the approximate engine, None for a different estimate on each call
+    """
+    from combinationRules import dsCombination
+    if (all_data is not None) and ("invertible" in all_data):
+        return dsCombination.multi_combination(evidence, all_data, weights)
+    if engine is None or engine == "auto":
+        inputs = dsCombination.combination_inputs(evidence, all_data)
+        if len(inputs) < 2:
+            engine, reason = "pairwise", "fewer than two inputs"
+        else:
+            engine, reason, _ = select_engine(inputs, number_of_samples)
+        logger.debug("Dempster-Shafer engine %s chosen: %s", engine, reason)
+    elif engine not in ENGINES:
+        raise ValueError("multi_combination: unknown engine " + str(engine))
+
+    if engine == "pairwise":
+        return dsCombination.multi_combination(evidence, all_data, weights)
+    elif engine == "bitmask":
+        return dsCombination.bitmask_multi_combination(evidence, all_data, weights)
+    elif engine == "transform":
+        return dsCombination.transform_multi_combination(evidence, all_data, weights)
+    else:
+        from combinationRules.approximateCombination import multi_combination as approximate_multi_combination
+        return approximate_multi_combination(evidence, all_data, weights, number_of_samples, seed)
+
+
+def calibration_inputs(seed, number_of_sources, frame_size, number_of_focal_elements, closed=False):
+    """
+    Random inputs for calibration.  With closed=True every input has mass on every non-empty subset of the frame, so
+     the transform engine is eligible.
+    """
+    rng = random.Random(seed)
+    frame = ["h{}".format(counter) for counter in range(0, frame_size)]
+    if closed:
+        focal_elements = [tuple(x for j, x in enumerate(frame) if (i >> j) & 1) for i in range(1, 1 << frame_size)]
+    evidence = {}
+    for counter in range(0, number_of_sources):
+        if not closed:
+            focal_elements = {tuple(frame)}
+            while len(focal_elements) < number_of_focal_elements:
+                subset = tuple(x for x in frame if rng.random() < 0.5)
+                if subset:
+                    focal_elements.add(subset)
+        masses = [rng.random() for _ in focal_elements]
+        total = sum(masses)
+        evidence[counter] = {focal: mass / total for focal, mass in zip(focal_elements, masses)}
+    return evidence
+
+
+def calibrate(repeat=3):
+    """
+    Times every engine on calibration inputs and fits its two costs by least squares
+    :param repeat: int: number of timings per case, the best is kept
+    :return: dict of engine -> (seconds per unit of the main loop, seconds per input key), for set_engine_costs
+    """
+    from combinationRules import dsCombination
+    cases = [calibration_inputs(seed, sources, frame_size, focal, closed)
+             for seed, (sources, frame_size, focal, closed) in enumerate([
+                 (2, 4, 4, False), (16, 4, 2, False), (4, 6, 8, False), (8, 8, 16, False), (16, 10, 32, False),
+                 (4, 4, 0, True), (8, 6, 0, True), (3, 8, 0, True)])]
+    number_of_samples = DEFAULT_NUMBER_OF_SAMPLES // 10
+    # Normal equations of the fit, engine -> [sum x0 x0, sum x0 x1, sum x1 x1, sum x0 t, sum x1 t]
+    sums = {}
+    for engine in ENGINES:
+        sums[engine] = [0.0] * 5
+    for evidence in cases:
+        inputs = dsCombination.combination_inputs(evidence)
+        units = work_units(inputs, len(frame_of(inputs)), number_of_samples)
+        for engine in ENGINES:
+            best = None
+            for _ in range(0, repeat):
+                start = time.perf_counter()
+                multi_combination(evidence, engine=engine, number_of_samples=number_of_samples)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            x0, x1 = units[engine]
+            engine_sums = sums[engine]
+            engine_sums[0] += x0 * x0
+            engine_sums[1] += x0 * x1
+            engine_sums[2] += x1 * x1
+            engine_sums[3] += x0 * best
+            engine_sums[4] += x1 * best
+    costs = {}
+    for engine, (a, b, c, d, e) in sums.items():
+        determinant = a * c - b * b
+        per_unit = (d * c - b * e) / determinant
+        per_key = (a * e - b * d) / determinant
+        # A negative coefficient means that term is lost in the noise: fit the other one alone
+        if per_key < 0.0:
+            per_unit, per_key = d / a, 0.0
+        elif per_unit < 0.0:
+            per_unit, per_key = 0.0, e / c
+        costs[engine] = (per_unit, per_key)
+    return costs
@@ -0,0 +1,122 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Maps between a fine frame and a coarse frame whose elements are disjoint classes of fine elements.  A coarsening is
+#  a dict of fine element -> coarse element; elements it does not map are their own class.
+# coarsen moves the mass of each fine focal element A to a coarse focal element:
+#  "outer" - the classes meeting A, which keeps the plausibility of every class (Pl(c) = Pl(elements of c))
+#  "inner" - the classes contained in A, which keeps the belief of every union of classes; if there are none, the mass
+#            goes to the empty set
+# refine moves the mass of each coarse focal element to the union of its classes.  Both give the same masses for
+#  evidence whose focal elements are unions of classes, so combining such evidence on the coarse frame and refining
+#  the result is the same as combining on the fine frame, with the pairwise and powerset work of the coarse frame.
+#  Other evidence is approximated: outer coarsening only loses the distinctions inside a class.  Zhang's credibility
+#  weights are cosines of pignistic vectors over the frame, which change with its granularity, so for Zhang the coarse
+#  combination is an approximation even for such evidence.
+
+from combinationRules.utilities import focal_key
+
+REDUCTIONS = ("outer", "inner")
+
+
+def coarsening_from_classes(classes):
+    """
+    :param classes: dict of coarse element -> iterable of its fine elements
+    :return: dict: the coarsening, fine element -> coarse element
+    """
+    coarsening = {}
+    for coarse_element, fine_elements in classes.items():
+        for fine_element in fine_elements:
+            if fine_element in coarsening:
+                raise ValueError("coarsening_from_classes: " + str(fine_element) + " is in more than one class")
+            coarsening[fine_element] = coarse_element
+    return coarsening
+
+
+def classes_of(coarsening):
+    """
+    :param coarsening: dict of fine element -> coarse element
+    :return: dict: coarse element -> set of its fine elements
+    """
+    classes = {}
+    for fine_element, coarse_element in coarsening.items():
+        classes.setdefault(coarse_element, set()).add(fine_element)
+    return classes
+
+
+def coarsen(masses, coarsening, reduction="outer"):
+    """
+    :param masses: dict of fine focal element -> mass
+    :param coarsening: dict of fine element -> coarse element
+    :param reduction: str: "outer" or "inner"
+    :return: dict: coarse focal element (sorted tuple) -> mass
+    """
+    if reduction not in REDUCTIONS:
+        raise ValueError("coarsen: unknown reduction " + str(reduction))
+    classes = classes_of(coarsening) if reduction == "inner" else None
+    result = {}
+    for key, mass in masses.items():
+        fine_elements = set(focal_key(key))
+        coarse_elements = set()
+        for fine_element in fine_elements:
+            coarse_elements.add(coarsening.get(fine_element, fine_element))
+        if reduction == "inner":
+            coarse_elements = set(coarse_element for coarse_element in coarse_elements
+                                  if classes.get(coarse_element, {coarse_element}) <= fine_elements)
+        coarse_key = tuple(sorted(coarse_elements))
+        result[coarse_key] = result.get(coarse_key, 0.0) + mass
+    return result
+
+
+def refine(masses, coarsening):
+    """
+    :param masses: dict of coarse focal element -> mass
+    :param coarsening: dict of fine element -> coarse element
+    :return: dict: fine focal element (sorted tuple) -> mass
+    """
+    classes = classes_of(coarsening)
+    result = {}
+    for key, mass in masses.items():
+        fine_elements = set()
+        for coarse_element in focal_key(key):
+            fine_elements |= classes.get(coarse_element, {coarse_element})
+        fine_key = tuple(sorted(fine_elements))
+        result[fine_key] = result.get(fine_key, 0.0) + mass
+    return result
+
+
+def coarsen_evidence(evidence, coarsening, reduction="outer"):
+    """
+    :param evidence: dict of evidence key -> fine masses, as passed to the combination methods
+    :return: dict: evidence key -> coarse masses
+    """
+    result = {}
+    for evidence_key, masses in evidence.items():
+        result[evidence_key] = coarsen(masses, coarsening, reduction)
+    return result
+
+
+def compatible(masses, coarsening):
+    """
+    :return: boolean whether every focal element is a union of classes, so coarsening loses nothing
+    """
+    for key in masses.keys():
+        if list(refine(coarsen({key: 1.0}, coarsening), coarsening).keys()) != [tuple(sorted(set(focal_key(key))))]:
+            return False
+    return True
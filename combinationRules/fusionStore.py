@@ -0,0 +1,160 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+from combinationRules import import_and_windowed_combine, import_and_calculate_probabilities
+from combinationRules.utilities import state_nbytes
+from copy import deepcopy
+from threading import Lock
+
+DEFAULT_NUMBER_OF_STRIPES = 64
+
+
+class FusionStore(object):
+    """
+    Thread-safe owner of the per-track internal data of a combination method.
+    Murphy and Zhang change all_data in place, so concurrent updates to one track must be serialized.  Rather than
+     one global lock, tracks are spread across a fixed number of stripes.  Each stripe has its own lock and its own
+     track dictionary, so threads working on tracks in different stripes never contend and no structure is shared
+     between stripes (which is what lets this scale on free-threaded Python builds).
+    """
+    def __init__(self, method, max_number_of_evidences=None, number_of_stripes=DEFAULT_NUMBER_OF_STRIPES,
+                 notifier=None):
+        """
+        :param method: str: the method in COMBINATION_METHODS
+        :param max_number_of_evidences: None if no window, > 1 if a window is defined
+        :param number_of_stripes: int: number of independently locked partitions of the tracks
+        :param notifier: ChangeNotifier told of the probabilities of every updated track, or None
+        """
+        if number_of_stripes < 1:
+            raise ValueError("FusionStore: number_of_stripes must be at least 1")
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.notifier = notifier
+        self._locks = [Lock() for _ in range(number_of_stripes)]
+        self._tracks = [{} for _ in range(number_of_stripes)]
+
+    def _stripe(self, track_id):
+        return hash(track_id) % len(self._locks)
+
+    def update(self, track_id, evidence, input_weight=0.0):
+        """
+        Atomically combines new evidence into a track and returns the resulting probabilities
+        :param track_id: hashable id of the track
+        :param evidence: dict: the new evidence, keyed by evidence id
+        :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+        :return: dict: a copy of the probabilities of the track after the update
+        """
+        stripe = self._stripe(track_id)
+        change = None
+        with self._locks[stripe]:
+            tracks = self._tracks[stripe]
+            all_data = import_and_windowed_combine(self.method, evidence, self.max_number_of_evidences,
+                                                   tracks.get(track_id), input_weight)
+            tracks[track_id] = all_data
+            probabilities = self._copy_probabilities(all_data)
+            # Compared under the lock so the baselines follow the order of the updates
+            if (self.notifier is not None) and (probabilities is not None):
+                change = self.notifier.observe(track_id, probabilities)
+        if change is not None:
+            self.notifier.publish(track_id, change[0], change[1])
+        return probabilities
+
+    def add(self, track_id, evidence, input_weight=0.0):
+        """
+        Combines new evidence into a track without reading it back.  Methods that keep evidence defer their
+         combination until the next read, so bursts of writes only pay for one combination.  With a notifier the
+         probabilities are needed at every update, so this is the same as update().
+        :param track_id: hashable id of the track
+        :param evidence: dict: the new evidence, keyed by evidence id
+        :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+        """
+        if self.notifier is not None:
+            self.update(track_id, evidence, input_weight)
+            return
+        stripe = self._stripe(track_id)
+        with self._locks[stripe]:
+            tracks = self._tracks[stripe]
+            tracks[track_id] = import_and_windowed_combine(self.method, evidence, self.max_number_of_evidences,
+                                                           tracks.get(track_id), input_weight, lazy=True)
+
+    def probabilities(self, track_id):
+        """
+        :param track_id: hashable id of the track
+        :return: dict: a copy of the current probabilities of the track, or None if the track is unknown
+        """
+        stripe = self._stripe(track_id)
+        with self._locks[stripe]:
+            all_data = self._tracks[stripe].get(track_id)
+            if all_data is None:
+                return None
+            return self._copy_probabilities(all_data)
+
+    def get(self, track_id):
+        """
+        :param track_id: hashable id of the track
+        :return: dict: a deep copy of the internal data of the track, or None if the track is unknown
+        """
+        stripe = self._stripe(track_id)
+        with self._locks[stripe]:
+            return deepcopy(self._tracks[stripe].get(track_id))
+
+    def state_nbytes(self, track_id):
+        """
+        :param track_id: hashable id of the track
+        :return: int: approximate bytes held by the internal data of the track, 0 if the track is unknown
+        """
+        stripe = self._stripe(track_id)
+        with self._locks[stripe]:
+            all_data = self._tracks[stripe].get(track_id)
+            if all_data is None:
+                return 0
+            return state_nbytes(all_data)
+
+    def remove(self, track_id):
+        """
+        Removes a track from the store
+        :param track_id: hashable id of the track
+        :return: dict: the internal data of the removed track, or None if the track is unknown
+        """
+        stripe = self._stripe(track_id)
+        with self._locks[stripe]:
+            if self.notifier is not None:
+                self.notifier.forget(track_id)
+            return self._tracks[stripe].pop(track_id, None)
+
+    def track_ids(self):
+        """
+        :return: list: the ids of all tracks.  Each stripe is read under its own lock, so this is not a snapshot of
+         the whole store at a single instant.
+        """
+        result = []
+        for stripe in range(0, len(self._locks)):
+            with self._locks[stripe]:
+                result.extend(self._tracks[stripe].keys())
+        return result
+
+    def __len__(self):
+        return len(self.track_ids())
+
+    def _copy_probabilities(self, all_data):
+        # Some methods return their internal dictionary, so copy before the lock is released
+        probabilities = import_and_calculate_probabilities(self.method, all_data)
+        if probabilities is None:
+            return None
+        return dict(probabilities)
@@ -0,0 +1,231 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+from combinationRules.utilities import focal_key, from_bitmask
+
+# Sliding window for Dempster's and Yager's rules that can remove the oldest evidence.
+# The commonality of the conjunctive combination is the product of the commonalities of the inputs,
+#  Q(A) = prod_i Q_i(A) with Q_i(A) the sum of m_i(B) over the focal elements B containing A.  The combined masses
+#  are supported on intersections of focal elements, so Q only needs to be kept on the intersection closure of the
+#  focal elements seen.  Each evidence keeps its contributions Q_i, so adding an evidence multiplies them in and
+#  evicting the oldest divides them out, in O(closure x focal elements) instead of re-fusing the window.  Where an
+#  evicted contribution is zero the product is recomputed from the remaining evidence.  Division errors accumulate,
+#  so the whole window is recomputed (and the closure pruned) once per window length of evictions.
+# The masses are the Moebius inverse of Q over the closure, with the conflict on the empty set either normalized
+#  away (Dempster) or given to the whole frame (Yager, once for the window rather than after every pairwise step).
+#  Unlike the pairwise combinations, mass is kept on every intersection, whether or not it is an input key.
+
+RULES = ("DEMPSTER_SHAFER", "YAGER")
+
+
+def initialize_data(rule):
+    """
+    :param rule: str: "DEMPSTER_SHAFER" or "YAGER"
+    :return: dict: empty internal data of the invertible window
+    """
+    if rule not in RULES:
+        raise ValueError("invertibleWindow: unknown rule " + str(rule))
+    return {
+        "invertible": rule,
+        "frame": [],
+        "frame_index": {},
+        "evidence": {},  # evidence number -> {bitmask: mass}
+        "contributions": {},  # evidence number -> {closure bitmask: commonality of that evidence}
+        "commonality": {},  # closure bitmask -> product of the contributions
+        "number_of_evidences": 0,
+        "next_evidence": 0,
+        "evictions": 0,
+        "combined": None
+    }
+
+
+def windowed_combination(rule, evidence, max_number_of_evidences=None, all_data=None):
+    """
+    :param rule: str: "DEMPSTER_SHAFER" or "YAGER"
+    :param evidence: dict of new evidence to add
+    :param max_number_of_evidences: None if no window, > 1 if a window is defined
+    :param all_data: the internal data of the invertible window, or the combined masses of the pairwise mode (kept as
+     a single evidence), or None
+    :return: dict: the updated internal data
+    """
+    if (all_data is None) or ("invertible" not in all_data):
+        previous = all_data
+        all_data = initialize_data(rule)
+        if previous:
+            add_evidence(all_data, previous)
+    for evidence_key in evidence.keys():
+        add_evidence(all_data, evidence[evidence_key])
+        if (max_number_of_evidences is not None) and (max_number_of_evidences > 1):
+            while all_data["number_of_evidences"] > max_number_of_evidences:
+                evict_oldest(all_data, max_number_of_evidences)
+    return all_data
+
+
+def contribution(masses, mask):
+    # Commonality of one evidence: the mass of its focal elements containing the mask
+    total = 0.0
+    for focal_mask, mass in masses.items():
+        if (focal_mask & mask) == mask:
+            total += mass
+    return total
+
+
+def add_evidence(all_data, masses):
+    """
+    Multiplies the contributions of a new evidence into the commonality, extending the closure with its focal elements
+    """
+    frame_index = all_data["frame_index"]
+    bitmask_masses = {}
+    for key, mass in masses.items():
+        if mass == 0.0:
+            continue
+        mask = 0
+        for element in focal_key(key):
+            if element not in frame_index:
+                frame_index[element] = len(all_data["frame"])
+                all_data["frame"].append(element)
+            mask |= 1 << frame_index[element]
+        bitmask_masses[mask] = bitmask_masses.get(mask, 0.0) + mass
+
+    commonality = all_data["commonality"]
+    for mask in extend_closure(commonality.keys(), bitmask_masses.keys()):
+        product = 1.0
+        for evidence_number, evidence_masses in all_data["evidence"].items():
+            value = contribution(evidence_masses, mask)
+            all_data["contributions"][evidence_number][mask] = value
+            product *= value
+        commonality[mask] = product
+
+    evidence_number = all_data["next_evidence"]
+    contributions = {}
+    for mask in commonality.keys():
+        value = contribution(bitmask_masses, mask)
+        contributions[mask] = value
+        commonality[mask] *= value
+    all_data["evidence"][evidence_number] = bitmask_masses
+    all_data["contributions"][evidence_number] = contributions
+    all_data["next_evidence"] += 1
+    all_data["number_of_evidences"] += 1
+    all_data["combined"] = None
+
+
+def extend_closure(closure, new_masks):
+    """
+    :param closure: iterable of bitmasks closed under intersection
+    :param new_masks: iterable of bitmasks to add
+    :return: list of the bitmasks to add so that the closure stays closed under intersection (the empty set is left out)
+    """
+    closure = set(closure)
+    added = []
+    for new_mask in new_masks:
+        if new_mask in closure:
+            continue
+        candidates = [new_mask] + [new_mask & mask for mask in closure]
+        for candidate in candidates:
+            if (candidate != 0) and (candidate not in closure):
+                closure.add(candidate)
+                added.append(candidate)
+    return added
+
+
+def evict_oldest(all_data, max_number_of_evidences):
+    """
+    Divides the contributions of the oldest evidence out of the commonality
+    """
+    oldest = all_data["next_evidence"] - all_data["number_of_evidences"]
+    all_data["evidence"].pop(oldest)
+    contributions = all_data["contributions"].pop(oldest)
+    all_data["number_of_evidences"] -= 1
+    all_data["combined"] = None
+    all_data["evictions"] += 1
+    if all_data["evictions"] >= max_number_of_evidences:
+        recompute(all_data)
+        return
+
+    commonality = all_data["commonality"]
+    for mask, value in contributions.items():
+        if value != 0.0:
+            commonality[mask] /= value
+        else:
+            # Nothing to divide by: the product over the remaining evidence
+            product = 1.0
+            for remaining in all_data["contributions"].values():
+                product *= remaining[mask]
+            commonality[mask] = product
+
+
+def recompute(all_data):
+    """
+    Rebuilds the closure and the commonality from the evidence in the window
+    """
+    evidence = all_data["evidence"]
+    commonality = {}
+    for masses in evidence.values():
+        for mask in extend_closure(commonality.keys(), masses.keys()):
+            commonality[mask] = 1.0
+    contributions = {}
+    for evidence_number, masses in evidence.items():
+        contributions[evidence_number] = {}
+        for mask in commonality.keys():
+            value = contribution(masses, mask)
+            contributions[evidence_number][mask] = value
+            commonality[mask] *= value
+    all_data["commonality"] = commonality
+    all_data["contributions"] = contributions
+    all_data["evictions"] = 0
+    all_data["combined"] = None
+
+
+def combined_masses(all_data):
+    """
+    :param all_data: the internal data of the invertible window
+    :return: dict: the combined masses keyed by sorted tuples
+    """
+    if all_data["combined"] is not None:
+        return all_data["combined"]
+    commonality = all_data["commonality"]
+    # Largest focal elements first: each mass is its commonality minus the masses of its strict supersets
+    masks = sorted(commonality.keys(), key=lambda mask: -bin(mask).count("1"))
+    masses = {}
+    for position, mask in enumerate(masks):
+        mass = commonality[mask]
+        for superset in masks[:position]:
+            if (superset & mask) == mask:
+                mass -= masses[superset]
+        masses[mask] = mass
+
+    frame = all_data["frame"]
+    total = sum(masses.values())
+    result = {}
+    if all_data["invertible"] == "DEMPSTER_SHAFER":
+        for mask, mass in masses.items():
+            result[tuple(sorted(from_bitmask(mask, frame)))] = mass / total if total > 0.0 else 0.0
+    else:
+        for mask, mass in masses.items():
+            result[tuple(sorted(from_bitmask(mask, frame)))] = mass
+        if all_data["evidence"] and (total < 1.0):
+            # The conflict goes to the universal set: every element in the window
+            universal_mask = 0
+            for evidence_masses in all_data["evidence"].values():
+                for mask in evidence_masses.keys():
+                    universal_mask |= mask
+            universal_set = tuple(sorted(from_bitmask(universal_mask, frame)))
+            result[universal_set] = result.get(universal_set, 0.0) + 1.0 - total
+    all_data["combined"] = result
+    return result
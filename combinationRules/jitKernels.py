@@ -0,0 +1,279 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Optional Numba-compiled versions of the inner loops of dsCombination.combination, yagerCombination.combination and
+#  the credibility weighted average of zhangCombination.  The kernels are opt in: importing numba and compiling take
+#  seconds, which would otherwise land on whichever call first crosses JIT_MIN_PRODUCTS.  Set USE_JIT = None to use
+#  them on large loops when numba is installed, or True to always use them, and call warm_up() at start up so that
+#  the import and the compilation happen before any deadline instead of on the first large loop.  Compiled kernels
+#  are cached on disk (numba's cache=True, next to this module or in NUMBA_CACHE_DIR), so later processes load them
+#  instead of compiling again.
+# The kernels work on bitmasks and float arrays, and do the same floating point operations in the same order as the
+#  Python loops (and leave the sums that Python's sum() does to sum()), so the results are identical.  Each wrapper
+#  returns None when the kernel is not used: numba is missing, the loop is too small to pay for the conversion to
+#  arrays, or the keys are not tuples over at most MAX_FRAME elements.  The pignistic vectors stay in Python, since
+#  building them costs the same as converting the evidence to arrays.
+
+from combinationRules.utilities import import_numba, import_numpy
+
+# False: never use the kernels (the default), None: when numba is installed and the loop is at least
+#  JIT_MIN_PRODUCTS, True: always
+USE_JIT = False
+JIT_MIN_PRODUCTS = 256
+# Bitmasks are int64
+MAX_FRAME = 62
+
+_kernels = None
+
+
+def load_kernels():
+    """
+    :return: dict of name -> compiled kernel, or None if numba is not installed
+    """
+    global _kernels
+    if _kernels is None:
+        numba = import_numba()
+        _kernels = False if numba is None else compile_kernels(numba)
+    return _kernels or None
+
+
+def warm_up():
+    """
+    Imports numba and compiles (or loads from the disk cache) every kernel now, for the types the wrappers pass
+    :return: boolean whether the kernels are available
+    """
+    kernels = load_kernels()
+    if kernels is None:
+        return False
+    numpy = import_numpy()
+    masks = numpy.array([1, 3], dtype=numpy.int64)
+    masses = numpy.array([0.5, 0.5], dtype=numpy.float64)
+    positions = numpy.array([0, 1], dtype=numpy.int64)
+    kernels["ds_products"](masks, masses, masks, masses, masks, positions, 2)
+    kernels["yager_products"](masks, masses, positions, masks, masses, positions, 2)
+    ones = numpy.ones(2, dtype=numpy.float64)
+    kernels["zhang_weighted_average"](numpy.ones((2, 2), dtype=numpy.float64), ones, ones,
+                                      numpy.ones((2, 2), dtype=numpy.float64))
+    return True
+
+
+def kernels_for(products):
+    """
+    :param products: int: the number of iterations of the loop to replace
+    :return: the kernels to use for a loop of that size, or None to use the Python loop
+    """
+    if USE_JIT is False:
+        return None
+    kernels = load_kernels()
+    if kernels is None:
+        if USE_JIT is True:
+            raise ImportError("jitKernels: USE_JIT is set but numba is not installed")
+        return None
+    if (USE_JIT is None) and (products < JIT_MIN_PRODUCTS):
+        return None
+    return kernels
+
+
+def compile_kernels(numba):
+    numpy = import_numpy()
+
+    @numba.njit(cache=True)
+    def ds_products(masks_1, masses_1, masks_2, masses_2, sorted_masks, positions, size):
+        # result[position of the intersection] += m1 * m2 when the intersection is a key
+        result = numpy.zeros(size)
+        touched = numpy.zeros(size, dtype=numpy.bool_)
+        for i in range(masks_1.shape[0]):
+            for j in range(masks_2.shape[0]):
+                intersection = masks_1[i] & masks_2[j]
+                index = numpy.searchsorted(sorted_masks, intersection)
+                if (index < sorted_masks.shape[0]) and (sorted_masks[index] == intersection):
+                    result[positions[index]] += masses_1[i] * masses_2[j]
+                    touched[positions[index]] = True
+        return result, touched
+
+    @numba.njit(cache=True)
+    def yager_products(masks_1, masses_1, positions_1, masks_2, masses_2, positions_2, size):
+        # The product goes to the smaller of two nested focal elements, nothing otherwise
+        result = numpy.zeros(size)
+        touched = numpy.zeros(size, dtype=numpy.bool_)
+        for i in range(masks_1.shape[0]):
+            for j in range(masks_2.shape[0]):
+                intersection = masks_1[i] & masks_2[j]
+                if intersection == masks_1[i]:
+                    result[positions_1[i]] += masses_1[i] * masses_2[j]
+                    touched[positions_1[i]] = True
+                elif intersection == masks_2[j]:
+                    result[positions_2[j]] += masses_1[i] * masses_2[j]
+                    touched[positions_2[j]] = True
+        return result, touched
+
+    @numba.njit(cache=True)
+    def zhang_weighted_average(vectors, multiplicity, input_weights, masses):
+        number_of_evidences = vectors.shape[0]
+        cosines = numpy.ones((number_of_evidences, number_of_evidences))
+        for i in range(number_of_evidences):
+            for j in range(number_of_evidences):
+                if i != j:
+                    dot = 0.0
+                    length_i = 0.0
+                    length_j = 0.0
+                    for index in range(vectors.shape[1]):
+                        dot += vectors[i, index] * vectors[j, index]
+                        length_i += vectors[i, index] ** 2
+                        length_j += vectors[j, index] ** 2
+                    cosines[i, j] = dot / (numpy.sqrt(length_i) * numpy.sqrt(length_j))
+        supports = numpy.zeros(number_of_evidences)
+        sum_sup = 0.0
+        for i in range(number_of_evidences):
+            for j in range(number_of_evidences):
+                supports[i] += cosines[i, j] * multiplicity[j]
+            sum_sup += supports[i] * multiplicity[i]
+        credibility = supports / sum_sup
+        average = numpy.zeros(masses.shape[0])
+        average_sum = 0.0
+        for row in range(masses.shape[0]):
+            for i in range(number_of_evidences):
+                add_mass = credibility[i] * masses[row, i] * input_weights[i] * multiplicity[i]
+                average[row] += add_mass
+                average_sum += add_mass
+        return average / average_sum
+
+    return {
+        "ds_products": ds_products,
+        "yager_products": yager_products,
+        "zhang_weighted_average": zhang_weighted_average
+    }
+
+
+def key_masks(keys):
+    """
+    :param keys: list of tuple keys
+    :return: dict of key -> bitmask of its set of elements, or None if a key is not a tuple or there are too many
+     elements
+    """
+    frame_index = {}
+    masks = {}
+    for key in keys:
+        if not isinstance(key, tuple):
+            return None
+        mask = 0
+        for element in key:
+            if element not in frame_index:
+                if len(frame_index) == MAX_FRAME:
+                    return None
+                frame_index[element] = len(frame_index)
+            mask |= 1 << frame_index[element]
+        masks[key] = mask
+    return masks
+
+
+def products_to_dict(keys, values, touched):
+    # Entries never added to keep the int 0 of dict.fromkeys(sets, 0), as in the Python loops
+    result = {}
+    for position, key in enumerate(keys):
+        result[key] = values[position] if touched[position] else 0
+    return result
+
+
+def ds_products(dic1, dic2, sets):
+    """
+    The loop of dsCombination.combination
+    :return: dict: the unnormalized result in the order of sets, or None to use the Python loop
+    """
+    kernels = kernels_for(len(dic1) * len(dic2))
+    if kernels is None:
+        return None
+    keys = list(sets)
+    masks = key_masks(keys)
+    if masks is None:
+        return None
+    numpy = import_numpy()
+    # Only a key equal to the sorted tuple of its elements can receive mass, as with tuple(sorted(intersection))
+    canonical = {}
+    for position, key in enumerate(keys):
+        if key == tuple(sorted(set(key))):
+            canonical[masks[key]] = position
+    sorted_masks = sorted(canonical.keys())
+    values, touched = kernels["ds_products"](
+        numpy.array([masks[key] for key in dic1.keys()], dtype=numpy.int64),
+        numpy.array(list(dic1.values()), dtype=numpy.float64),
+        numpy.array([masks[key] for key in dic2.keys()], dtype=numpy.int64),
+        numpy.array(list(dic2.values()), dtype=numpy.float64),
+        numpy.array(sorted_masks, dtype=numpy.int64),
+        numpy.array([canonical[mask] for mask in sorted_masks], dtype=numpy.int64),
+        len(keys))
+    return products_to_dict(keys, values.tolist(), touched.tolist())
+
+
+def yager_products(dic1, dic2, sets):
+    """
+    The loop of yagerCombination.combination
+    :return: dict: the result before the conflict is given to the universal set, in the order of sets, or None to use
+     the Python loop
+    """
+    kernels = kernels_for(len(dic1) * len(dic2))
+    if kernels is None:
+        return None
+    keys = list(sets)
+    masks = key_masks(keys)
+    if masks is None:
+        return None
+    numpy = import_numpy()
+    positions = {}
+    for position, key in enumerate(keys):
+        positions[key] = position
+    values, touched = kernels["yager_products"](
+        numpy.array([masks[key] for key in dic1.keys()], dtype=numpy.int64),
+        numpy.array(list(dic1.values()), dtype=numpy.float64),
+        numpy.array([positions[key] for key in dic1.keys()], dtype=numpy.int64),
+        numpy.array([masks[key] for key in dic2.keys()], dtype=numpy.int64),
+        numpy.array(list(dic2.values()), dtype=numpy.float64),
+        numpy.array([positions[key] for key in dic2.keys()], dtype=numpy.int64),
+        len(keys))
+    return products_to_dict(keys, values.tolist(), touched.tolist())
+
+
+def zhang_weighted_average(all_data, pignist_vector, multiplicity, powerset):
+    """
+    Same as zhangCombination.weighted_average
+    :return: dict: the weighted average mass of each element of the powerset, or None to use the Python loop
+    """
+    evidence_keys = list(all_data["evidence"].keys())
+    if not evidence_keys:
+        return None
+    number_of_thetas = len(pignist_vector[evidence_keys[0]])
+    kernels = kernels_for(len(evidence_keys) * len(evidence_keys) * number_of_thetas)
+    if kernels is None:
+        return None
+    numpy = import_numpy()
+    powerset_index = {}
+    for row, input_name in enumerate(powerset):
+        powerset_index[input_name] = row
+    masses = numpy.zeros((len(powerset), len(evidence_keys)), dtype=numpy.float64)
+    for column, i in enumerate(evidence_keys):
+        for input_name, mass in all_data["evidence"][i].items():
+            if input_name in powerset_index:
+                masses[powerset_index[input_name], column] = mass
+    average = kernels["zhang_weighted_average"](
+        numpy.array([pignist_vector[i] for i in evidence_keys], dtype=numpy.float64),
+        numpy.array([multiplicity[i] for i in evidence_keys], dtype=numpy.float64),
+        numpy.array([all_data["evidence_weights"][i] if i in all_data["evidence_weights"] else 1.0
+                     for i in evidence_keys], dtype=numpy.float64),
+        masses)
+    return dict(zip(powerset, average.tolist()))
@@ -17,13 +17,13 @@
 # along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
 # --------------------------------------------------------------------------
 
-from combinationRules.dsCombination import combination
+from combinationRules.dsCombination import repeated_combination
 from copy import deepcopy
 
 ROUNDOFF_DELTA = 1e-4
 
 
-def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None, lazy=False):
     """
     Pseudo-windows the evidence.  Only allows the maximum amount (the latest evidences).  Does not remove old evidence,
      but rather limits the number of combinations, thereby acting as though the old evidence is historical evidence.
@@ -32,12 +32,13 @@ def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=
     :param max_number_of_evidences: the max number of evidences to window
     :param all_data: the data to combine with
     :param weights: dict of weights associated with the new evidence
+    :param lazy: boolean whether to defer the combination until the probabilities are requested
     """
     if (all_data is not None) and ("number_of_evidences" in all_data) and (max_number_of_evidences is not None) and\
             (max_number_of_evidences > 1):
         all_data["number_of_evidences"] = max(min(all_data["number_of_evidences"],
                                                   max_number_of_evidences - len(evidence)), 0)
-    return multi_combination(evidence, all_data, weights)
+    return multi_combination(evidence, all_data, weights, lazy)
 
 
 def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
@@ -53,10 +54,86 @@ def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
     return windowed_multi_combination(evidence, max_number_of_evidences, all_data_1, weight)
 
 
+def decayed_multi_combination(evidence, decay_rate, all_data=None, weights=None, timestamp=None, lazy=False):
+    """
+    Combines with exponential forgetting instead of a window.  The weight of the stored average and the effective
+     number of evidences shrink geometrically, so the state is O(1) and the number of self-combinations stays
+     bounded by 1 / (1 - decay_rate) on an infinite stream.
+    :param evidence: dict of new evidence to add
+    :param decay_rate: float in (0, 1]: factor applied to the old evidence per new evidence, or per unit of time if a
+     timestamp is given
+    :param all_data: the data to combine with
+    :param weights: dict of weights associated with the new evidence
+    :param timestamp: None for count-based decay, else the time of the new evidence for time-based decay
+    :param lazy: boolean whether to defer the combination until the probabilities are requested
+    """
+    if (decay_rate <= 0.0) or (decay_rate > 1.0):
+        raise ValueError("decayed_multi_combination: decay_rate must be in (0, 1]")
+    all_data = initialize_data(all_data)
+    if "effective_number_of_evidences" not in all_data:
+        all_data["effective_number_of_evidences"] = float(all_data["number_of_evidences"])
+    if timestamp is not None:
+        # Time-based: decay once for the time elapsed, evidence at the same time is not decayed against itself
+        if "last_timestamp" in all_data:
+            decay_evidence(all_data, pow(decay_rate, max(timestamp - all_data["last_timestamp"], 0.0)))
+        all_data["last_timestamp"] = timestamp
+    for evidence_key in evidence.keys():
+        if timestamp is None:
+            decay_evidence(all_data, decay_rate)
+        add_evidence(all_data, evidence[evidence_key], evidence_weight(weights, evidence_key))
+        all_data["effective_number_of_evidences"] += 1.0
+    update_combined(all_data, lazy)
+    return all_data
+
+
+def decay_evidence(all_data, factor):
+    # The average itself is unchanged, only its weight relative to new evidence shrinks
+    all_data["evidence_weight"] *= factor
+    all_data["effective_number_of_evidences"] *= factor
+
+
 # Combine multiple inputs via Murphy's combination rule
 # For the purposes of Murphy's rule, evidence and all_data use the same format, just are split for a common
 #  interface with ECR
-def multi_combination(evidence, all_data=None, weights=None):
+def multi_combination(evidence, all_data=None, weights=None, lazy=False):
+    all_data = initialize_data(all_data)
+
+    # Combine all evidence into the existing evidence to create the full set of input data
+    # A run of identical consecutive evidence is averaged in one step with the run's total weight, which gives the
+    #  same average as adding each evidence in turn
+    evidence_keys = list(evidence.keys())
+    start = 0
+    while start < len(evidence_keys):
+        masses = evidence[evidence_keys[start]]
+        run_weight = evidence_weight(weights, evidence_keys[start])
+        end = start + 1
+        while (end < len(evidence_keys)) and (evidence[evidence_keys[end]] == masses):
+            run_weight += evidence_weight(weights, evidence_keys[end])
+            end += 1
+        add_evidence(all_data, masses, run_weight, end - start)
+        if "effective_number_of_evidences" in all_data:
+            all_data["effective_number_of_evidences"] += end - start
+        start = end
+
+    update_combined(all_data, lazy)
+
+    # Return the full internal data
+    return all_data
+
+
+def summary_data(all_data):
+    """
+    The weighted average already summarizes the history in a state that does not grow with it, so only the last
+     evidence, kept for plotting, is dropped.  The results are unchanged.
+    :param all_data: the data to collapse
+    :return: the collapsed data
+    """
+    all_data = initialize_data(all_data)
+    all_data["last_evidence"] = {}
+    return all_data
+
+
+def initialize_data(all_data):
     # Create the return if necessary
     if all_data is None:
         all_data = {
@@ -78,45 +155,105 @@ def multi_combination(evidence, all_data=None, weights=None):
             all_data["combined"] = {}
         if "last_evidence" not in all_data:
             all_data["last_evidence"] = {}
+    return all_data
 
-    # Combine all evidence into the existing evidence to create the full set of input data
-    for evidence_key in evidence.keys():
-        # Get the weight for this evidence
-        mass_weight = 1.0
-        if (weights is not None) and (evidence_key in weights):
-            mass_weight = weights[evidence_key]
-        # Combine/weighted average each new piece of evidence
-        all_keys = list(all_data["evidence"].keys())
-        all_data["last_evidence"] = {}  # Reset
-        for mass_key, mass_value in evidence[evidence_key].items():
-            if isinstance(mass_key, tuple) is True:
-                store_key = tuple(sorted(mass_key))
-            else:
-                store_key = (mass_key,)
-            current_evidence = 0.0
-            # Weighted average the new data
-            if store_key in all_data["evidence"]:
-                current_evidence = all_data["evidence"][store_key] * all_data["evidence_weight"]
-                all_keys.remove(store_key)
-            all_data["evidence"][store_key] = (current_evidence + mass_value * mass_weight) /\
-                                              (all_data["evidence_weight"] + mass_weight)
-            all_data["last_evidence"][store_key] = mass_value
-        # Update the ones that didn't get updated
-        for mass_key in all_keys:
-            all_data["evidence"][mass_key] = (all_data["evidence"][mass_key] * all_data["evidence_weight"]) / \
-                                             (all_data["evidence_weight"] + mass_weight)
-        all_data["number_of_evidences"] += 1
-        all_data["evidence_weight"] += mass_weight
 
+def evidence_weight(weights, evidence_key):
+    # Get the weight for this evidence
+    if (weights is not None) and (evidence_key in weights):
+        return weights[evidence_key]
+    return 1.0
+
+
+def add_evidence(all_data, masses, mass_weight, count=1):
+    # Combine/weighted average each new piece of evidence, or a run of count identical ones with their total weight
+    all_keys = list(all_data["evidence"].keys())
+    all_data["last_evidence"] = {}  # Reset
+    for mass_key, mass_value in masses.items():
+        if isinstance(mass_key, tuple) is True:
+            store_key = tuple(sorted(mass_key))
+        else:
+            store_key = (mass_key,)
+        current_evidence = 0.0
+        # Weighted average the new data
+        if store_key in all_data["evidence"]:
+            current_evidence = all_data["evidence"][store_key] * all_data["evidence_weight"]
+            all_keys.remove(store_key)
+        all_data["evidence"][store_key] = (current_evidence + mass_value * mass_weight) /\
+                                          (all_data["evidence_weight"] + mass_weight)
+        all_data["last_evidence"][store_key] = mass_value
+    # Update the ones that didn't get updated
+    for mass_key in all_keys:
+        all_data["evidence"][mass_key] = (all_data["evidence"][mass_key] * all_data["evidence_weight"]) / \
+                                         (all_data["evidence_weight"] + mass_weight)
+    all_data["number_of_evidences"] += count
+    all_data["evidence_weight"] += mass_weight
+
+
+def add_evidence_rows(all_data, focal_elements, rows, row_weights, max_number_of_evidences=None):
+    """
+    Same as windowing and adding each row with add_evidence, for rows of masses over a fixed list of focal elements.
+     The weighted average of all rows is folded into the stored average in one step.
+    :param all_data: the data to add to
+    :param focal_elements: list of the focal element keys, one per column of the rows
+    :param rows: list of rows of masses
+    :param row_weights: list of the weight of each row
+    :param max_number_of_evidences: the max number of evidences to window
+    """
+    if not rows:
+        return
+    sums = [0.0] * len(focal_elements)
+    total_weight = 0.0
+    for row, mass_weight in zip(rows, row_weights):
+        for index in range(0, len(sums)):
+            sums[index] += row[index] * mass_weight
+        total_weight += mass_weight
+
+    new_weight = all_data["evidence_weight"] + total_weight
+    for mass_key in all_data["evidence"].keys():
+        all_data["evidence"][mass_key] = (all_data["evidence"][mass_key] * all_data["evidence_weight"]) / new_weight
+    all_data["last_evidence"] = {}  # Reset
+    for index, mass_key in enumerate(focal_elements):
+        if isinstance(mass_key, tuple) is True:
+            store_key = tuple(sorted(mass_key))
+        else:
+            store_key = (mass_key,)
+        all_data["evidence"][store_key] = all_data["evidence"].get(store_key, 0.0) + sums[index] / new_weight
+        all_data["last_evidence"][store_key] = rows[-1][index]
+    all_data["evidence_weight"] = new_weight
+
+    all_data["number_of_evidences"] += len(rows)
+    if (max_number_of_evidences is not None) and (max_number_of_evidences > 1):
+        all_data["number_of_evidences"] = min(all_data["number_of_evidences"], max_number_of_evidences)
+    if "effective_number_of_evidences" in all_data:
+        all_data["effective_number_of_evidences"] += len(rows)
+
+
+def update_combined(all_data, lazy=False):
+    """
+    Recombines the evidence, or only marks the combined result as stale if lazy
+    :param all_data: the data to update
+    :param lazy: boolean whether to defer the combination until final_probabilities is called
+    """
+    if lazy is True:
+        all_data["dirty"] = True
+    else:
+        combine_evidence(all_data)
+
+
+def combine_evidence(all_data):
+    # Decayed data counts its evidences by their remaining weight
+    if "effective_number_of_evidences" in all_data:
+        number_of_combinations = max(int(round(all_data["effective_number_of_evidences"])), 1)
+    else:
+        number_of_combinations = all_data["number_of_evidences"]
     # Loop and combine
     # Murphy uses averages, so all have to be combined at the same time
     all_data["combined"] = deepcopy(all_data["evidence"])
     second_input = deepcopy(all_data["evidence"])
-    for input_counter in range(1, all_data["number_of_evidences"]):  # One less since starting from 1: correct times
-        all_data["combined"] = combination(all_data["combined"], second_input)
-
-    # Return the full internal data
-    return all_data
+    # One less since starting from one: correct times
+    all_data["combined"] = repeated_combination(all_data["combined"], second_input, number_of_combinations - 1)
+    all_data.pop("dirty", None)
 
 
 def final_probabilities(all_data):
@@ -125,6 +262,9 @@ def final_probabilities(all_data):
     :param all_data: The data of all information based on this combination method
     :return: The dictionary of probabilities for all options.
     """
+    if (all_data is not None) and (all_data.get("dirty") is True):
+        # Lazy updates deferred the combination until now
+        combine_evidence(all_data)
     if (all_data is not None) and ("combined" in all_data):
         return all_data["combined"]
     else:
@@ -0,0 +1,231 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+from combinationRules.utilities import focal_key, frame_of, to_bitmask, from_bitmask, conjunctive_bitmask
+from itertools import product
+from math import exp, log
+
+# Combine multiple inputs via the proportional conflict redistribution rule no. 6 (PCR6).
+# Each product of masses whose focal elements have an empty intersection is given back to those focal elements, in
+#  proportion to the mass each source put on its own focal element:
+#   m(X) = conj(X) + sum_i m_i(X)^2 * sum_{others with X & (intersection of theirs) empty} prod_j m_j(Y_j) / S
+#  where S = m_i(X) + sum_j m_j(Y_j).
+# PCR6 is not associative, so all retained evidence is combined at once.  Enumerating the conflicting products is
+#  exponential in the number of sources, so beyond EXACT_ENUMERATION_LIMIT products the 1 / S factor is written as
+#  the integral of exp(-t * S) over t > 0.  For a fixed t the sum then factorizes into conjunctive combinations of the
+#  sources with masses m_j(Y) * exp(-t * m_j(Y)), and the leave-one-out combinations come from prefix and suffix
+#  combinations.  The integral is taken with the trapezoidal rule in x = log(t), which converges exponentially, so the
+#  cost is polynomial: (number of quadrature nodes) x O(sources) conjunctive combinations.
+
+EXACT_ENUMERATION_LIMIT = 4096
+QUADRATURE_STEP = 0.3
+QUADRATURE_TOLERANCE = 1e-13
+# exp(-QUADRATURE_TAIL) is negligible next to the smallest possible 1 / S
+QUADRATURE_TAIL = 40.0
+
+
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+    """
+    Windows the evidence.  Only allows the maximum amount (the latest evidences)
+    :param evidence: dict of new evidence to add
+    :param max_number_of_evidences: the max number of evidences to window
+    :param all_data: the data to combine with
+    :param weights: dict of weights associated with the new evidence
+    """
+    if (all_data is not None) and ("number_of_evidences" in all_data) and (max_number_of_evidences is not None) and\
+            (max_number_of_evidences > 1):
+        # May need to limit the data
+        if (len(evidence) + all_data["number_of_evidences"]) > max_number_of_evidences:
+            num_to_retain = max(max_number_of_evidences - len(evidence), 0)
+            reduce_by = all_data["number_of_evidences"] - num_to_retain
+            for counter in range(reduce_by, all_data["number_of_evidences"]):
+                all_data["evidence"][counter - reduce_by] = all_data["evidence"][counter]
+            for counter in range(num_to_retain, all_data["number_of_evidences"]):
+                all_data["evidence"].pop(counter, None)
+            all_data["number_of_evidences"] = num_to_retain
+    return multi_combination(evidence, all_data, weights)
+
+
+def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
+    # Take the evidence and add it to the first dataset
+    return windowed_multi_combination(all_data_2["evidence"], max_number_of_evidences, all_data_1)
+
+
+def multi_combination(evidence, all_data=None, weights=None):
+    # Weights do not affect PCR6.  All inputs assumed to be of equal weight.
+    # Create the return if necessary
+    if all_data is None:
+        all_data = {
+            "evidence": {},
+            "number_of_evidences": 0,
+            "combined": {},
+            "last_evidence": {}  # For plotting with the last update visible
+        }
+    else:
+        # Make sure all data is appropriately set
+        if "evidence" not in all_data:
+            all_data["evidence"] = {}
+        if "number_of_evidences" not in all_data:
+            all_data["number_of_evidences"] = len(all_data["evidence"])
+        if "combined" not in all_data:
+            all_data["combined"] = {}
+        if "last_evidence" not in all_data:
+            all_data["last_evidence"] = {}
+
+    # Add the evidence into the stored evidence, renumbering the evidence to keep the keys unique
+    for evidence_key in evidence.keys():
+        stored = {}
+        for input_key, mass in evidence[evidence_key].items():
+            stored[focal_key(input_key)] = mass
+        all_data["evidence"][all_data["number_of_evidences"]] = stored
+        all_data["last_evidence"] = dict(stored)
+        all_data["number_of_evidences"] += 1
+
+    all_data["combined"] = pcr6([all_data["evidence"][key] for key in sorted(all_data["evidence"].keys())])
+    return all_data
+
+
+def combination(dic1, dic2):
+    """
+    Two-source PCR6, which is the same as PCR5
+    """
+    return pcr6([dic1, dic2])
+
+
+def pcr6(sources, exact_enumeration_limit=EXACT_ENUMERATION_LIMIT):
+    """
+    :param sources: list of mass dicts, one per source; empty or all-zero sources are ignored
+    :param exact_enumeration_limit: max number of products of focal elements to enumerate exactly, None for no limit
+    :return: dict: the combined masses, keyed by sorted tuples
+    """
+    frame = frame_of(sources)
+    frame_index = {}
+    for position, element in enumerate(frame):
+        frame_index[element] = position
+    # As in the other rules' multi_combination, sources without mass are skipped instead of emptying the combination
+    bitmask_sources = [masses for masses in (to_bitmask(source, frame_index) for source in sources) if masses]
+
+    # Every input focal element is reported, with zero mass if it receives none
+    result = {}
+    for source in sources:
+        for key in source.keys():
+            result[focal_key(key)] = 0.0
+    if not bitmask_sources:
+        return result
+
+    # Conjunctive part: everything that does not end up on the empty set
+    conjunctive = bitmask_sources[0]
+    for masses in bitmask_sources[1:]:
+        conjunctive = conjunctive_bitmask(conjunctive, masses)
+    redistributed = {}
+    if len(bitmask_sources) > 1:
+        number_of_products = 1
+        for masses in bitmask_sources:
+            number_of_products *= len(masses)
+        if (exact_enumeration_limit is None) or (number_of_products <= exact_enumeration_limit):
+            redistributed = enumerated_redistribution(bitmask_sources)
+        else:
+            redistributed = quadrature_redistribution(bitmask_sources, (1 << len(frame)) - 1)
+
+    for mask in set(conjunctive.keys()) | set(redistributed.keys()):
+        if mask != 0:
+            key = from_bitmask(mask, frame)
+            result[key] = result.get(key, 0.0) + conjunctive.get(mask, 0.0) + redistributed.get(mask, 0.0)
+    return result
+
+
+def enumerated_redistribution(bitmask_sources):
+    """
+    Exact redistribution of the conflict by visiting every conflicting product of focal elements
+    :return: dict of bitmask -> redistributed mass
+    """
+    redistributed = {}
+    for focal_elements in product(*[list(masses.items()) for masses in bitmask_sources]):
+        intersection = -1
+        product_mass = 1.0
+        total_mass = 0.0
+        for mask, mass in focal_elements:
+            intersection &= mask
+            product_mass *= mass
+            total_mass += mass
+        if intersection == 0:
+            for mask, mass in focal_elements:
+                redistributed[mask] = redistributed.get(mask, 0.0) + mass * product_mass / total_mass
+    return redistributed
+
+
+def quadrature_redistribution(bitmask_sources, full_mask):
+    """
+    Redistribution of the conflict through the integral form of 1 / S, polynomial in sources and focal elements
+    :param bitmask_sources: list of bitmask mass dicts without zero masses
+    :param full_mask: the bitmask of the whole frame, the neutral element of the conjunctive combination
+    :return: dict of bitmask -> redistributed mass
+    """
+    # S lies between the sum of the smallest masses and the number of sources
+    smallest_total = sum(min(masses.values()) for masses in bitmask_sources)
+    largest_total = float(len(bitmask_sources))
+    x_min = log(QUADRATURE_TOLERANCE / largest_total)
+    x_max = log(QUADRATURE_TAIL / smallest_total)
+    number_of_nodes = int((x_max - x_min) / QUADRATURE_STEP) + 1
+
+    redistributed = {}
+    for node in range(0, number_of_nodes + 1):
+        t = exp(x_min + node * QUADRATURE_STEP)
+        # Trapezoidal weight in x, including dt = t dx
+        node_weight = QUADRATURE_STEP * t
+        if (node == 0) or (node == number_of_nodes):
+            node_weight *= 0.5
+        tilted = []
+        for masses in bitmask_sources:
+            tilted_masses = {}
+            for mask, mass in masses.items():
+                tilted_masses[mask] = mass * exp(-t * mass)
+            tilted.append(tilted_masses)
+
+        # suffixes[i] is the combination of tilted[i:]
+        suffixes = [{full_mask: 1.0}]
+        for tilted_masses in reversed(tilted):
+            suffixes.append(conjunctive_bitmask(tilted_masses, suffixes[-1]))
+        suffixes.reverse()
+        prefix = {full_mask: 1.0}
+        for source, masses in enumerate(bitmask_sources):
+            others = conjunctive_bitmask(prefix, suffixes[source + 1])
+            for mask, mass in masses.items():
+                disjoint = 0.0
+                for other_mask, other_mass in others.items():
+                    if (other_mask & mask) == 0:
+                        disjoint += other_mass
+                if disjoint != 0.0:
+                    redistributed[mask] = redistributed.get(mask, 0.0) + \
+                        node_weight * mass * tilted[source][mask] * disjoint
+            prefix = conjunctive_bitmask(prefix, tilted[source])
+    return redistributed
+
+
+def final_probabilities(all_data):
+    """
+    For a consistent interface with ECR
+    :param all_data: The data of all information based on this combination method
+    :return: The dictionary of probabilities for all options.
+    """
+    if (all_data is not None) and ("combined" in all_data):
+        return all_data["combined"]
+    else:
+        # Return none if no available data
+        return None
@@ -0,0 +1,355 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+import pickle
+import sqlite3
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Event, Lock, RLock, Thread
+
+from combinationRules import import_and_windowed_combine, import_and_calculate_probabilities
+from combinationRules.fusionStore import DEFAULT_NUMBER_OF_STRIPES
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_FLUSH_INTERVAL = 0.5
+PRELOAD_BATCH_SIZE = 1000
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+
+
+class PersistentFusionStore(object):
+    """
+    Keeps the per-track internal data of a combination method in a local SQLite file, so it survives a restart.
+    Updates only touch an in-memory cache of the hot tracks and mark them dirty.  A background thread writes the
+     dirty tracks in one transaction every flush_interval seconds, so the fusion path never waits on the disk.  When
+     the cache holds more than cache_size tracks the least recently used one is dropped from it; if it has not been
+     written yet it is kept in memory until the next write.  Only tracks outside the cache are read from the file.
+    As in FusionStore, the tracks are spread across locked stripes, and a track is only combined (changed in place),
+     read, pickled or copied under the lock of its stripe.  The store lock only guards the cache and the sets of
+     pending changes, so neither the combinations of tracks in other stripes nor the background pickling wait on
+     each other.  An exception other than sqlite3.Error in the background writer is raised by the next flush() or
+     close(); the changes it failed to write stay pending.
+    """
+    def __init__(self, method, path, max_number_of_evidences=None, cache_size=DEFAULT_CACHE_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, number_of_stripes=DEFAULT_NUMBER_OF_STRIPES):
+        """
+        :param method: str: the method in COMBINATION_METHODS
+        :param path: str: the SQLite file, created if needed
+        :param max_number_of_evidences: None if no window, > 1 if a window is defined
+        :param cache_size: int: max number of tracks held in memory
+        :param flush_interval: float: seconds between background writes
+        :param number_of_stripes: int: number of independently locked partitions of the tracks
+        """
+        if cache_size < 1:
+            raise ValueError("PersistentFusionStore: cache_size must be at least 1")
+        if number_of_stripes < 1:
+            raise ValueError("PersistentFusionStore: number_of_stripes must be at least 1")
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self._lock = RLock()
+        self._write_lock = Lock()
+        self._locks = [Lock() for _ in range(number_of_stripes)]
+        self._cache = OrderedDict()
+        # Cached tracks changed since the last write, and the internal data (or pickled state, after a failed write)
+        #  of the tracks dropped from the cache before being written
+        self._dirty = set()
+        self._evicted = {}
+        self._deleted = set()
+        # States (None if deleted) of the write in progress, still authoritative until committed: the internal data
+        #  of the tracks until the writer has pickled them, pickled states afterwards
+        self._writing = {}
+        self._sequence = 0
+        # Exception of the background writer, raised by the next flush() or close()
+        self._write_error = None
+
+        self._read_connection = sqlite3.connect(path, check_same_thread=False)
+        self._write_connection = sqlite3.connect(path, check_same_thread=False)
+        with self._write_connection:
+            # WAL lets the reads of cold tracks proceed during a background write
+            self._write_connection.execute("PRAGMA journal_mode=WAL")
+            self._write_connection.execute("CREATE TABLE IF NOT EXISTS tracks (track_id BLOB PRIMARY KEY, "
+                                           "sequence INTEGER NOT NULL, state BLOB NOT NULL)")
+        row = self._read_connection.execute("SELECT MAX(sequence) FROM tracks").fetchone()
+        if row[0] is not None:
+            self._sequence = row[0]
+
+        self._stop = Event()
+        self._writer = Thread(target=self._write_loop, name="PersistentFusionStore writer", daemon=True)
+        self._writer.start()
+
+    def update(self, track_id, evidence, input_weight=0.0):
+        """
+        Combines new evidence into a track and returns the resulting probabilities
+        :param track_id: hashable, picklable id of the track
+        :param evidence: dict: the new evidence, keyed by evidence id
+        :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+        :return: dict: a copy of the probabilities of the track after the update
+        """
+        with self._locks[self._stripe(track_id)]:
+            with self._lock:
+                all_data = self._load(track_id)
+            all_data = import_and_windowed_combine(self.method, evidence, self.max_number_of_evidences, all_data,
+                                                   input_weight)
+            with self._lock:
+                self._store(track_id, all_data)
+            return self._copy_probabilities(all_data)
+
+    def add(self, track_id, evidence, input_weight=0.0):
+        """
+        Combines new evidence into a track without reading it back, deferring the combination of methods that keep
+         evidence until the next read
+        """
+        with self._locks[self._stripe(track_id)]:
+            with self._lock:
+                all_data = self._load(track_id)
+            all_data = import_and_windowed_combine(self.method, evidence, self.max_number_of_evidences, all_data,
+                                                   input_weight, lazy=True)
+            with self._lock:
+                self._store(track_id, all_data)
+
+    def probabilities(self, track_id):
+        """
+        :return: dict: a copy of the current probabilities of the track, or None if the track is unknown
+        """
+        # Lazy methods combine the deferred evidence here, which changes the track
+        with self._locks[self._stripe(track_id)]:
+            with self._lock:
+                all_data = self._load(track_id)
+            if all_data is None:
+                return None
+            return self._copy_probabilities(all_data)
+
+    def get(self, track_id):
+        """
+        :return: dict: a deep copy of the internal data of the track, or None if the track is unknown
+        """
+        with self._locks[self._stripe(track_id)]:
+            with self._lock:
+                all_data = self._load(track_id)
+            return deepcopy(all_data)
+
+    def remove(self, track_id):
+        """
+        Removes a track from the cache and, at the next write, from the file
+        :return: dict: the internal data of the removed track, or None if the track is unknown
+        """
+        with self._locks[self._stripe(track_id)], self._lock:
+            all_data = self._load(track_id)
+            self._cache.pop(track_id, None)
+            self._dirty.discard(track_id)
+            self._evicted.pop(track_id, None)
+            if all_data is not None:
+                self._deleted.add(track_id)
+            return all_data
+
+    def track_ids(self):
+        """
+        :return: list: the ids of all tracks, in memory or in the file
+        """
+        with self._lock:
+            # From the oldest to the newest layer: the file, the write in progress, then memory
+            result = set()
+            for (key,) in self._read_connection.execute("SELECT track_id FROM tracks"):
+                result.add(pickle.loads(key))
+            for track_id, state in self._writing.items():
+                if state is None:
+                    result.discard(track_id)
+                else:
+                    result.add(track_id)
+            result -= self._deleted
+            result |= set(self._cache.keys()) | set(self._evicted.keys())
+            return list(result)
+
+    def __len__(self):
+        return len(self.track_ids())
+
+    def preload(self, limit=None):
+        """
+        Bulk loads the most recently updated tracks from the file into the cache, e.g. on startup
+        :param limit: int: max number of tracks to load, by default the cache size
+        :return: int: the number of tracks loaded
+        """
+        if limit is None:
+            limit = self.cache_size
+        limit = min(limit, self.cache_size)
+        loaded = 0
+        with self._lock:
+            cursor = self._read_connection.execute("SELECT track_id, state FROM tracks ORDER BY sequence DESC "
+                                                   "LIMIT ?", (limit,))
+            rows = cursor.fetchmany(PRELOAD_BATCH_SIZE)
+            while rows:
+                for key, state in rows:
+                    track_id = pickle.loads(key)
+                    if (track_id not in self._cache) and (track_id not in self._evicted) and \
+                            (track_id not in self._deleted) and (track_id not in self._writing):
+                        self._cache[track_id] = pickle.loads(state)
+                        # Most recent first, so keep the older ones at the least recently used end
+                        self._cache.move_to_end(track_id, last=False)
+                        loaded += 1
+                rows = cursor.fetchmany(PRELOAD_BATCH_SIZE)
+            self._evict()
+        return loaded
+
+    def flush(self):
+        """
+        Writes every pending change now, returning once it is committed
+        """
+        self._write_pending()
+        self._raise_write_error()
+
+    def close(self):
+        """
+        Stops the background writer, writes the pending changes and closes the file
+        """
+        self._stop.set()
+        self._writer.join()
+        try:
+            self._write_pending()
+        finally:
+            self._read_connection.close()
+            self._write_connection.close()
+        self._raise_write_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _load(self, track_id):
+        # Called with the lock held
+        if track_id in self._cache:
+            self._cache.move_to_end(track_id)
+            return self._cache[track_id]
+        if track_id in self._deleted:
+            return None
+        if track_id in self._evicted:
+            state = self._evicted[track_id]
+        elif track_id in self._writing:
+            state = self._writing[track_id]
+        else:
+            row = self._read_connection.execute("SELECT state FROM tracks WHERE track_id = ?",
+                                                (self._key(track_id),)).fetchone()
+            state = None if row is None else row[0]
+        if state is None:
+            return None
+        # A track dropped from the cache or being written may not be pickled yet
+        all_data = pickle.loads(state) if isinstance(state, bytes) else state
+        self._cache[track_id] = all_data
+        self._evict()
+        return all_data
+
+    def _store(self, track_id, all_data):
+        # Called with the lock held
+        self._cache[track_id] = all_data
+        self._cache.move_to_end(track_id)
+        self._dirty.add(track_id)
+        self._evicted.pop(track_id, None)
+        self._deleted.discard(track_id)
+        self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        while len(self._cache) > self.cache_size:
+            track_id, all_data = self._cache.popitem(last=False)
+            if track_id in self._dirty:
+                # Pickled by the writer, under the lock of its stripe
+                self._dirty.discard(track_id)
+                self._evicted[track_id] = all_data
+
+    def _stripe(self, track_id):
+        return hash(track_id) % len(self._locks)
+
+    def _key(self, track_id):
+        return pickle.dumps(track_id, PICKLE_PROTOCOL)
+
+    def _write_pending(self):
+        with self._write_lock:
+            # Snapshot the changes under the lock, then pickle the tracks and write without holding it
+            with self._lock:
+                pending = dict(self._evicted)
+                for track_id in self._dirty:
+                    pending[track_id] = self._cache[track_id]
+                for track_id in self._deleted:
+                    pending[track_id] = None
+                self._dirty = set()
+                self._evicted = {}
+                self._deleted = set()
+                self._writing = pending
+            if not pending:
+                return
+            try:
+                pickled = {}
+                for track_id, state in pending.items():
+                    if (state is not None) and not isinstance(state, bytes):
+                        # Only this track's stripe lock: a later change is written again, as the track is dirty again
+                        with self._locks[self._stripe(track_id)]:
+                            state = pickle.dumps(state, PICKLE_PROTOCOL)
+                    pickled[track_id] = state
+                with self._lock:
+                    self._writing = pickled
+                upserts = []
+                deletes = []
+                for track_id, state in pickled.items():
+                    if state is None:
+                        deletes.append((self._key(track_id),))
+                    else:
+                        self._sequence += 1
+                        upserts.append((self._key(track_id), self._sequence, state))
+                with self._write_connection:
+                    self._write_connection.executemany("DELETE FROM tracks WHERE track_id = ?", deletes)
+                    self._write_connection.executemany("INSERT OR REPLACE INTO tracks (track_id, sequence, state) "
+                                                       "VALUES (?, ?, ?)", upserts)
+            except Exception:
+                # Keep the changes for the next write, unless the track changed again meanwhile
+                with self._lock:
+                    for track_id, state in pending.items():
+                        if (track_id in self._dirty) or (track_id in self._evicted) or (track_id in self._deleted):
+                            continue
+                        if state is None:
+                            self._deleted.add(track_id)
+                        else:
+                            self._evicted[track_id] = state
+                    self._writing = {}
+                raise
+            with self._lock:
+                self._writing = {}
+
+    def _write_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._write_pending()
+            except sqlite3.Error:
+                # e.g. the file is locked by another process: retry at the next interval
+                continue
+            except Exception as error:
+                # e.g. a track that cannot be pickled: keep the writer running for the other tracks
+                self._write_error = error
+
+    def _raise_write_error(self):
+        error, self._write_error = self._write_error, None
+        if error is not None:
+            raise error
+
+    def _copy_probabilities(self, all_data):
+        probabilities = import_and_calculate_probabilities(self.method, all_data)
+        if probabilities is None:
+            return None
+        return dict(probabilities)
@@ -0,0 +1,268 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Dempster's rule on a product frame, e.g. type x affiliation x size, without flattening it into one joint frame.
+# A joint focal element is kept as a rectangle: one focal element per attribute, as a bitmask over the values of that
+#  attribute, with -1 (every bit set) for the whole attribute.  Rectangles intersect attribute by attribute and stay
+#  rectangles.  Evidence about a single attribute is the rectangle with the whole of every other attribute, and
+#  combining such evidence only involves that attribute: the combination is the product of one combination per
+#  attribute (a factor), with a normalization per factor.  So marginal evidence costs the size of its own factor, and
+#  the cost grows with the sum over the attributes rather than their product.
+# Joint evidence (mass on rectangles constraining several attributes) is combined separately.  Only the attributes it
+#  constrains are coupled: their marginals come from the joint part combined with their factors, while the marginals
+#  of the other attributes remain their factors.
+# The combination is true Dempster (mass on every non-empty intersection, normalized), not the pairwise combination of
+#  dsCombination, which only keeps mass on intersections that are input keys.  Evidence is not windowed or weighted.
+
+from itertools import product
+
+from combinationRules.utilities import conjunctive_bitmask, focal_key, from_bitmask
+
+JOINT_KEY = "joint"
+WHOLE = -1
+
+
+def initialize_data(attributes):
+    """
+    :param attributes: list of the attribute names, in the order of the components of joint focal elements
+    :return: dict: empty internal data
+    """
+    if len(set(attributes)) != len(attributes) or (JOINT_KEY in attributes):
+        raise ValueError("productFrames: attribute names must be unique and not " + JOINT_KEY)
+    return {
+        "attributes": list(attributes),
+        "frames": dict((attribute, []) for attribute in attributes),  # values by bit position
+        "frame_index": dict((attribute, {}) for attribute in attributes),
+        "factors": dict((attribute, None) for attribute in attributes),  # {bitmask: mass}, None if no evidence
+        "joint": None,  # {rectangle: mass}, None if no joint evidence
+        "number_of_evidences": 0,
+        "combined": None  # the joint part combined with the factors of the attributes it constrains
+    }
+
+
+def multi_combination(evidence, all_data=None, attributes=None):
+    """
+    :param evidence: dict of evidence key -> source.  A source is a dict of attribute -> masses over the values of
+     that attribute, for independent marginal evidence, and/or JOINT_KEY -> masses keyed by tuples with one focal
+     element per attribute, in attribute order, None for the whole attribute.
+    :param all_data: the internal data to combine with, or None
+    :param attributes: list of the attribute names when all_data is None
+    :return: dict: the updated internal data
+    """
+    if all_data is None:
+        if attributes is None:
+            raise ValueError("productFrames: attributes are required to start a product frame")
+        all_data = initialize_data(attributes)
+    for evidence_key in evidence.keys():
+        for attribute, masses in evidence[evidence_key].items():
+            if attribute == JOINT_KEY:
+                joint = rectangle_masses(all_data, masses)
+                if all_data["joint"] is not None:
+                    joint = dempster(all_data["joint"], joint, rectangle_intersection)
+                all_data["joint"] = joint
+            elif attribute in all_data["factors"]:
+                factor = attribute_masses(all_data, attribute, masses)
+                if all_data["factors"][attribute] is not None:
+                    factor = dempster(all_data["factors"][attribute], factor)
+                all_data["factors"][attribute] = factor
+            else:
+                raise ValueError("productFrames: unknown attribute " + str(attribute))
+        all_data["number_of_evidences"] += 1
+    all_data["combined"] = None
+    return all_data
+
+
+def value_mask(all_data, attribute, key):
+    # Bitmask of a focal element of an attribute, extending its frame with new values
+    frame_index = all_data["frame_index"][attribute]
+    if len(focal_key(key)) == 0:
+        raise ValueError("productFrames: empty focal element for " + str(attribute))
+    mask = 0
+    for value in focal_key(key):
+        if value not in frame_index:
+            frame_index[value] = len(all_data["frames"][attribute])
+            all_data["frames"][attribute].append(value)
+        mask |= 1 << frame_index[value]
+    return mask
+
+
+def attribute_masses(all_data, attribute, masses):
+    result = {}
+    for key, mass in masses.items():
+        if mass != 0.0:
+            mask = value_mask(all_data, attribute, key)
+            result[mask] = result.get(mask, 0.0) + mass
+    return result
+
+
+def rectangle_masses(all_data, masses):
+    result = {}
+    for key, mass in masses.items():
+        if len(key) != len(all_data["attributes"]):
+            raise ValueError("productFrames: joint focal elements need one component per attribute")
+        if mass != 0.0:
+            rectangle = tuple(WHOLE if component is None else value_mask(all_data, attribute, component)
+                              for attribute, component in zip(all_data["attributes"], key))
+            result[rectangle] = result.get(rectangle, 0.0) + mass
+    return result
+
+
+def rectangle_intersection(rectangle_1, rectangle_2):
+    # None if empty
+    intersection = tuple(mask_1 & mask_2 for mask_1, mask_2 in zip(rectangle_1, rectangle_2))
+    if 0 in intersection:
+        return None
+    return intersection
+
+
+def dempster(masses_1, masses_2, intersect=None):
+    """
+    :param intersect: function of two focal elements returning their intersection, None if empty.  Bitmask AND if
+     None.
+    :return: dict: the normalized conjunctive combination
+    """
+    if intersect is None:
+        result = conjunctive_bitmask(masses_1, masses_2)
+        result.pop(0, None)
+    else:
+        result = {}
+        for key_1, mass_1 in masses_1.items():
+            for key_2, mass_2 in masses_2.items():
+                intersection = intersect(key_1, key_2)
+                if intersection is not None:
+                    result[intersection] = result.get(intersection, 0.0) + mass_1 * mass_2
+    total = sum(result.values())
+    if total <= 0.0:
+        raise ValueError("productFrames: totally conflicting evidence")
+    for key in result.keys():
+        result[key] /= total
+    return result
+
+
+def joint_attributes(all_data):
+    """
+    :return: list: the positions of the attributes constrained by joint evidence
+    """
+    if all_data["joint"] is None:
+        return []
+    return [position for position in range(0, len(all_data["attributes"]))
+            if any(rectangle[position] != WHOLE for rectangle in all_data["joint"].keys())]
+
+
+def combined_joint(all_data):
+    """
+    :return: dict: rectangle -> mass of the joint evidence combined with the factors of the attributes it constrains,
+     or None if there is no joint evidence
+    """
+    if all_data["joint"] is None:
+        return None
+    if all_data["combined"] is None:
+        combined = all_data["joint"]
+        number_of_attributes = len(all_data["attributes"])
+        for position in joint_attributes(all_data):
+            factor = all_data["factors"][all_data["attributes"][position]]
+            if factor is not None:
+                lifted = {}
+                for mask, mass in factor.items():
+                    lifted[tuple(mask if counter == position else WHOLE
+                                 for counter in range(0, number_of_attributes))] = mass
+                combined = dempster(combined, lifted, rectangle_intersection)
+        all_data["combined"] = combined
+    return all_data["combined"]
+
+
+def attribute_key(all_data, attribute, mask):
+    frame = all_data["frames"][attribute]
+    if mask == WHOLE:
+        mask = (1 << len(frame)) - 1
+    return tuple(sorted(from_bitmask(mask, frame)))
+
+
+def marginal(all_data, attribute):
+    """
+    :param attribute: the attribute name
+    :return: dict: the combined masses of the attribute, keyed by sorted tuples of its values; the whole attribute if
+     there is no evidence about it, {} if none of its values are known
+    """
+    position = all_data["attributes"].index(attribute)
+    if not all_data["frames"][attribute]:
+        return {}
+    if position in joint_attributes(all_data):
+        masks = {}
+        for rectangle, mass in combined_joint(all_data).items():
+            masks[rectangle[position]] = masks.get(rectangle[position], 0.0) + mass
+    elif all_data["factors"][attribute] is not None:
+        masks = all_data["factors"][attribute]
+    else:
+        masks = {WHOLE: 1.0}
+    result = {}
+    for mask, mass in masks.items():
+        key = attribute_key(all_data, attribute, mask)
+        result[key] = result.get(key, 0.0) + mass
+    return result
+
+
+def final_probabilities(all_data):
+    """
+    :return: dict: attribute -> its marginal masses
+    """
+    result = {}
+    for attribute in all_data["attributes"]:
+        result[attribute] = marginal(all_data, attribute)
+    return result
+
+
+def joint_masses(all_data):
+    """
+    The full joint combination, whose size is the product of the sizes of the independent parts.  Only for small
+     frames or checks.
+    :return: dict: tuple of one focal element (sorted tuple of values) per attribute -> mass
+    """
+    coupled = joint_attributes(all_data)
+    parts = []
+    if coupled:
+        parts.append(list(combined_joint(all_data).items()))
+    for position, attribute in enumerate(all_data["attributes"]):
+        if position not in coupled:
+            factor = all_data["factors"][attribute]
+            lifted = {}
+            for mask, mass in (factor.items() if factor is not None else [(WHOLE, 1.0)]):
+                lifted[tuple(mask if counter == position else WHOLE
+                             for counter in range(0, len(all_data["attributes"])))] = mass
+            parts.append(list(lifted.items()))
+    result = {}
+    for combination in product(*parts):
+        # The parts constrain different attributes, so their intersection is the product of the masses
+        rectangle = [WHOLE] * len(all_data["attributes"])
+        mass = 1.0
+        for part_rectangle, part_mass in combination:
+            rectangle = [mask_1 & mask_2 for mask_1, mask_2 in zip(rectangle, part_rectangle)]
+            mass *= part_mass
+        key = tuple(attribute_key(all_data, attribute, mask)
+                    for attribute, mask in zip(all_data["attributes"], rectangle))
+        result[key] = result.get(key, 0.0) + mass
+    return result
+
+
+def flatten(key):
+    """
+    :param key: tuple of one focal element per attribute, as from joint_masses
+    :return: tuple: the focal element of the flattened joint frame, the sorted tuples of one value per attribute
+    """
+    return tuple(sorted(product(*key)))
@@ -0,0 +1,298 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# The result of combining the evidence without each source in turn, to find the sources that drive the decision.
+#  Recombining N - 1 sources N times costs O(N^2) combinations; instead, per method:
+#  associative rules      - with the combinations of every prefix and every suffix of the sources, the result
+#                           without source i is the combination of prefix i - 1 with suffix i + 1: O(N)
+#                           combinations.  This is the disjunctive rule, and Dempster's rule when every source has the
+#                           same focal elements, closed under intersection (dsCombination.repeated_combination relies
+#                           on the same property).
+#  MURPHY                 - the average of the sources is kept as a weighted sum, so removing one is a subtraction,
+#                           followed by the usual self-combination of the average.
+#  ZHANG                  - the cosines between the sources are computed once.  Removing source i only takes its
+#                           cosines out of the supports of the others, then the credibility weighted average is
+#                           combined as usual.
+#  pairwise, in order     - Dempster's (other focal elements), Yager's and Dubois-Prade's pairwise combinations depend
+#                           on the order of the sources.  The combinations of the prefixes are reused and only the
+#                           sources after the one removed are combined again: half the combinations, still O(N^2).
+#  PCR6, OVERWRITE        - recombined without each source.
+# The influence of a source is the distance between the probabilities with and without it, and whether the best
+#  hypothesis changes.
+
+from combinationRules import COMBINATION_METHODS, import_and_windowed_combine, import_and_calculate_probabilities
+from combinationRules.changeNotifier import DISTANCES, probability_delta, max_abs_distance, jousselme_distance
+from combinationRules.decision import top_k
+from combinationRules.utilities import focal_key, frame_of, to_bitmask, from_bitmask
+
+PAIRWISE_METHODS = (COMBINATION_METHODS["DEMPSTER_SHAFER"], COMBINATION_METHODS["YAGER"],
+                    COMBINATION_METHODS["DISJUNCTIVE"], COMBINATION_METHODS["DUBOIS_PRADE"])
+
+
+def leave_one_out(method, evidence, weights=None, measure="pignistic", distance="max_abs"):
+    """
+    :param method: str: the method in COMBINATION_METHODS
+    :param evidence: dict of evidence key -> masses, combined in order
+    :param weights: dict of weights per evidence key, for the methods that use them
+    :param measure: str: the measure of decision.MEASURES used for the best hypothesis
+    :param distance: str: one of changeNotifier.DISTANCES
+    :return: dict: "probabilities" - the probabilities of all the evidence,
+                   "leave_one_out" - evidence key -> the probabilities without it, None if nothing remains,
+                   "influence" - evidence key -> dict of the "distance" between the probabilities with and without
+                                 it, the "decision" without it and whether it "changes_decision"
+    """
+    if distance not in DISTANCES:
+        raise ValueError("leave_one_out: unknown distance " + str(distance))
+    evidence_keys = list(evidence.keys())
+    inputs = []
+    for evidence_key in evidence_keys:
+        inputs.append(dict((focal_key(key), mass) for key, mass in evidence[evidence_key].items()))
+    input_weights = [1.0 if (weights is None) or (evidence_key not in weights) else weights[evidence_key]
+                     for evidence_key in evidence_keys]
+
+    full = probabilities_of(method, import_and_windowed_combine(method, evidence, weights=weights)) if inputs else None
+    if not inputs:
+        results = []
+    elif method == COMBINATION_METHODS["MURPHY"]:
+        results = murphy_leave_one_out(inputs, input_weights)
+    elif method == COMBINATION_METHODS["ZHANG"]:
+        results = zhang_leave_one_out(inputs, input_weights)
+    elif method in PAIRWISE_METHODS:
+        # As in multi_combination, empty sources are skipped, so leaving one out changes nothing
+        present = [position for position, masses in enumerate(inputs) if masses]
+        present_results = pairwise_leave_one_out(method, [inputs[position] for position in present])
+        results = [full] * len(inputs)
+        for position, result in zip(present, present_results):
+            results[position] = result
+    else:
+        results = []
+        for evidence_key in evidence_keys:
+            remaining = dict((key, evidence[key]) for key in evidence_keys if key != evidence_key)
+            results.append(probabilities_of(method, import_and_windowed_combine(method, remaining, weights=weights))
+                           if remaining else None)
+
+    best = best_hypothesis(full, measure)
+    loo = {}
+    influence = {}
+    for evidence_key, result in zip(evidence_keys, results):
+        loo[evidence_key] = result
+        before = full if full is not None else {}
+        delta = probability_delta(before, result if result is not None else {})
+        decision = best_hypothesis(result, measure)
+        if distance == "max_abs":
+            change = max_abs_distance(before, delta)
+        else:
+            change = jousselme_distance(before, delta)
+        influence[evidence_key] = {
+            "distance": change,
+            "decision": decision,
+            "changes_decision": decision != best
+        }
+    return {
+        "probabilities": full,
+        "leave_one_out": loo,
+        "influence": influence
+    }
+
+
+def probabilities_of(method, all_data):
+    probabilities = import_and_calculate_probabilities(method, all_data)
+    return dict(probabilities) if probabilities is not None else None
+
+
+def best_hypothesis(probabilities, measure):
+    # None if there are no probabilities or no hypothesis has a positive score
+    if not probabilities:
+        return None
+    best = top_k(probabilities, 1, measure)
+    return best[0][0] if best else None
+
+
+def associative_leave_one_out(inputs, combination):
+    """
+    :param inputs: list of mass dicts
+    :param combination: associative function of two mass dicts
+    :return: list: the combination of the inputs without each input in turn, None if no input remains
+    """
+    prefixes = [inputs[0]]
+    for masses in inputs[1:]:
+        prefixes.append(combination(prefixes[-1], masses))
+    suffixes = [inputs[-1]]
+    for masses in reversed(inputs[:-1]):
+        suffixes.append(combination(masses, suffixes[-1]))
+    suffixes.reverse()
+    results = []
+    for position in range(0, len(inputs)):
+        if len(inputs) == 1:
+            results.append(None)
+        elif position == 0:
+            results.append(suffixes[1])
+        elif position == len(inputs) - 1:
+            results.append(prefixes[-2])
+        else:
+            results.append(combination(prefixes[position - 1], suffixes[position + 1]))
+    return results
+
+
+def sequential_leave_one_out(inputs, combination):
+    """
+    :param inputs: list of mass dicts, combined in order
+    :param combination: function of two mass dicts
+    :return: list: the combination of the inputs in order without each input in turn, None if no input remains
+    """
+    prefixes = [inputs[0]]
+    for masses in inputs[1:-1]:
+        prefixes.append(combination(prefixes[-1], masses))
+    results = []
+    for position in range(0, len(inputs)):
+        if len(inputs) == 1:
+            results.append(None)
+            continue
+        if position == 0:
+            result = inputs[1]
+            start = 2
+        else:
+            result = prefixes[position - 1]
+            start = position + 1
+        for masses in inputs[start:]:
+            result = combination(result, masses)
+        results.append(result)
+    return results
+
+
+def pairwise_leave_one_out(method, inputs):
+    """
+    :param method: str: one of PAIRWISE_METHODS
+    :param inputs: list of non-empty mass dicts, combined in order
+    :return: list: the combined masses without each input in turn, None if no input remains
+    """
+    if not inputs:
+        return []
+    if method in (COMBINATION_METHODS["DISJUNCTIVE"], COMBINATION_METHODS["DUBOIS_PRADE"]):
+        # On bitmask focal elements over the frame of all the inputs
+        if method == COMBINATION_METHODS["DISJUNCTIVE"]:
+            from combinationRules.disjunctiveCombination import bitmask_combination
+        else:
+            from combinationRules.duboisPradeCombination import bitmask_combination
+        frame = frame_of(inputs)
+        frame_index = dict((element, position) for position, element in enumerate(frame))
+        masks = [to_bitmask(masses, frame_index) for masses in inputs]
+        if method == COMBINATION_METHODS["DISJUNCTIVE"]:
+            mask_results = associative_leave_one_out(masks, bitmask_combination)
+        else:
+            mask_results = sequential_leave_one_out(masks, bitmask_combination)
+        return [None if result is None else dict((from_bitmask(mask, frame), mass) for mask, mass in result.items())
+                for result in mask_results]
+    from combinationRules.dsCombination import intersection_closed
+    if method == COMBINATION_METHODS["DEMPSTER_SHAFER"]:
+        from combinationRules.dsCombination import combination
+        keys = set(inputs[0].keys())
+        if intersection_closed(keys) and all(set(masses.keys()) == keys for masses in inputs):
+            return associative_leave_one_out(inputs, combination)
+    else:
+        from combinationRules.yagerCombination import combination
+    return sequential_leave_one_out(inputs, combination)
+
+
+def murphy_leave_one_out(inputs, input_weights):
+    """
+    :return: list: the combined masses of Murphy's rule without each input in turn, None if no input remains
+    """
+    from combinationRules.murphyCombination import combine_evidence
+    sums = {}
+    counts = {}
+    total_weight = 0.0
+    for masses, input_weight in zip(inputs, input_weights):
+        for key, mass in masses.items():
+            sums[key] = sums.get(key, 0.0) + mass * input_weight
+            counts[key] = counts.get(key, 0) + 1
+        total_weight += input_weight
+    results = []
+    for masses, input_weight in zip(inputs, input_weights):
+        remaining_weight = total_weight - input_weight
+        if (len(inputs) == 1) or (remaining_weight <= 0.0):
+            results.append(None)
+            continue
+        average = {}
+        for key, total in sums.items():
+            # Focal elements only in the removed input are not in the average of the others
+            if (key not in masses) or (counts[key] > 1):
+                average[key] = (total - masses.get(key, 0.0) * input_weight) / remaining_weight
+        all_data = {
+            "evidence": average,
+            "evidence_weight": remaining_weight,
+            "number_of_evidences": len(inputs) - 1,
+            "combined": {},
+            "last_evidence": {}
+        }
+        combine_evidence(all_data)
+        results.append(all_data["combined"])
+    return results
+
+
+def zhang_leave_one_out(inputs, input_weights):
+    """
+    :return: list: the combined masses of Zhang's rule without each input in turn, None if no input remains
+    """
+    from math import sqrt
+    from combinationRules.dsCombination import repeated_combination
+    from combinationRules.utilities import the_keys
+    from combinationRules.zhangCombination import pignistic_vectors
+    evidence = dict(enumerate(inputs))
+    thetas = list(set(the_keys(key for masses in inputs for key in masses.keys())))
+    powerset = [tuple(sorted([x for j, x in enumerate(thetas) if (i >> j) & 1])) for i in range(2 ** len(thetas))]
+    powerset.remove(())
+    pignist_vector = pignistic_vectors(evidence, thetas, powerset)
+
+    # The cosines and the supports of all the inputs, as in zhangCombination.weighted_average
+    lengths = [sqrt(sum(value * value for value in pignist_vector[i])) for i in range(0, len(inputs))]
+    cosines = []
+    for i in range(0, len(inputs)):
+        row = []
+        for j in range(0, len(inputs)):
+            if i == j:
+                row.append(1.0)
+            else:
+                dot = sum(value_i * value_j for value_i, value_j in zip(pignist_vector[i], pignist_vector[j]))
+                row.append(dot / (lengths[i] * lengths[j]))
+        cosines.append(row)
+    supports = [sum(row) for row in cosines]
+
+    in_powerset = set(powerset)
+    results = []
+    for removed in range(0, len(inputs)):
+        if len(inputs) == 1:
+            results.append(None)
+            continue
+        # The credibilities are normalized supports, and the average is normalized again afterwards
+        average = dict.fromkeys(powerset, 0.0)
+        average_sum = 0.0
+        for i in range(0, len(inputs)):
+            if i == removed:
+                continue
+            support = supports[i] - cosines[i][removed]
+            for key, mass in inputs[i].items():
+                if key in in_powerset:
+                    add_mass = support * mass * input_weights[i]
+                    average[key] += add_mass
+                    average_sum += add_mass
+        for key in average.keys():
+            average[key] /= average_sum
+        results.append(repeated_combination(dict(average), average, len(inputs) - 2))
+    return results
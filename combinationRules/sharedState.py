@@ -0,0 +1,298 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Per-track probabilities published by one fusion process and read by others through shared memory, without pickling.
+# Layout of the arena (all fields 8 bytes, except the masses):
+#  header:    magic, capacity, width, directory sequence, metadata length, mass size in bytes, then the metadata (JSON
+#             of the focal elements) padded to 8 bytes
+#  directory: per slot, the length of its track key (0 if free) and KEY_BYTES of the key (repr of the track id)
+#  slots:     per slot, a sequence number and width masses, one per focal element, float64 or float32 (typecode "f",
+#             rounded when written: about half the memory for a relative error of at most 2 ** -24), padded to 8
+#             bytes
+# Both the directory and each slot are guarded by a seqlock: the single writer makes the sequence odd, writes, then
+#  makes it even again.  A reader copies the data between two reads of the sequence and retries if the sequence was
+#  odd or changed, so it never blocks the writer and never sees a half-written update.
+
+import json
+import os
+import struct
+import sys
+from array import array
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+from combinationRules.utilities import focal_key, MASS_TYPECODES
+
+MAGIC = 0x445353484d454d32
+KEY_BYTES = 64
+HEADER_FIELDS = 6
+MAX_READ_ATTEMPTS = 10000
+
+
+def encode_focal_element(key):
+    return list(focal_key(key))
+
+
+class SharedProbabilityArena(object):
+    """
+    Shared-memory table of track id -> probabilities over a fixed list of focal elements.
+    The process that creates the arena is its only writer; other processes attach by name and read.
+    """
+    def __init__(self, focal_elements=None, capacity=None, name=None, create=True, typecode="d"):
+        """
+        :param focal_elements: list of the focal element keys, fixed for the life of the arena
+        :param capacity: int: max number of tracks
+        :param name: str: the shared memory name, chosen by the system if None when creating
+        :param create: boolean whether to create the arena (the writer) or attach to an existing one (a reader)
+        :param typecode: str: "d" to store float64 masses, "f" for float32.  Readers take it from the arena.
+        """
+        self.writer = create
+        if create:
+            if (not focal_elements) or (capacity is None) or (capacity < 1):
+                raise ValueError("SharedProbabilityArena: focal elements and a capacity of at least 1 are required")
+            if typecode not in MASS_TYPECODES:
+                raise ValueError("SharedProbabilityArena: typecode must be 'd' or 'f'")
+            self.typecode = typecode
+            metadata = json.dumps([encode_focal_element(key) for key in focal_elements]).encode("utf-8")
+            self.capacity = capacity
+            self.width = len(focal_elements)
+            self._metadata_length = len(metadata)
+            self._set_offsets()
+            self._memory = shared_memory.SharedMemory(name=name, create=True, size=self._size)
+            self._memory.buf[self._metadata_offset:self._metadata_offset + len(metadata)] = metadata
+            struct.pack_into("6Q", self._memory.buf, 0, MAGIC, capacity, self.width, 0, len(metadata),
+                             array(typecode).itemsize)
+        else:
+            if sys.version_info >= (3, 13):
+                self._memory = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                self._memory = shared_memory.SharedMemory(name=name)
+                # Attaching registers the memory with this process's resource tracker, which would unlink it when
+                #  the reader exits: only the writer owns it
+                if os.name == "posix":
+                    resource_tracker.unregister(self._memory._name, "shared_memory")
+            magic, self.capacity, self.width, _, self._metadata_length, mass_size = \
+                struct.unpack_from("6Q", self._memory.buf, 0)
+            if magic != MAGIC:
+                raise ValueError("SharedProbabilityArena: " + str(name) + " is not a probability arena")
+            self.typecode = "d" if mass_size == 8 else "f"
+            self._set_offsets()
+            metadata = bytes(self._memory.buf[self._metadata_offset:self._metadata_offset + self._metadata_length])
+        self.name = self._memory.name
+        self.focal_elements = [tuple(key) for key in json.loads(metadata.decode("utf-8"))]
+        self.focal_index = {}
+        for column, key in enumerate(self.focal_elements):
+            self.focal_index[key] = column
+        self._words = self._memory.buf.cast("Q")
+        self._values = self._memory.buf.cast(self.typecode)
+        # Local copy of the directory, refreshed when its sequence changes
+        self._slots = {}
+        self._directory_sequence = None
+        self._free_slots = list(range(capacity - 1, -1, -1)) if create else []
+
+    def _set_offsets(self):
+        self._metadata_offset = HEADER_FIELDS * 8
+        padded = (self._metadata_length + 7) // 8 * 8
+        self._directory_offset = self._metadata_offset + padded
+        self._entry_size = 8 + KEY_BYTES
+        self._slots_offset = self._directory_offset + self.capacity * self._entry_size
+        self._itemsize = array(self.typecode).itemsize
+        self._slot_size = 8 + (self.width * self._itemsize + 7) // 8 * 8
+        self._size = self._slots_offset + self.capacity * self._slot_size
+
+    def _slot_word(self, slot):
+        # Index of the sequence number of a slot in the 8 byte words, its masses follow it
+        return (self._slots_offset + slot * self._slot_size) // 8
+
+    def _slot_values(self, slot):
+        # Index of the first mass of a slot in the masses
+        return (self._slots_offset + slot * self._slot_size + 8) // self._itemsize
+
+    @property
+    def nbytes(self):
+        """
+        :return: int: the size of the shared memory of the arena
+        """
+        return self._size
+
+    @classmethod
+    def attach(cls, name):
+        """
+        :param name: str: the name of an arena created by another process
+        :return: SharedProbabilityArena: a reader of the arena
+        """
+        return cls(name=name, create=False)
+
+    def _track_key(self, track_id):
+        key = repr(track_id).encode("utf-8")
+        if len(key) > KEY_BYTES:
+            raise ValueError("SharedProbabilityArena: track id longer than {} bytes".format(KEY_BYTES))
+        return key
+
+    def write(self, track_id, probabilities):
+        """
+        Publishes the probabilities of a track.  Only the creating process may write.
+        :param track_id: the track id, whose repr must fit in KEY_BYTES
+        :param probabilities: dict of focal element -> mass, e.g. from import_and_calculate_probabilities
+        """
+        if not self.writer:
+            raise ValueError("SharedProbabilityArena: readers cannot write")
+        row = [0.0] * self.width
+        for key, mass in probabilities.items():
+            column = self.focal_index.get(focal_key(key))
+            if column is None:
+                raise ValueError("SharedProbabilityArena: " + str(key) + " is not one of the focal elements")
+            row[column] = mass
+        slot = self._slots.get(track_id)
+        if slot is None:
+            slot = self._add_track(track_id)
+        word = self._slot_word(slot)
+        values = self._slot_values(slot)
+        self._words[word] += 1
+        self._values[values:values + self.width] = array(self.typecode, row)
+        self._words[word] += 1
+
+    def remove(self, track_id):
+        """
+        Removes a track and frees its slot.  Only the creating process may remove.
+        """
+        if not self.writer:
+            raise ValueError("SharedProbabilityArena: readers cannot remove tracks")
+        slot = self._slots.pop(track_id, None)
+        if slot is None:
+            return
+        self._words[3] += 1
+        self._words[(self._directory_offset + slot * self._entry_size) // 8] = 0
+        self._words[3] += 1
+        self._free_slots.append(slot)
+
+    def _add_track(self, track_id):
+        if not self._free_slots:
+            raise ValueError("SharedProbabilityArena: capacity of {} tracks reached".format(self.capacity))
+        key = self._track_key(track_id)
+        slot = self._free_slots.pop()
+        entry = self._directory_offset + slot * self._entry_size
+        self._words[3] += 1
+        self._memory.buf[entry + 8:entry + 8 + len(key)] = key
+        self._words[entry // 8] = len(key)
+        self._words[3] += 1
+        self._slots[track_id] = slot
+        return slot
+
+    def _refresh_directory(self):
+        # Reader side: rebuild the track id -> slot map from a consistent copy of the directory
+        for _ in range(0, MAX_READ_ATTEMPTS):
+            sequence = self._words[3]
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            directory = bytes(self._memory.buf[self._directory_offset:self._slots_offset])
+            if self._words[3] != sequence:
+                continue
+            slots = {}
+            for slot in range(0, self.capacity):
+                entry = slot * self._entry_size
+                length = struct.unpack_from("Q", directory, entry)[0]
+                if length > 0:
+                    slots[directory[entry + 8:entry + 8 + length]] = slot
+            self._slots = slots
+            self._directory_sequence = sequence
+            return
+        raise RuntimeError("SharedProbabilityArena: the directory kept changing while reading it")
+
+    def _slot(self, track_id):
+        if self.writer:
+            return self._slots.get(track_id)
+        if self._directory_sequence != self._words[3]:
+            self._refresh_directory()
+        return self._slots.get(self._track_key(track_id))
+
+    def read(self, track_id):
+        """
+        :param track_id: the track id
+        :return: dict: a consistent copy of the probabilities of the track keyed by sorted tuples, or None if the track
+         is unknown
+        """
+        row = self.read_row(track_id)
+        if row is None:
+            return None
+        return dict(zip(self.focal_elements, row))
+
+    def read_row(self, track_id):
+        """
+        :param track_id: the track id
+        :return: tuple: a consistent copy of the masses in the order of focal_elements, or None if the track is unknown
+        """
+        for _ in range(0, MAX_READ_ATTEMPTS):
+            directory_sequence = self._words[3]
+            slot = self._slot(track_id)
+            if slot is None:
+                return None
+            word = self._slot_word(slot)
+            sequence = self._words[word]
+            if sequence % 2 == 1:
+                time.sleep(0)
+                continue
+            values = self._slot_values(slot)
+            row = tuple(self._values[values:values + self.width])
+            # Retry if the slot was written or reassigned meanwhile
+            if (self._words[word] == sequence) and (self._words[3] == directory_sequence):
+                return row
+        raise RuntimeError("SharedProbabilityArena: track " + repr(track_id) + " kept changing while reading it")
+
+    def view(self, track_id):
+        """
+        Zero-copy access for readers that validate with version() themselves.  Release the view before close().
+        :return: memoryview of the masses (of typecode) of the track in the order of focal_elements, or None if unknown
+        """
+        slot = self._slot(track_id)
+        if slot is None:
+            return None
+        values = self._slot_values(slot)
+        return self._values[values:values + self.width]
+
+    def version(self, track_id):
+        """
+        :return: int: the sequence number of the track, odd while it is being written, or None if unknown
+        """
+        slot = self._slot(track_id)
+        if slot is None:
+            return None
+        return self._words[self._slot_word(slot)]
+
+    def __len__(self):
+        if not self.writer and self._directory_sequence != self._words[3]:
+            self._refresh_directory()
+        return len(self._slots)
+
+    def close(self):
+        """
+        Releases this process's mapping.  The writer also frees the shared memory.
+        """
+        self._words.release()
+        self._values.release()
+        self._memory.close()
+        if self.writer:
+            self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
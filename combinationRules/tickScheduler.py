@@ -0,0 +1,327 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Periodic fusion of many tracks.  Evidence is queued per track with its timestamp, and each tick fuses the tracks
+#  that have evidence ready, so a track is combined at most once per period however many reports it received.
+# Reorder window: evidence is held until the tick time is reorder_window past its timestamp, and released in
+#  timestamp order, so reports arriving out of order within the window are combined in the order they were observed.
+#  Evidence older than what a track has already released is late: it is counted and combined in the next tick.
+# Each tick fuses the ready tracks by decreasing priority, then oldest waiting evidence first, through the batched
+#  path of updateBuffer (one windowed combination per batch of reports where the method allows it).  Once the tick has
+#  run for its deadline the remaining tracks are deferred to the next tick, where their older evidence puts them
+#  first within their priority.  A tick that defers tracks or runs past its deadline is a deadline miss.  When the
+#  compiled kernels of jitKernels are enabled, call jitKernels.warm_up() before the first tick so that compiling them
+#  does not count against a deadline.
+# Tick durations and the delays from the arrival of a report to its fusion are kept in latency histograms.  With a
+#  changeNotifier, the probabilities of each fused track are compared with what its subscribers last received.
+
+import heapq
+import time
+from threading import RLock
+
+from combinationRules import import_and_calculate_probabilities
+from combinationRules.updateBuffer import combine_reports
+
+DEFAULT_PERIOD = 0.1
+# Upper bounds in seconds of the histogram buckets, the last bucket counts everything above
+DEFAULT_LATENCY_BOUNDS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+
+
+class LatencyHistogram(object):
+    """
+    Counts of latencies in fixed buckets
+    """
+    def __init__(self, bounds=DEFAULT_LATENCY_BOUNDS):
+        """
+        :param bounds: increasing upper bounds of the buckets, in seconds
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, latency):
+        position = 0
+        while (position < len(self.bounds)) and (latency > self.bounds[position]):
+            position += 1
+        self.counts[position] += 1
+        self.count += 1
+        self.total += latency
+        self.maximum = max(self.maximum, latency)
+
+    def quantile(self, fraction):
+        """
+        :param fraction: float in [0, 1]
+        :return: float: the upper bound of the bucket holding the quantile (the maximum for the last bucket), 0.0 if
+         nothing was recorded
+        """
+        if self.count == 0:
+            return 0.0
+        target = fraction * self.count
+        cumulative = 0
+        for position, count in enumerate(self.counts):
+            cumulative += count
+            if (cumulative >= target) and (count > 0):
+                return self.bounds[position] if position < len(self.bounds) else self.maximum
+        return self.maximum
+
+    def as_dict(self):
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.maximum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99)
+        }
+
+
+class TickScheduler(object):
+    """
+    Owner of the per-track internal data of a combination method, fused once per tick within a deadline
+    """
+    def __init__(self, method, max_number_of_evidences=None, period=DEFAULT_PERIOD, deadline=None,
+                 reorder_window=0.0, clock=time.monotonic, latency_bounds=DEFAULT_LATENCY_BOUNDS, notifier=None):
+        """
+        :param method: str: the method in COMBINATION_METHODS
+        :param max_number_of_evidences: None if no window, > 1 if a window is defined
+        :param period: float: seconds between ticks in run()
+        :param deadline: float: seconds a tick may spend fusing before deferring the remaining tracks, the period if
+         None
+        :param reorder_window: float: seconds evidence is held after its timestamp so late arrivals can be ordered
+        :param clock: function returning the current time in seconds, in the units of the evidence timestamps
+        :param latency_bounds: upper bounds in seconds of the latency histogram buckets
+        :param notifier: ChangeNotifier told of the probabilities of every fused track, or None
+        """
+        if period <= 0.0:
+            raise ValueError("TickScheduler: period must be positive")
+        if reorder_window < 0.0:
+            raise ValueError("TickScheduler: reorder_window can't be negative")
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.period = period
+        self.deadline = period if deadline is None else deadline
+        self.reorder_window = reorder_window
+        self.clock = clock
+        self.notifier = notifier
+        self._lock = RLock()
+        self._tracks = {}
+        # track id -> heap of (timestamp, sequence, masses, input weight, arrival time)
+        self._pending = {}
+        self._released = {}  # track id -> timestamp of the latest evidence combined
+        self._priorities = {}
+        self._sequence = 0
+        self.ticks = 0
+        self.deadline_misses = 0
+        self.deferred_tracks = 0
+        self.late_reports = 0
+        self.fused_reports = 0
+        self.tick_latency = LatencyHistogram(latency_bounds)
+        self.report_latency = LatencyHistogram(latency_bounds)
+
+    def add(self, track_id, evidence, timestamp=None, input_weight=0.0):
+        """
+        Queues new evidence for a track until a tick fuses it
+        :param track_id: hashable id of the track
+        :param evidence: dict: the new evidence, keyed by evidence id
+        :param timestamp: float: the time the evidence was observed, now if None
+        :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+        """
+        if not evidence:
+            return
+        with self._lock:
+            now = self.clock()
+            if timestamp is None:
+                timestamp = now
+            if (track_id in self._released) and (timestamp < self._released[track_id]):
+                self.late_reports += len(evidence)
+            reports = self._pending.setdefault(track_id, [])
+            for evidence_key in evidence.keys():
+                heapq.heappush(reports, (timestamp, self._sequence, evidence[evidence_key], input_weight, now))
+                self._sequence += 1
+
+    def set_priority(self, track_id, priority):
+        """
+        :param priority: number: tracks with a higher priority are fused first, the default is 0
+        """
+        with self._lock:
+            self._priorities[track_id] = priority
+
+    def tick(self):
+        """
+        Fuses the tracks with evidence ready, in priority order, until the deadline
+        :return: dict: the number of tracks fused and deferred, the reports fused, the duration of the tick and
+         whether it missed its deadline
+        """
+        start = self.clock()
+        watermark = start - self.reorder_window
+        with self._lock:
+            ready = []
+            for track_id, reports in self._pending.items():
+                if reports and (reports[0][0] <= watermark):
+                    oldest = min(report[4] for report in reports)
+                    ready.append((-self._priorities.get(track_id, 0), oldest, track_id))
+        ready.sort(key=lambda entry: entry[:2])
+        fused_tracks = 0
+        fused_reports = 0
+        deferred = 0
+        for position, (_, _, track_id) in enumerate(ready):
+            if (position > 0) and (self.clock() - start >= self.deadline):
+                deferred = len(ready) - position
+                break
+            fused_reports += self._fuse_track(track_id, watermark)
+            fused_tracks += 1
+        duration = self.clock() - start
+        missed = (deferred > 0) or (duration > self.deadline)
+        with self._lock:
+            self.ticks += 1
+            self.deferred_tracks += deferred
+            if missed:
+                self.deadline_misses += 1
+            self.tick_latency.record(duration)
+        return {
+            "tracks": fused_tracks,
+            "reports": fused_reports,
+            "deferred": deferred,
+            "duration": duration,
+            "missed": missed
+        }
+
+    def run(self, number_of_ticks=None, stop=None, sleep=time.sleep):
+        """
+        Ticks every period.  A tick that ends after the start of the next period skips the periods it overran.
+        :param number_of_ticks: int: the number of ticks to run, None to run until stop is set
+        :param stop: threading.Event ending the loop, or None
+        :param sleep: function sleeping for a number of seconds
+        :return: int: the number of ticks run
+        """
+        ticks = 0
+        next_tick = self.clock()
+        while ((number_of_ticks is None) or (ticks < number_of_ticks)) and ((stop is None) or (not stop.is_set())):
+            self.tick()
+            ticks += 1
+            next_tick += self.period
+            now = self.clock()
+            if next_tick < now:
+                next_tick += self.period * (int((now - next_tick) / self.period) + 1)
+            if (number_of_ticks is None) or (ticks < number_of_ticks):
+                sleep(next_tick - now)
+        return ticks
+
+    def probabilities(self, track_id):
+        """
+        :return: dict: a copy of the probabilities of the track as of its last fusion, or None if the track was never
+         fused
+        """
+        with self._lock:
+            all_data = self._tracks.get(track_id)
+            if all_data is None:
+                return None
+            probabilities = import_and_calculate_probabilities(self.method, all_data)
+            if probabilities is None:
+                return None
+            return dict(probabilities)
+
+    def get(self, track_id):
+        """
+        :return: dict: the internal data of the track as of its last fusion, or None if the track was never fused.
+         Not a copy: the next fusion of the track may change it.
+        """
+        with self._lock:
+            return self._tracks.get(track_id)
+
+    def remove(self, track_id):
+        """
+        Removes a track, dropping its queued evidence
+        :return: dict: the internal data of the removed track, or None if it was never fused
+        """
+        with self._lock:
+            if self.notifier is not None:
+                self.notifier.forget(track_id)
+            self._pending.pop(track_id, None)
+            self._released.pop(track_id, None)
+            self._priorities.pop(track_id, None)
+            return self._tracks.pop(track_id, None)
+
+    def pending(self, track_id=None):
+        """
+        :param track_id: a track id, or None for all tracks
+        :return: int: the number of queued reports
+        """
+        with self._lock:
+            if track_id is not None:
+                return len(self._pending.get(track_id, []))
+            return sum(len(reports) for reports in self._pending.values())
+
+    def track_ids(self):
+        """
+        :return: list: the ids of all tracks, including those with only queued evidence
+        """
+        with self._lock:
+            return list(set(self._tracks.keys()) | set(track_id for track_id, reports in self._pending.items()
+                                                       if reports))
+
+    def __len__(self):
+        return len(self.track_ids())
+
+    def stats(self):
+        """
+        :return: dict: counts of ticks, deadline misses, deferred tracks, late and fused reports, and the tick and
+         report latency histograms
+        """
+        with self._lock:
+            return {
+                "ticks": self.ticks,
+                "deadline_misses": self.deadline_misses,
+                "deferred_tracks": self.deferred_tracks,
+                "late_reports": self.late_reports,
+                "fused_reports": self.fused_reports,
+                "tick_latency": self.tick_latency.as_dict(),
+                "report_latency": self.report_latency.as_dict()
+            }
+
+    def _fuse_track(self, track_id, watermark):
+        # Combines the evidence of a track up to the watermark, in timestamp order
+        change = None
+        with self._lock:
+            reports = self._pending.get(track_id)
+            released = []
+            while reports and (reports[0][0] <= watermark):
+                released.append(heapq.heappop(reports))
+            if not reports:
+                self._pending.pop(track_id, None)
+            if not released:
+                return 0
+            self._tracks[track_id] = combine_reports(self.method, [(masses, input_weight)
+                                                                   for _, _, masses, input_weight, _ in released],
+                                                     self._tracks.get(track_id), self.max_number_of_evidences)
+            self._released[track_id] = max(self._released.get(track_id, released[-1][0]), released[-1][0])
+            now = self.clock()
+            for report in released:
+                self.report_latency.record(now - report[4])
+            self.fused_reports += len(released)
+            if self.notifier is not None:
+                probabilities = self.probabilities(track_id)
+                if probabilities is not None:
+                    change = self.notifier.observe(track_id, probabilities)
+        if change is not None:
+            self.notifier.publish(track_id, change[0], change[1])
+        return len(released)
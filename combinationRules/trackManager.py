@@ -0,0 +1,327 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Per-track internal data held within a memory budget, for long runs where tracks keep appearing and going quiet.
+# The size of each track is measured with utilities.state_nbytes and summed into the resident bytes.  Measuring walks
+#  the whole state, which costs more than a Zhang combination, so a track is measured after 1, 2, 4, ... changes, at
+#  most accounting_interval apart.  In between, its size is extrapolated from its growth per change between the last
+#  two measurements: exact for states of a fixed size (Murphy, the pairwise methods, full windows) and for Zhang's
+#  linear growth.  An accounting_interval of 1 measures every change.
+# Tracks are kept in least recently used order (updates and reads are uses), so the idle ones are always at
+#  the front and each maintenance step only visits the tracks it acts on:
+#  ttl            - tracks unused for ttl seconds are evicted
+#  compact_after  - tracks unused for compact_after seconds are summarized (import_and_summarize): Zhang's stored
+#                   evidence collapses into a single run of its weighted average, with the same probabilities.  The
+#                   other methods keep no history to collapse (PCR6 needs all of it), so they are only evicted.
+#  memory_budget  - while the resident bytes are above the budget, the least recently used tracks are summarized,
+#                   then evicted.  The track being changed is never evicted by its own change.
+# Maintenance runs on every change; expire() runs it without one, e.g. from a timer while the input is quiet.
+
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from threading import RLock
+
+from combinationRules import COMBINATION_METHODS, import_and_windowed_combine, import_and_calculate_probabilities, \
+    import_and_summarize
+from combinationRules.utilities import state_nbytes
+
+# The methods whose data keeps a history that import_and_summarize collapses
+SUMMARIZED_METHODS = (COMBINATION_METHODS["MURPHY"], COMBINATION_METHODS["ZHANG"])
+DEFAULT_ACCOUNTING_INTERVAL = 64
+
+
+class TrackManager(object):
+    """
+    Owner of the per-track internal data of a combination method, bounded by idle time and memory
+    """
+    def __init__(self, method, max_number_of_evidences=None, memory_budget=None, ttl=None, compact_after=None,
+                 accounting_interval=DEFAULT_ACCOUNTING_INTERVAL, clock=time.monotonic, notifier=None):
+        """
+        :param method: str: the method in COMBINATION_METHODS
+        :param max_number_of_evidences: None if no window, > 1 if a window is defined
+        :param memory_budget: int: max resident bytes of the track data, None for no limit
+        :param ttl: float: seconds a track may go unused before it is evicted, None to keep idle tracks
+        :param compact_after: float: seconds a track may go unused before it is summarized, None to only summarize
+         over the budget
+        :param accounting_interval: int: max number of changes of a track between measurements of its size
+        :param clock: function returning the current time in seconds
+        :param notifier: ChangeNotifier told of the probabilities of every updated track, or None
+        """
+        if (memory_budget is not None) and (memory_budget <= 0):
+            raise ValueError("TrackManager: memory_budget must be positive")
+        if (ttl is not None) and (ttl <= 0.0):
+            raise ValueError("TrackManager: ttl must be positive")
+        if (compact_after is not None) and (compact_after < 0.0):
+            raise ValueError("TrackManager: compact_after can't be negative")
+        if accounting_interval < 1:
+            raise ValueError("TrackManager: accounting_interval must be at least 1")
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.memory_budget = memory_budget
+        self.ttl = ttl
+        self.compact_after = compact_after
+        self.accounting_interval = accounting_interval
+        self.clock = clock
+        self.notifier = notifier
+        self._lock = RLock()
+        # track id -> internal data, least recently used first
+        self._tracks = OrderedDict()
+        # The tracks changed since they were last summarized, in the same order
+        self._uncompacted = OrderedDict()
+        self._last_used = {}
+        self._nbytes = {}
+        # track id -> [bytes last measured, growth per change, changes since, changes until the next measurement]
+        self._accounting = {}
+        self.resident_bytes = 0
+        self.peak_resident_bytes = 0
+        self.ttl_evictions = 0
+        self.budget_evictions = 0
+        self.compactions = 0
+        self.compacted_bytes = 0
+
+    def update(self, track_id, evidence, input_weight=0.0):
+        """
+        Combines new evidence into a track and returns the resulting probabilities
+        :param track_id: hashable id of the track
+        :param evidence: dict: the new evidence, keyed by evidence id
+        :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+        :return: dict: a copy of the probabilities of the track after the update
+        """
+        change = None
+        with self._lock:
+            all_data = self._combine(track_id, evidence, input_weight, False)
+            probabilities = self._copy_probabilities(all_data)
+            if (self.notifier is not None) and (probabilities is not None):
+                change = self.notifier.observe(track_id, probabilities)
+        if change is not None:
+            self.notifier.publish(track_id, change[0], change[1])
+        return probabilities
+
+    def add(self, track_id, evidence, input_weight=0.0):
+        """
+        Combines new evidence into a track without reading it back, deferring the combination of methods that keep
+         evidence until the next read.  With a notifier this is the same as update().
+        """
+        if self.notifier is not None:
+            self.update(track_id, evidence, input_weight)
+            return
+        with self._lock:
+            self._combine(track_id, evidence, input_weight, True)
+
+    def probabilities(self, track_id):
+        """
+        :return: dict: a copy of the current probabilities of the track, or None if the track is unknown
+        """
+        with self._lock:
+            all_data = self._tracks.get(track_id)
+            if all_data is None:
+                return None
+            self._touch(track_id, self.clock())
+            return self._copy_probabilities(all_data)
+
+    def get(self, track_id):
+        """
+        :return: dict: a deep copy of the internal data of the track, or None if the track is unknown
+        """
+        with self._lock:
+            if track_id not in self._tracks:
+                return None
+            self._touch(track_id, self.clock())
+            return deepcopy(self._tracks[track_id])
+
+    def state_nbytes(self, track_id):
+        """
+        :return: int: the bytes accounted to the track, measured or extrapolated, 0 if the track is unknown
+        """
+        with self._lock:
+            return self._nbytes.get(track_id, 0)
+
+    def remove(self, track_id):
+        """
+        Removes a track.  Not counted as an eviction.
+        :return: dict: the internal data of the removed track, or None if the track is unknown
+        """
+        with self._lock:
+            if self.notifier is not None:
+                self.notifier.forget(track_id)
+            return self._drop(track_id)
+
+    def compact(self, track_id):
+        """
+        Summarizes a track now, whatever its idle time
+        :return: int: the bytes freed, 0 if the track is unknown or the method has no summary
+        """
+        with self._lock:
+            if (track_id not in self._tracks) or (self.method not in SUMMARIZED_METHODS):
+                return 0
+            return self._compact(track_id)
+
+    def expire(self, now=None):
+        """
+        Evicts the tracks past their ttl, summarizes the tracks idle for compact_after and enforces the budget
+        :param now: float: the current time, by default the clock
+        :return: dict: the number of tracks "evicted" and "compacted"
+        """
+        with self._lock:
+            return self._maintain(self.clock() if now is None else now)
+
+    def track_ids(self):
+        """
+        :return: list: the ids of all resident tracks, least recently used first
+        """
+        with self._lock:
+            return list(self._tracks.keys())
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __contains__(self, track_id):
+        return track_id in self._tracks
+
+    def stats(self):
+        """
+        :return: dict: the resident tracks and bytes, the peak and budget of the bytes, the evictions by cause, and the
+         number of summaries with the bytes they freed
+        """
+        with self._lock:
+            return {
+                "tracks": len(self._tracks),
+                "resident_bytes": self.resident_bytes,
+                "peak_resident_bytes": self.peak_resident_bytes,
+                "memory_budget": self.memory_budget,
+                "evictions": self.ttl_evictions + self.budget_evictions,
+                "ttl_evictions": self.ttl_evictions,
+                "budget_evictions": self.budget_evictions,
+                "compactions": self.compactions,
+                "compacted_bytes": self.compacted_bytes
+            }
+
+    def _combine(self, track_id, evidence, input_weight, lazy):
+        # Called with the lock held
+        now = self.clock()
+        all_data = import_and_windowed_combine(self.method, evidence, self.max_number_of_evidences,
+                                               self._tracks.get(track_id), input_weight, lazy=lazy)
+        self._tracks[track_id] = all_data
+        if self.method in SUMMARIZED_METHODS:
+            self._uncompacted[track_id] = None
+        self._touch(track_id, now)
+        self._account(track_id)
+        self._maintain(now, track_id)
+        return all_data
+
+    def _touch(self, track_id, now):
+        self._tracks.move_to_end(track_id)
+        if track_id in self._uncompacted:
+            self._uncompacted.move_to_end(track_id)
+        self._last_used[track_id] = now
+
+    def _account(self, track_id, measure=False):
+        record = self._accounting.get(track_id)
+        if record is None:
+            record = [None, 0.0, 0, 1]
+            self._accounting[track_id] = record
+        record[2] += 1
+        if measure or (record[2] >= record[3]):
+            nbytes = state_nbytes(self._tracks[track_id])
+            if measure:
+                # Summaries change the size of the state, not its growth per change
+                record[3] = 1
+            elif record[0] is not None:
+                record[1] = (nbytes - record[0]) / record[2]
+                record[3] = min(2 * record[3], self.accounting_interval)
+            else:
+                record[3] = min(2, self.accounting_interval)
+            record[0] = nbytes
+            record[2] = 0
+        else:
+            nbytes = max(int(record[0] + record[1] * record[2]), 0)
+        self.resident_bytes += nbytes - self._nbytes.get(track_id, 0)
+        self._nbytes[track_id] = nbytes
+        self.peak_resident_bytes = max(self.peak_resident_bytes, self.resident_bytes)
+
+    def _drop(self, track_id):
+        all_data = self._tracks.pop(track_id, None)
+        self._uncompacted.pop(track_id, None)
+        self._last_used.pop(track_id, None)
+        self._accounting.pop(track_id, None)
+        self.resident_bytes -= self._nbytes.pop(track_id, 0)
+        return all_data
+
+    def _evict(self, track_id):
+        if self.notifier is not None:
+            self.notifier.forget(track_id)
+        self._drop(track_id)
+
+    def _compact(self, track_id):
+        before = self._nbytes[track_id]
+        self._tracks[track_id] = import_and_summarize(self.method, self._tracks[track_id])
+        self._uncompacted.pop(track_id, None)
+        self._account(track_id, True)
+        self.compactions += 1
+        freed = max(before - self._nbytes[track_id], 0)
+        self.compacted_bytes += freed
+        return freed
+
+    def _maintain(self, now, keep=None):
+        # Called with the lock held.  keep is the track just changed, which is not evicted over the budget.
+        evicted = 0
+        compacted = 0
+        if self.ttl is not None:
+            while self._tracks:
+                track_id = next(iter(self._tracks))
+                if now - self._last_used[track_id] < self.ttl:
+                    break
+                self._evict(track_id)
+                self.ttl_evictions += 1
+                evicted += 1
+        if self.compact_after is not None:
+            while self._uncompacted:
+                track_id = next(iter(self._uncompacted))
+                if now - self._last_used[track_id] < self.compact_after:
+                    break
+                self._compact(track_id)
+                compacted += 1
+        if self.memory_budget is not None:
+            # Summarizing keeps the tracks, so it comes first.  The track just changed is the most recently used, so
+            #  once it is at the front it is the only one left.
+            while (self.resident_bytes > self.memory_budget) and self._uncompacted:
+                track_id = next(iter(self._uncompacted))
+                if track_id == keep:
+                    break
+                self._compact(track_id)
+                compacted += 1
+            while (self.resident_bytes > self.memory_budget) and self._tracks:
+                track_id = next(iter(self._tracks))
+                if track_id == keep:
+                    break
+                self._evict(track_id)
+                self.budget_evictions += 1
+                evicted += 1
+        return {
+            "evicted": evicted,
+            "compacted": compacted
+        }
+
+    def _copy_probabilities(self, all_data):
+        # Some methods return their internal dictionary, so copy before the lock is released
+        probabilities = import_and_calculate_probabilities(self.method, all_data)
+        if probabilities is None:
+            return None
+        return dict(probabilities)
@@ -0,0 +1,214 @@
+# --------------------------------------------------------------------------
+# Copyright 2020 Joel Dunham
+
+# This file is part of DSImplementation.
+
+# DSImplementation is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# DSImplementation is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
+# --------------------------------------------------------------------------
+
+# Per-track queue of pending evidence, folded into the track by one windowed combination instead of one per report.
+# Reports are queued in arrival order under fresh keys (so evidence ids may repeat across reports) with their
+#  weights, and a flush passes them all to import_and_windowed_combine, which combines a batch in the same order as
+#  the individual calls.  Murphy and Zhang then recombine once per burst rather than once per report.
+# With a window, a batch longer than the window is not windowed like the same reports one by one, so a flush makes one
+#  call per max_number_of_evidences pending reports.  Dempster's and Yager's pairwise combinations only keep mass on
+#  intersections that are keys, so combining a batch before the track data does not give the same masses as adding
+#  the reports one by one: their reports are still queued, but combined one per call.
+# A track is flushed when it is read, when max_pending reports are queued, or when its oldest pending report is
+#  older than max_delay seconds, checked on add() and by flush_expired() for callers that poll.
+
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from threading import RLock
+
+from combinationRules import import_and_windowed_combine, import_and_calculate_probabilities, COMBINATION_METHODS, \
+    ZERO_WEIGHT_DELTA
+
+DEFAULT_MAX_PENDING = 64
+DEFAULT_MAX_DELAY = 0.1
+# Methods whose combination of a batch is the same as combining its reports one by one
+BATCHED_METHODS = (COMBINATION_METHODS["MURPHY"], COMBINATION_METHODS["ZHANG"], COMBINATION_METHODS["PCR6"],
+                   COMBINATION_METHODS["DISJUNCTIVE"], COMBINATION_METHODS["OVERWRITE"])
+
+
+class UpdateBuffer(object):
+    """
+    Owner of the per-track internal data of a combination method that batches the evidence of each track
+    """
+    def __init__(self, method, max_number_of_evidences=None, max_pending=DEFAULT_MAX_PENDING,
+                 max_delay=DEFAULT_MAX_DELAY, clock=time.monotonic):
+        """
+        :param method: str: the method in COMBINATION_METHODS
+        :param max_number_of_evidences: None if no window, > 1 if a window is defined
+        :param max_pending: int: number of queued reports of a track that triggers its flush
+        :param max_delay: float: age in seconds of the oldest queued report of a track that triggers its flush, None
+         to only flush on reads and on max_pending
+        :param clock: function returning the current time in seconds
+        """
+        if max_pending < 1:
+            raise ValueError("UpdateBuffer: max_pending must be at least 1")
+        self.method = method
+        self.max_number_of_evidences = max_number_of_evidences
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.clock = clock
+        self._lock = RLock()
+        self._tracks = {}
+        # track id -> [time of the oldest report, list of (masses, weight)], oldest track first
+        self._pending = OrderedDict()
+
+    def add(self, track_id, evidence, input_weight=0.0):
+        """
+        Queues new evidence for a track, flushing the track if a threshold is reached
+        :param track_id: hashable id of the track
+        :param evidence: dict: the new evidence, keyed by evidence id
+        :param input_weight: float weight of the input data relative to the all_data weight - 0.0 for no weighting
+        """
+        if not evidence:
+            return
+        with self._lock:
+            now = self.clock()
+            if track_id not in self._pending:
+                self._pending[track_id] = [now, []]
+            queued_at, reports = self._pending[track_id]
+            for evidence_key in evidence.keys():
+                reports.append((evidence[evidence_key], input_weight))
+            if (len(reports) >= self.max_pending) or \
+                    ((self.max_delay is not None) and (now - queued_at >= self.max_delay)):
+                self._flush_track(track_id)
+
+    def update(self, track_id, evidence, input_weight=0.0):
+        """
+        Queues new evidence and returns the probabilities of the track with everything queued so far
+        :return: dict: a copy of the probabilities of the track after the update
+        """
+        with self._lock:
+            self.add(track_id, evidence, input_weight)
+            return self.probabilities(track_id)
+
+    def probabilities(self, track_id):
+        """
+        :return: dict: a copy of the current probabilities of the track, or None if the track is unknown
+        """
+        with self._lock:
+            self._flush_track(track_id)
+            all_data = self._tracks.get(track_id)
+            if all_data is None:
+                return None
+            probabilities = import_and_calculate_probabilities(self.method, all_data)
+            if probabilities is None:
+                return None
+            return dict(probabilities)
+
+    def get(self, track_id):
+        """
+        :return: dict: a deep copy of the internal data of the track with its queued evidence, or None if the track is
+         unknown
+        """
+        with self._lock:
+            self._flush_track(track_id)
+            return deepcopy(self._tracks.get(track_id))
+
+    def remove(self, track_id):
+        """
+        Removes a track, dropping its queued evidence
+        :return: dict: the internal data of the removed track without its queued evidence, or None if the track is
+         unknown
+        """
+        with self._lock:
+            self._pending.pop(track_id, None)
+            return self._tracks.pop(track_id, None)
+
+    def pending(self, track_id=None):
+        """
+        :param track_id: a track id, or None for all tracks
+        :return: int: the number of queued reports
+        """
+        with self._lock:
+            if track_id is not None:
+                return len(self._pending[track_id][1]) if track_id in self._pending else 0
+            return sum(len(reports) for _, reports in self._pending.values())
+
+    def flush(self, track_id=None):
+        """
+        Combines the queued evidence of a track, or of every track if track_id is None
+        """
+        with self._lock:
+            track_ids = [track_id] if track_id is not None else list(self._pending.keys())
+            for pending_id in track_ids:
+                self._flush_track(pending_id)
+
+    def flush_expired(self):
+        """
+        Combines the queued evidence of the tracks whose oldest queued report is at least max_delay seconds old
+        :return: int: the number of tracks flushed
+        """
+        if self.max_delay is None:
+            return 0
+        flushed = 0
+        with self._lock:
+            now = self.clock()
+            # Tracks are queued in order, so stop at the first one that is recent enough
+            for track_id, (queued_at, _) in list(self._pending.items()):
+                if now - queued_at < self.max_delay:
+                    break
+                self._flush_track(track_id)
+                flushed += 1
+        return flushed
+
+    def track_ids(self):
+        """
+        :return: list: the ids of all tracks, including those with only queued evidence
+        """
+        with self._lock:
+            return list(set(self._tracks.keys()) | set(self._pending.keys()))
+
+    def __len__(self):
+        return len(self.track_ids())
+
+    def _flush_track(self, track_id):
+        # Called with the lock held
+        if track_id not in self._pending:
+            return
+        _, reports = self._pending.pop(track_id)
+        self._tracks[track_id] = combine_reports(self.method, reports, self._tracks.get(track_id),
+                                                 self.max_number_of_evidences)
+
+
+def combine_reports(method, reports, all_data=None, max_number_of_evidences=None, lazy=True):
+    """
+    Combines queued reports into a track in as few windowed combinations as give the same result as one per report
+    :param method: str: the method in COMBINATION_METHODS
+    :param reports: list of (masses, input weight) in arrival order
+    :param all_data: the internal data of the track, or None
+    :param max_number_of_evidences: None if no window, > 1 if a window is defined
+    :param lazy: boolean whether to defer the combination until the probabilities are requested
+    :return: dict: the internal data of the track
+    """
+    batch_size = max(len(reports), 1)
+    if method not in BATCHED_METHODS:
+        batch_size = 1
+    elif (max_number_of_evidences is not None) and (max_number_of_evidences > 1):
+        batch_size = min(batch_size, max_number_of_evidences)
+    for start in range(0, len(reports), batch_size):
+        evidence = {}
+        weights = {}
+        for counter, (masses, input_weight) in enumerate(reports[start:start + batch_size]):
+            evidence[counter] = masses
+            if input_weight > ZERO_WEIGHT_DELTA:
+                weights[counter] = input_weight
+        all_data = import_and_windowed_combine(method, evidence, max_number_of_evidences, all_data,
+                                               weights=weights if weights else None, lazy=lazy)
+    return all_data
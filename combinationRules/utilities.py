@@ -17,6 +17,13 @@
 # along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
 # --------------------------------------------------------------------------
 
+from sys import getsizeof
+
+# Array typecodes of stored masses: float64, or float32 for half the memory and bandwidth.  Values are rounded to the
+#  storage precision when stored (a relative error of at most 2 ** -24 for float32) and read back as Python floats, so
+#  everything computed from them is accumulated in float64.
+MASS_TYPECODES = ("d", "f")
+
 
 # Any utility functions
 def the_keys(keys):
@@ -27,3 +34,157 @@ def the_keys(keys):
         else:
             res.append(k)
     return res
+
+
+def state_nbytes(all_data):
+    """
+    Approximate memory held by the internal data of a combination method, following containers and object
+     attributes.  Objects shared between parts of the data are only counted once.
+    :param all_data: the internal data of any method
+    :return: int: the number of bytes
+    """
+    return object_nbytes(all_data, set())
+
+
+def object_nbytes(value, seen):
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    size = getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += object_nbytes(key, seen) + object_nbytes(item, seen)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += object_nbytes(item, seen)
+    elif hasattr(value, "__dict__") and not isinstance(value, type):
+        size += object_nbytes(vars(value), seen)
+    return size
+
+
+def import_numpy():
+    """
+    Optional dependency: the array paths are only used when numpy is installed
+    :return: the numpy module, or None if it is not available
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def import_numba():
+    """
+    Optional dependency: the compiled kernels of jitKernels are only used when numba (and so numpy) is installed
+    :return: the numba module, or None if it is not available
+    """
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba
+
+
+def focal_key(key):
+    # The key convention of the combination methods: sorted tuples, single elements wrapped in a tuple
+    if isinstance(key, tuple) is True:
+        return tuple(sorted(key))
+    return (key,)
+
+
+def frame_of(mass_dicts):
+    """
+    :param mass_dicts: iterable of mass dicts
+    :return: list: the sorted singletons appearing in any focal element
+    """
+    elements = set()
+    for masses in mass_dicts:
+        for key in masses.keys():
+            elements.update(focal_key(key))
+    return sorted(elements)
+
+
+def to_bitmask(masses, frame_index, skip_zero=True):
+    """
+    :param masses: dict of focal element -> mass
+    :param frame_index: dict of singleton -> bit position
+    :param skip_zero: boolean whether to leave out focal elements with no mass
+    :return: dict of bitmask -> mass
+    """
+    result = {}
+    for key, mass in masses.items():
+        if skip_zero and (mass == 0.0):
+            continue
+        mask = 0
+        for element in focal_key(key):
+            mask |= 1 << frame_index[element]
+        result[mask] = result.get(mask, 0.0) + mass
+    return result
+
+
+def from_bitmask(mask, frame):
+    """
+    :param mask: int: the bitmask of a focal element
+    :param frame: list of singletons by bit position
+    :return: tuple: the focal element key
+    """
+    return tuple(element for position, element in enumerate(frame) if (mask >> position) & 1)
+
+
+def conjunctive_bitmask(masses_1, masses_2):
+    """
+    Unnormalized conjunctive combination of two bitmask mass dicts.  Conflict is kept on the empty set (mask 0).
+    """
+    result = {}
+    for mask_1, mass_1 in masses_1.items():
+        for mask_2, mass_2 in masses_2.items():
+            intersection = mask_1 & mask_2
+            result[intersection] = result.get(intersection, 0.0) + mass_1 * mass_2
+    return result
+
+
+def subset_zeta(values, frame_size):
+    """
+    In place transform of a dense list indexed by bitmask: values[A] becomes the sum of values[B] over all B contained
+     in A.  Turns masses into implicabilities in O(n 2^n).
+    """
+    for bit in range(0, frame_size):
+        step = 1 << bit
+        for mask in range(0, 1 << frame_size):
+            if mask & step:
+                values[mask] += values[mask ^ step]
+
+
+def subset_moebius(values, frame_size):
+    """
+    In place inverse of subset_zeta: turns implicabilities back into masses
+    """
+    for bit in range(0, frame_size):
+        step = 1 << bit
+        for mask in range(0, 1 << frame_size):
+            if mask & step:
+                values[mask] -= values[mask ^ step]
+
+
+def superset_zeta(values, frame_size):
+    """
+    In place transform of a dense list indexed by bitmask: values[A] becomes the sum of values[B] over all B that
+     contain A.  Turns masses into commonalities in O(n 2^n).
+    """
+    for bit in range(0, frame_size):
+        step = 1 << bit
+        for mask in range(0, 1 << frame_size):
+            if (mask & step) == 0:
+                values[mask] += values[mask | step]
+
+
+def superset_moebius(values, frame_size):
+    """
+    In place inverse of superset_zeta: turns commonalities back into masses
+    """
+    for bit in range(0, frame_size):
+        step = 1 << bit
+        for mask in range(0, 1 << frame_size):
+            if (mask & step) == 0:
+                values[mask] -= values[mask | step]
@@ -17,15 +17,25 @@
 # along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
 # --------------------------------------------------------------------------
 
-def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+from combinationRules import jitKernels
+
+
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None,
+                               invertible=False):
     """
     Windows the evidence.  Only allows the maximum amount (the latest evidences)
-    Note: has no effect on this function since the evidence is not retained
+    Note: has no effect on this function since the evidence is not retained, unless invertible
     :param evidence: dict of new evidence to add
     :param max_number_of_evidences: the max number of evidences to window
     :param all_data: the data to combine with
     :param weights: dict of weights associated with the new evidence
+    :param invertible: boolean whether to keep the evidence of the window in the invertible form of
+     invertibleWindow, so the oldest evidence is removed when the window is full.  The internal data is then no longer
+     the combined masses: use final_probabilities.
     """
+    if invertible or ((all_data is not None) and ("invertible" in all_data)):
+        from combinationRules.invertibleWindow import windowed_combination
+        return windowed_combination("YAGER", evidence, max_number_of_evidences, all_data)
     if (all_data is not None) and ("number_of_evidences" in all_data) and (max_number_of_evidences is not None) and\
             (max_number_of_evidences > 1):
         all_data["number_of_evidences"] = min(all_data["number_of_evidences"], max_number_of_evidences - len(evidence))
@@ -47,6 +57,9 @@ def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
 # explicitly provided, make sure it is in all available inputs
 def multi_combination(evidence, all_data=None, weights=None):
     # Weights do not affect Yager.  All inputs assumed to be of equal weight.
+    if (all_data is not None) and ("invertible" in all_data):
+        from combinationRules.invertibleWindow import windowed_combination
+        return windowed_combination("YAGER", evidence, None, all_data)
     # Create the return
     result = {}
 
@@ -86,15 +99,18 @@ def multi_combination(evidence, all_data=None, weights=None):
 def combination(dic1, dic2):
     # Extract the sets
     sets = set(dic1.keys()).union(set(dic2.keys()))
-    result = dict.fromkeys(sets, 0)
-
-    # Combination process
-    for i in dic1.keys():
-        for j in dic2.keys():
-            if set(i).intersection(set(j)) == set(i):
-                result[i] += dic1[i] * dic2[j]
-            elif set(i).intersection(set(j)) == set(j):
-                result[j] += dic1[i] * dic2[j]
+    # The compiled loop when numba is installed and the loop is large enough
+    result = jitKernels.yager_products(dic1, dic2, sets)
+    if result is None:
+        result = dict.fromkeys(sets, 0)
+
+        # Combination process
+        for i in dic1.keys():
+            for j in dic2.keys():
+                if set(i).intersection(set(j)) == set(i):
+                    result[i] += dic1[i] * dic2[j]
+                elif set(i).intersection(set(j)) == set(j):
+                    result[j] += dic1[i] * dic2[j]
 
     # Allocate the unallocated belief mass to the universal set (to the unknown)
     f = sum(list(result.values()))
@@ -117,6 +133,10 @@ def final_probabilities(all_data):
     """
     For a consistent interface with ECR
     :param all_data: The data of all information based on this combination method
-    :return: The dictionary of probabilities for all options.  Should be the same as all_data for this method
+    :return: The dictionary of probabilities for all options.  Should be the same as all_data for this method, except
+     for the invertible window
     """
+    if (all_data is not None) and ("invertible" in all_data):
+        from combinationRules.invertibleWindow import combined_masses
+        return combined_masses(all_data)
     return all_data
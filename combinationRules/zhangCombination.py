@@ -17,38 +17,136 @@
 # along with DSImplementation.  If not, see <https://www.gnu.org/licenses/>.
 # --------------------------------------------------------------------------
 
-from combinationRules.dsCombination import combination
-from combinationRules.utilities import the_keys
+from combinationRules import jitKernels
+from combinationRules.compactStore import CompactEvidenceStore
+from combinationRules.dsCombination import repeated_combination
+from combinationRules.utilities import the_keys, import_numpy
 from functools import reduce
 from math import sqrt
-from copy import deepcopy
 
 
-def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None):
+DECAY_CUTOFF = 1e-3
+# None: use numpy when it is installed and at least NUMPY_MIN_EVIDENCES are retained, True: always, False: never.
+#  True or False also rule out the compiled loops of jitKernels.
+USE_NUMPY = None
+NUMPY_MIN_EVIDENCES = 32
+PER_EVIDENCE_KEYS = ("evidence", "evidence_weights", "evidence_decay", "evidence_counts")
+
+
+def windowed_multi_combination(evidence, max_number_of_evidences=None, all_data=None, weights=None, lazy=False):
     """
     Windows the evidence.  Only allows the maximum amount (the latest evidences)
     :param evidence: dict of new evidence to add
     :param max_number_of_evidences: the max number of evidences to window
     :param all_data: the data to combine with
     :param weights: dict of weights associated with the new evidence
+    :param lazy: boolean whether to defer the combination until the probabilities are requested
     """
     if (all_data is not None) and ("number_of_evidences" in all_data) and (max_number_of_evidences is not None) and\
             (max_number_of_evidences > 1):
         # May need to limit the data
-        if (len(evidence) + all_data["number_of_evidences"]) > max_number_of_evidences:
+        if "evidence_counts" in all_data:
+            # Coalesced data windows the reports, not the stored runs
+            drop_reports(all_data, number_of_reports(all_data) + len(evidence) - max_number_of_evidences)
+        elif (len(evidence) + all_data["number_of_evidences"]) > max_number_of_evidences:
             # Need to limit the data
             num_to_retain = max_number_of_evidences - len(evidence)
-            reduce_by = all_data["number_of_evidences"] - num_to_retain
-            for counter in range(reduce_by, all_data["number_of_evidences"]):
-                all_data["evidence"][counter - reduce_by] = deepcopy(all_data["evidence"][counter])
-                all_data["evidence_weights"][counter - reduce_by] = all_data["evidence_weights"][counter]
-            all_data["number_of_evidences"] = num_to_retain
-            while len(all_data["evidence"]) > num_to_retain:
-                # Always pops the one just beyond the correct ones to keep to reduce the size.
-                all_data["evidence"].pop(num_to_retain, None)
+            drop_oldest(all_data, all_data["number_of_evidences"] - num_to_retain)
             # combined and last_evidence will be reset in the next call
     # Combine the evidence
-    return multi_combination(evidence, all_data, weights)
+    return multi_combination(evidence, all_data, weights, lazy)
+
+
+def decayed_multi_combination(evidence, decay_rate, all_data=None, weights=None, timestamp=None, lazy=False):
+    """
+    Combines with exponential forgetting instead of a window.  Each stored evidence carries a decay factor that
+     scales its support for the other evidences, its share of the weighted average and its count in the
+     self-combination.  Evidence whose factor falls below DECAY_CUTOFF is dropped, so at most
+     log(DECAY_CUTOFF) / log(decay_rate) evidences are retained on an infinite stream.
+    :param evidence: dict of new evidence to add
+    :param decay_rate: float in (0, 1]: factor applied to the old evidence per new evidence, or per unit of time if a
+     timestamp is given
+    :param all_data: the data to combine with
+    :param weights: dict of weights associated with the new evidence
+    :param timestamp: None for count-based decay, else the time of the new evidence for time-based decay
+    :param lazy: boolean whether to defer the combination until the probabilities are requested
+    """
+    if (decay_rate <= 0.0) or (decay_rate > 1.0):
+        raise ValueError("decayed_multi_combination: decay_rate must be in (0, 1]")
+    all_data = initialize_data(all_data)
+    if "evidence_decay" not in all_data:
+        all_data["evidence_decay"] = dict.fromkeys(all_data["evidence"].keys(), 1.0)
+    if timestamp is not None:
+        # Time-based: decay once for the time elapsed, evidence at the same time is not decayed against itself
+        if "last_timestamp" in all_data:
+            decay_evidence(all_data, pow(decay_rate, max(timestamp - all_data["last_timestamp"], 0.0)))
+        all_data["last_timestamp"] = timestamp
+    for evidence_key in evidence.keys():
+        if timestamp is None:
+            decay_evidence(all_data, decay_rate)
+        add_evidence(all_data, evidence[evidence_key], evidence_weight(weights, evidence_key))
+    update_combined(all_data, lazy)
+    return all_data
+
+
+def decay_evidence(all_data, factor):
+    for evidence_key in all_data["evidence_decay"].keys():
+        all_data["evidence_decay"][evidence_key] *= factor
+    # Decay is monotonic in age, so the forgotten evidences are always the oldest ones
+    reduce_by = 0
+    while (reduce_by < all_data["number_of_evidences"]) and \
+            (all_data["evidence_decay"][reduce_by] < DECAY_CUTOFF):
+        reduce_by += 1
+    drop_oldest(all_data, reduce_by)
+
+
+def drop_oldest(all_data, reduce_by):
+    """
+    Removes the oldest evidences, renumbering the remaining ones to start from zero
+    :param all_data: the data to limit
+    :param reduce_by: the number of evidences to remove
+    """
+    if reduce_by <= 0:
+        return
+    num_to_retain = all_data["number_of_evidences"] - reduce_by
+    for data_key in PER_EVIDENCE_KEYS:
+        if data_key in all_data:
+            for counter in range(reduce_by, all_data["number_of_evidences"]):
+                if isinstance(all_data[data_key], CompactEvidenceStore):
+                    # Moves the row as is rather than converting it through a dict
+                    all_data[data_key].move(counter, counter - reduce_by)
+                elif counter in all_data[data_key]:
+                    all_data[data_key][counter - reduce_by] = all_data[data_key][counter]
+            for counter in range(num_to_retain, all_data["number_of_evidences"]):
+                # Pops the ones just beyond the correct ones to keep to reduce the size.
+                all_data[data_key].pop(counter, None)
+    if isinstance(all_data["evidence"], CompactEvidenceStore):
+        # The focal elements only the dropped evidence had leave the index, as they leave dict storage
+        all_data["evidence"].trim()
+    all_data["number_of_evidences"] = num_to_retain
+
+
+def number_of_reports(all_data):
+    # Coalesced data stores runs of identical reports
+    if "evidence_counts" in all_data:
+        return sum(all_data["evidence_counts"].values())
+    return all_data["number_of_evidences"]
+
+
+def drop_reports(all_data, reports_to_drop):
+    """
+    Removes the oldest reports of coalesced data: whole runs, then part of the oldest remaining run
+    :param all_data: the data to limit
+    :param reports_to_drop: the number of reports to remove
+    """
+    counts = all_data["evidence_counts"]
+    reduce_by = 0
+    while (reduce_by < all_data["number_of_evidences"]) and (reports_to_drop >= counts[reduce_by]):
+        reports_to_drop -= counts[reduce_by]
+        reduce_by += 1
+    drop_oldest(all_data, reduce_by)
+    if (reports_to_drop > 0) and (all_data["number_of_evidences"] > 0):
+        counts[0] -= reports_to_drop
 
 
 def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
@@ -58,7 +156,82 @@ def dataset_combination(all_data_1, all_data_2, max_number_of_evidences=None):
 
 
 # Combine multiple inputs via Zhang's combination rule
-def multi_combination(evidence, all_data=None, weights=None):
+def multi_combination(evidence, all_data=None, weights=None, lazy=False):
+    all_data = initialize_data(all_data)
+
+    # First, add the evidence into the stored evidence, renumbering the evidence to keep the keys unique
+    for evidence_key in evidence.keys():
+        add_evidence(all_data, evidence[evidence_key], evidence_weight(weights, evidence_key))
+
+    update_combined(all_data, lazy)
+    return all_data
+
+
+def compact_data(all_data=None, typecode="d"):
+    """
+    Switches the data to array-backed evidence storage.  Every later update keeps using it, and the results are the
+     same as with the dict storage.
+    :param all_data: the data to convert, or None to start new data
+    :param typecode: str: "d" to store float64 masses, "f" for float32
+    :return: the converted data
+    """
+    all_data = initialize_data(all_data)
+    store = CompactEvidenceStore(typecode)
+    for evidence_key, masses in all_data["evidence"].items():
+        store[evidence_key] = masses
+    all_data["evidence"] = store
+    return all_data
+
+
+def coalesced_data(all_data=None):
+    """
+    Switches the data to run-length storage: a report identical to the previous one (same masses and weight) only
+     increments the count of the stored run.  Each run counts as its number of reports in the supports, the weighted
+     average and the self-combinations, so the results are the same as storing every report, while the state and the
+     cost of the credibility step scale with the number of distinct consecutive reports.  Windows still hold
+     max_number_of_evidences reports.  Not used with decay, which makes every report different.
+    :param all_data: the data to convert, or None to start new data
+    :return: the converted data
+    """
+    all_data = initialize_data(all_data)
+    if "evidence_counts" not in all_data:
+        all_data["evidence_counts"] = dict.fromkeys(all_data["evidence"].keys(), 1)
+    return all_data
+
+
+def summary_data(all_data):
+    """
+    Collapses the stored evidence into a single run: the credibility weighted average, counted as the number of reports
+     it stands for, with their average weight.  The combined result is unchanged, and the state no longer grows with
+     the history.  Later evidence is weighed against the history as if it had been that many identical reports of the
+     average, so their results are an approximation of keeping every report.  Windows drop the run report by report.
+     Decayed data is returned as is.
+    :param all_data: the data to collapse
+    :return: the collapsed data
+    """
+    all_data = initialize_data(all_data)
+    if ("evidence_decay" in all_data) or (all_data["number_of_evidences"] == 0):
+        return all_data
+    mae_dict, multiplicity = credibility_average(all_data)
+    total = sum(multiplicity.values())
+    count = max(int(round(total)), 1)
+    mass_weight = sum(all_data["evidence_weights"].get(i, 1.0) * multiplicity[i] for i in multiplicity.keys()) / total
+    if all_data.get("dirty") is True:
+        all_data["combined"] = repeated_combination(dict(mae_dict), mae_dict, count - 1)
+    summary = {
+        "evidence": {0: mae_dict},
+        "evidence_weights": {0: mass_weight},
+        "evidence_counts": {0: count},
+        "number_of_evidences": 1,
+        "combined": all_data["combined"],
+        "last_evidence": {}
+    }
+    if isinstance(all_data["evidence"], CompactEvidenceStore):
+        summary = compact_data(summary, all_data["evidence"].typecode)
+    return summary
+
+
+def initialize_data(all_data):
     # Create the return if necessary
     if all_data is None:
         all_data = {
@@ -83,36 +256,160 @@ def multi_combination(evidence, all_data=None, weights=None):
             all_data["combined"] = {}
         if "last_evidence" not in all_data:
             all_data["last_evidence"] = {}
+    return all_data
 
-    # First, add the evidence into the stored evidence, renumbering the evidence to keep the keys unique
-    for evidence_key in evidence.keys():
-        all_data["last_evidence"] = {}  # Reset
-        all_data["evidence"][all_data["number_of_evidences"]] = deepcopy(evidence[evidence_key])
-        for input_key in all_data["evidence"][all_data["number_of_evidences"]]:
-            # Convert any keys that aren't tuples to tuples
-            if isinstance(input_key, tuple) is False:
-                # Convert to a tuple
-                new_key = (input_key,)
-            else:
-                # Sort the tuple to make sure everything aligns properly
-                new_key = tuple(sorted(input_key))
-            store_value = all_data["evidence"][all_data["number_of_evidences"]][input_key]
-            all_data["evidence"][all_data["number_of_evidences"]].pop(input_key, None)
-            all_data["evidence"][all_data["number_of_evidences"]][new_key] = store_value
-            # Save for ease of access later
-            all_data["last_evidence"][new_key] = store_value
-        if (weights is not None) and (evidence_key in weights):
-            all_data["evidence_weights"][all_data["number_of_evidences"]] = weights[evidence_key]
+
+def evidence_weight(weights, evidence_key):
+    # Get the weight for this evidence
+    if (weights is not None) and (evidence_key in weights):
+        return weights[evidence_key]
+    return 1.0
+
+
+def add_evidence(all_data, masses, mass_weight):
+    all_data["last_evidence"] = {}  # Reset
+    stored = {}
+    for input_key, store_value in masses.items():
+        # Convert any keys that aren't tuples to tuples
+        if isinstance(input_key, tuple) is False:
+            # Convert to a tuple
+            new_key = (input_key,)
         else:
-            all_data["evidence_weights"][all_data["number_of_evidences"]] = 1.0
-        all_data["number_of_evidences"] += 1
+            # Sort the tuple to make sure everything aligns properly
+            new_key = tuple(sorted(input_key))
+        stored[new_key] = store_value
+        # Save for ease of access later
+        all_data["last_evidence"][new_key] = store_value
+    if extends_run(all_data, stored, mass_weight):
+        all_data["evidence_counts"][all_data["number_of_evidences"] - 1] += 1
+        return
+    all_data["evidence"][all_data["number_of_evidences"]] = stored
+    finish_evidence(all_data, mass_weight)
+
+
+def extends_run(all_data, stored, mass_weight):
+    """
+    :return: boolean whether coalesced data can count the evidence as one more report of the last stored run
+    """
+    if ("evidence_counts" not in all_data) or ("evidence_decay" in all_data) or \
+            (all_data["number_of_evidences"] == 0):
+        return False
+    last_key = all_data["number_of_evidences"] - 1
+    if all_data["evidence_weights"].get(last_key, 1.0) != mass_weight:
+        return False
+    last = all_data["evidence"][last_key]
+    if isinstance(all_data["evidence"], CompactEvidenceStore):
+        # Compared at the precision the evidence would be stored at
+        stored = all_data["evidence"].stored_masses(stored)
+    for key in set(last.keys()) | set(stored.keys()):
+        if last.get(key, 0.0) != stored.get(key, 0.0):
+            return False
+    return True
 
-    # Create required dictionaries
-    pignist_vector = {}
-    cos_dict = {}
-    sup_dict = {}
-    crd_dict = {}
-    mae_dict = {}
+
+def add_evidence_rows(all_data, focal_elements, rows, row_weights, max_number_of_evidences=None):
+    """
+    Same as windowing and adding each row with add_evidence, for rows of masses over a fixed list of focal elements.
+     Compact data stores the rows directly without building a dict per evidence.
+    :param all_data: the data to add to
+    :param focal_elements: list of the focal element keys, one per column of the rows
+    :param rows: list of rows of masses
+    :param row_weights: list of the weight of each row
+    :param max_number_of_evidences: the max number of evidences to window
+    """
+    if (max_number_of_evidences is not None) and (max_number_of_evidences > 1):
+        if len(rows) > max_number_of_evidences:
+            # Only the newest rows can remain in the window
+            rows = rows[-max_number_of_evidences:]
+            row_weights = row_weights[-max_number_of_evidences:]
+        if "evidence_counts" in all_data:
+            drop_reports(all_data, number_of_reports(all_data) + len(rows) - max_number_of_evidences)
+        else:
+            drop_oldest(all_data, all_data["number_of_evidences"] + len(rows) - max_number_of_evidences)
+    keys = []
+    for focal_element in focal_elements:
+        if isinstance(focal_element, tuple) is False:
+            keys.append((focal_element,))
+        else:
+            keys.append(tuple(sorted(focal_element)))
+
+    store = all_data["evidence"]
+    columns = None
+    if isinstance(store, CompactEvidenceStore):
+        columns = [store.column(key) for key in keys]
+        if columns == list(range(0, len(store.focal_elements))):
+            # The rows already are in the layout of the store
+            columns = None
+    for row, mass_weight in zip(rows, row_weights):
+        if ("evidence_counts" in all_data) and extends_run(all_data, dict(zip(keys, row)), mass_weight):
+            all_data["evidence_counts"][all_data["number_of_evidences"] - 1] += 1
+            continue
+        if not isinstance(store, CompactEvidenceStore):
+            store[all_data["number_of_evidences"]] = dict(zip(keys, row))
+        elif columns is None:
+            store.set_row(all_data["number_of_evidences"], row)
+        else:
+            store.set_row(all_data["number_of_evidences"], row, columns)
+        finish_evidence(all_data, mass_weight)
+    if rows:
+        all_data["last_evidence"] = dict(zip(keys, rows[-1]))
+
+
+def finish_evidence(all_data, mass_weight):
+    # Bookkeeping for the evidence just stored at the next index
+    all_data["evidence_weights"][all_data["number_of_evidences"]] = mass_weight
+    if "evidence_decay" in all_data:
+        all_data["evidence_decay"][all_data["number_of_evidences"]] = 1.0
+    if "evidence_counts" in all_data:
+        all_data["evidence_counts"][all_data["number_of_evidences"]] = 1
+    all_data["number_of_evidences"] += 1
+
+
+def evidence_multiplicity(all_data, evidence_key):
+    # How many evidences a stored evidence stands for - its run length, less than one once it has decayed
+    multiplicity = 1.0
+    if ("evidence_decay" in all_data) and (evidence_key in all_data["evidence_decay"]):
+        multiplicity = all_data["evidence_decay"][evidence_key]
+    if ("evidence_counts" in all_data) and (evidence_key in all_data["evidence_counts"]):
+        multiplicity *= all_data["evidence_counts"][evidence_key]
+    return multiplicity
+
+
+def update_combined(all_data, lazy=False):
+    """
+    Recombines the evidence, or only marks the combined result as stale if lazy
+    :param all_data: the data to update
+    :param lazy: boolean whether to defer the combination until final_probabilities is called
+    """
+    if lazy is True:
+        all_data["dirty"] = True
+    else:
+        combine_evidence(all_data)
+
+
+def combine_evidence(all_data):
+    mae_dict, multiplicity = credibility_average(all_data)
+
+    # Set up for the DS combination loop
+    second_input = {}
+    for input_key in mae_dict.keys():
+        all_data["combined"][input_key] = mae_dict[input_key]
+        second_input[input_key] = all_data["combined"][input_key]
+
+    # Combine with Dempster-Shafer using the reformed mass as the input for all sensors
+    number_of_combinations = max(int(round(sum(multiplicity.values()))), 1)
+    all_data["combined"] = repeated_combination(all_data["combined"], second_input, number_of_combinations - 1)
+    all_data.pop("dirty", None)
+
+
+def credibility_average(all_data):
+    """
+    :return: tuple of the credibility weighted average mass of each element of the powerset, and the dict of the
+     multiplicity of each stored evidence
+    """
+    multiplicity = {}
+    for i in all_data["evidence"].keys():
+        multiplicity[i] = evidence_multiplicity(all_data, i)
 
     # List the full set of inputs
     thetas = list(reduce(lambda a, b: a | set(the_keys(b.keys())), all_data["evidence"].values(), set()))
@@ -121,28 +418,68 @@ def multi_combination(evidence, all_data=None, weights=None):
     # remove the null set from the powerset
     powerset.remove(())
 
-    # Loop through the inputs
-    for sensor in all_data["evidence"].keys():
-        # Count through each sensor
-        pignist_vector[sensor] = []  # Create
+    pignist_vector = pignistic_vectors(all_data["evidence"], thetas, powerset)
+
+    # Unless USE_NUMPY forces a path, the compiled loops when numba is installed and the loop is large enough, else
+    #  numpy or pure Python
+    mae_dict = None
+    if USE_NUMPY is None:
+        mae_dict = jitKernels.zhang_weighted_average(all_data, pignist_vector, multiplicity, powerset)
+    if mae_dict is None:
+        numpy = None
+        if (USE_NUMPY is True) or ((USE_NUMPY is None) and (len(all_data["evidence"]) >= NUMPY_MIN_EVIDENCES)):
+            numpy = import_numpy()
+            if (numpy is None) and (USE_NUMPY is True):
+                raise ImportError("zhangCombination: USE_NUMPY is set but numpy is not installed")
+        if numpy is not None:
+            mae_dict = numpy_weighted_average(numpy, all_data, pignist_vector, multiplicity, powerset)
+        else:
+            mae_dict = weighted_average(all_data, pignist_vector, multiplicity, powerset)
+    return mae_dict, multiplicity
+
+
+def pignistic_vectors(evidence, thetas, powerset):
+    """
+    Creates the pignistic vector of each evidence.  Walks the focal elements of each evidence rather than the whole
+     powerset, so the cost depends on the number of focal elements instead of 2 ** len(thetas).
+    :param evidence: dict of stored evidence
+    :param thetas: list of the singletons, which fixes the order of the vector
+    :param powerset: list of the non-empty subsets of thetas
+    :return: dict of lists, one pignistic vector per evidence
+    """
+    in_powerset = set(powerset)
+    theta_index = {}
+    for index, single_input in enumerate(thetas):
+        theta_index[single_input] = index
+
+    pignist_vector = {}
+    for sensor in evidence.keys():
+        # Get null belief (open world case)
+        if "zero" in evidence[sensor]:
+            null_set = evidence[sensor]["zero"]
+        else:
+            null_set = 0.0
 
-        # Create the pignist vectors
         # n-dimension should be 3 (a, b, c)
-        for single_input in thetas:
-            value = 0.0
-            for set_input in powerset:
-                # Get null belief (open world case)
-                if "zero" in all_data["evidence"][sensor]:
-                    null_set = all_data["evidence"][sensor]["zero"]
-                else:
-                    null_set = 0.0
-
-                if (set_input in all_data["evidence"][sensor]) and \
-                        (single_input in set_input) and (all_data["evidence"][sensor][set_input] > 0.0):
-                    value += (1 / len(set_input)) * (all_data["evidence"][sensor][set_input] / (1 - null_set))
-                    # else: zero value - doesn't add in
-            # Append to the pignist vector
-            pignist_vector[sensor].append(value)
+        pignist_vector[sensor] = [0.0] * len(thetas)
+        for set_input, mass in evidence[sensor].items():
+            if (set_input in in_powerset) and (mass > 0.0):
+                share = (1 / len(set_input)) * (mass / (1 - null_set))
+                for single_input in set_input:
+                    pignist_vector[sensor][theta_index[single_input]] += share
+                # else: zero value - doesn't add in
+    return pignist_vector
+
+
+def weighted_average(all_data, pignist_vector, multiplicity, powerset):
+    """
+    Pure Python calculation of the credibility weighted average of the evidence
+    :return: dict: the weighted average mass of each element of the powerset
+    """
+    cos_dict = {}
+    sup_dict = {}
+    crd_dict = {}
+    mae_dict = {}
 
     # Calculate the conflict/angle between the evidences
     for i in all_data["evidence"].keys():
@@ -175,10 +512,10 @@ def multi_combination(evidence, all_data=None, weights=None):
         # Initialize
         sup_dict[i] = 0.0
         for j in all_data["evidence"].keys():
-            sup_dict[i] += cos_dict[i][j]
+            sup_dict[i] += cos_dict[i][j] * multiplicity[j]
 
         # Sum for sum_sup
-        sum_sup += sup_dict[i]
+        sum_sup += sup_dict[i] * multiplicity[i]
 
     # Normalize
     for i in all_data["evidence"].keys():
@@ -194,25 +531,62 @@ def multi_combination(evidence, all_data=None, weights=None):
                 input_weight = 1.0
                 if i in all_data["evidence_weights"]:
                     input_weight = all_data["evidence_weights"][i]
-                add_mass = crd_dict[i] * all_data["evidence"][i][input_name] * input_weight
+                add_mass = crd_dict[i] * all_data["evidence"][i][input_name] * input_weight * multiplicity[i]
                 mae_dict[input_name] += add_mass
                 mae_dict_sum += add_mass
                 # else: effectively a zero
     # Normalize for weighting
     for input_name in powerset:
         mae_dict[input_name] /= mae_dict_sum
+    return mae_dict
 
-    # Set up for the DS combination loop
-    second_input = {}
-    for input_key in mae_dict.keys():
-        all_data["combined"][input_key] = mae_dict[input_key]
-        second_input[input_key] = all_data["combined"][input_key]
 
-    # Combine with Dempster-Shafer using the reformed mass as the input for all sensors
-    for sensor in range(2, len(all_data["evidence"].keys()) + 1):
-        all_data["combined"] = combination(all_data["combined"], second_input)
+def numpy_weighted_average(numpy, all_data, pignist_vector, multiplicity, powerset):
+    """
+    Same calculation as weighted_average on stacked arrays: the cosines are one normalized matrix product, the
+     supports and credibilities are matrix-vector products and the weighted average is a single vector-matrix
+     product over the focal elements that are actually present.
+    :return: dict: the weighted average mass of each element of the powerset
+    """
+    evidence_keys = list(all_data["evidence"].keys())
+    vectors = numpy.array([pignist_vector[i] for i in evidence_keys], dtype=numpy.float64)
+    unit_vectors = vectors / numpy.linalg.norm(vectors, axis=1)[:, None]
+    cos_matrix = unit_vectors @ unit_vectors.T
+    # Cos of the same keys is always 1 (along the diagonal)
+    numpy.fill_diagonal(cos_matrix, 1.0)
 
-    return all_data
+    counts = numpy.array([multiplicity[i] for i in evidence_keys], dtype=numpy.float64)
+    sup = cos_matrix @ counts
+    crd = sup / (sup @ counts)
+    input_weights = numpy.array([all_data["evidence_weights"].get(i, 1.0) for i in evidence_keys],
+                                dtype=numpy.float64)
+
+    # Only the focal elements present in some evidence can have a non-zero average
+    in_powerset = set(powerset)
+    columns = {}
+    if isinstance(all_data["evidence"], CompactEvidenceStore):
+        # The rows already are the mass matrix
+        masses = all_data["evidence"].as_matrix(numpy, evidence_keys)
+        for input_name, column in all_data["evidence"].focal_index.items():
+            if input_name in in_powerset:
+                columns[input_name] = column
+    else:
+        for i in evidence_keys:
+            for input_name in all_data["evidence"][i].keys():
+                if (input_name in in_powerset) and (input_name not in columns):
+                    columns[input_name] = len(columns)
+        masses = numpy.zeros((len(evidence_keys), len(columns)), dtype=numpy.float64)
+        for row, i in enumerate(evidence_keys):
+            for input_name, mass in all_data["evidence"][i].items():
+                if input_name in columns:
+                    masses[row, columns[input_name]] = mass
+
+    mae = (crd * input_weights * counts) @ masses
+    mae /= mae.sum()
+    mae_dict = dict.fromkeys(powerset, 0.0)
+    for input_name, column in columns.items():
+        mae_dict[input_name] = float(mae[column])
+    return mae_dict
 
 
 def final_probabilities(all_data):
@@ -221,6 +595,9 @@ def final_probabilities(all_data):
     :param all_data: The data of all information based on this combination method
     :return: The dictionary of probabilities for all options.
     """
+    if (all_data is not None) and (all_data.get("dirty") is True):
+        # Lazy updates deferred the combination until now
+        combine_evidence(all_data)
     if (all_data is not None) and ("combined" in all_data):
         return all_data["combined"]
     else: